@@ -207,6 +207,128 @@ MASSCAN_RATE = os.getenv('MASSCAN_RATE', 7500)
 # Ancillary job processing batch size
 ANCILLARY_BATCH_SIZE = int(os.getenv('ANCILLARY_BATCH_SIZE', '5'))
 
+# Banner grabbing (asyncio probe engine)
+BANNER_GRAB_TIMEOUT = float(os.getenv('BANNER_GRAB_TIMEOUT', '3'))
+BANNER_GRAB_CONCURRENCY = int(os.getenv('BANNER_GRAB_CONCURRENCY', '1000'))
+# Fall back to a per-port nmap -sV run for ports without a known probe
+BANNER_NMAP_FALLBACK = os.getenv('BANNER_NMAP_FALLBACK', 'False') == 'True'
+# Batched nmap service detection (run_nmap_banner_batch)
+NMAP_BATCH_SIZE = int(os.getenv('NMAP_BATCH_SIZE', '500'))
+NMAP_BATCH_HOST_TIMEOUT = int(os.getenv('NMAP_BATCH_HOST_TIMEOUT', '30'))
+# nmap-service-probes file used for in-process banner classification
+NMAP_SERVICE_PROBES_PATH = os.getenv('NMAP_SERVICE_PROBES_PATH', '/usr/share/nmap/nmap-service-probes')
+
+# Banner analyzer signature database (JSON, hot-reloaded when its version changes; empty = bundled file)
+SERVICE_SIGNATURES_PATH = os.getenv('SERVICE_SIGNATURES_PATH', '')
+SERVICE_SIGNATURES_RELOAD_INTERVAL = int(os.getenv('SERVICE_SIGNATURES_RELOAD_INTERVAL', '60'))
+
+# Offline geolocation (GeoLite2/DB-IP .mmdb, memory-mapped; install updates with an atomic rename)
+GEOLOCATION_MMDB_PATH = os.getenv('GEOLOCATION_MMDB_PATH', '')
+GEOLOCATION_MMDB_ASN_PATH = os.getenv('GEOLOCATION_MMDB_ASN_PATH', '')
+GEOLOCATION_MMDB_CHECK_INTERVAL = int(os.getenv('GEOLOCATION_MMDB_CHECK_INTERVAL', '60'))
+
+# In-process geolocation cache keyed by network (provider-reported, else these prefix lengths)
+GEOLOCATION_RANGE_CACHE_TTL = int(os.getenv('GEOLOCATION_RANGE_CACHE_TTL', '86400'))
+GEOLOCATION_RANGE_CACHE_SIZE = int(os.getenv('GEOLOCATION_RANGE_CACHE_SIZE', '100000'))
+GEOLOCATION_RANGE_PREFIX_V4 = int(os.getenv('GEOLOCATION_RANGE_PREFIX_V4', '24'))
+GEOLOCATION_RANGE_PREFIX_V6 = int(os.getenv('GEOLOCATION_RANGE_PREFIX_V6', '48'))
+
+# Remote geolocation provider quotas (requests per minute; ip-api.com is re-synced from its X-Rl/X-Ttl headers)
+GEOLOCATION_PROVIDER_RATE_LIMITS = {
+    'ip-api.com': float(os.getenv('GEOLOCATION_RATE_IPAPI', '45')),
+    'ip-api.com/batch': float(os.getenv('GEOLOCATION_RATE_IPAPI_BATCH', '15')),
+    'ipinfo.io': float(os.getenv('GEOLOCATION_RATE_IPINFO', '60')),
+    'freeipapi.com': float(os.getenv('GEOLOCATION_RATE_FREEIPAPI', '60')),
+    'ipgeolocation.io': float(os.getenv('GEOLOCATION_RATE_IPGEOLOCATION', '1')),
+}
+# Provider endpoint overrides, e.g. a self-hosted ip-api mirror (empty = public endpoint)
+GEOLOCATION_PROVIDER_URLS = {
+    'ip-api.com': os.getenv('GEOLOCATION_URL_IPAPI', ''),
+    'ipinfo.io': os.getenv('GEOLOCATION_URL_IPINFO', ''),
+    'freeipapi.com': os.getenv('GEOLOCATION_URL_FREEIPAPI', ''),
+    'ipgeolocation.io': os.getenv('GEOLOCATION_URL_IPGEOLOCATION', ''),
+}
+# Seconds a lookup waits for quota before falling through to the next provider
+GEOLOCATION_RATE_LIMIT_MAX_WAIT = float(os.getenv('GEOLOCATION_RATE_LIMIT_MAX_WAIT', '60'))
+# Seconds concurrent lookups are collected before a part-full batch request is sent
+GEOLOCATION_BATCH_LINGER = float(os.getenv('GEOLOCATION_BATCH_LINGER', '0.05'))
+# Geolocation provider circuit breakers; lookups try providers by recent success rate and median latency
+GEOLOCATION_BREAKER_FAILURES = int(os.getenv('GEOLOCATION_BREAKER_FAILURES', '5'))
+GEOLOCATION_BREAKER_RECOVERY = float(os.getenv('GEOLOCATION_BREAKER_RECOVERY', '60'))
+GEOLOCATION_HEALTH_WINDOW = int(os.getenv('GEOLOCATION_HEALTH_WINDOW', '50'))
+# Pooled keep-alive HTTP client used for provider calls (aiohttp)
+GEOLOCATION_HTTP_POOL_SIZE = int(os.getenv('GEOLOCATION_HTTP_POOL_SIZE', '100'))
+GEOLOCATION_HTTP_POOL_PER_HOST = int(os.getenv('GEOLOCATION_HTTP_POOL_PER_HOST', '10'))
+GEOLOCATION_HTTP_TIMEOUT = float(os.getenv('GEOLOCATION_HTTP_TIMEOUT', '10'))
+GEOLOCATION_HTTP_KEEPALIVE = float(os.getenv('GEOLOCATION_HTTP_KEEPALIVE', '30'))
+
+# Content-addressed banner storage: keep zstd-compressed raw response bytes next to the normalized text
+BANNER_STORE_RAW = os.getenv('BANNER_STORE_RAW', 'True') == 'True'
+BANNER_STORE_ZSTD_LEVEL = int(os.getenv('BANNER_STORE_ZSTD_LEVEL', '3'))
+
+# SSL certificate grabbing (asyncio TLS handshakes)
+SSL_CERT_CONNECT_TIMEOUT = float(os.getenv('SSL_CERT_CONNECT_TIMEOUT', '3'))
+SSL_CERT_HANDSHAKE_TIMEOUT = float(os.getenv('SSL_CERT_HANDSHAKE_TIMEOUT', '5'))
+SSL_CERT_CONCURRENCY = int(os.getenv('SSL_CERT_CONCURRENCY', '500'))
+# Combined TLS endpoint probe (certificate + session + HTTP on one handshake) for HTTPS banner grabs
+TLS_ENDPOINT_PROBE = os.getenv('TLS_ENDPOINT_PROBE', 'True') == 'True'
+TLS_ENDPOINT_CONCURRENCY = int(os.getenv('TLS_ENDPOINT_CONCURRENCY', '500'))
+# Parsed certificate cache keyed by DER SHA-256 (optionally shared through Redis)
+CERT_CACHE_SIZE = int(os.getenv('CERT_CACHE_SIZE', '5000'))
+CERT_CACHE_REDIS = os.getenv('CERT_CACHE_REDIS', 'False') == 'True'
+CERT_CACHE_REDIS_TTL = int(os.getenv('CERT_CACHE_REDIS_TTL', '86400'))
+
+# Probe freshness: seconds a completed probe suppresses re-queueing the same endpoint (0 = never skip)
+PROBE_FRESHNESS_TTLS = {
+    'banner_grab': int(os.getenv('PROBE_FRESHNESS_TTL_BANNER_GRAB', str(7 * 86400))),
+    'ssl_cert': int(os.getenv('PROBE_FRESHNESS_TTL_SSL_CERT', str(7 * 86400))),
+    'domain_enum': int(os.getenv('PROBE_FRESHNESS_TTL_DOMAIN_ENUM', str(7 * 86400))),
+    'geolocation': int(os.getenv('PROBE_FRESHNESS_TTL_GEOLOCATION', str(30 * 86400))),
+    'dns_relay': int(os.getenv('PROBE_FRESHNESS_TTL_DNS_RELAY', str(86400))),
+}
+
+# Async DNS client (empty DNS_RESOLVERS = nameservers from /etc/resolv.conf)
+DNS_RESOLVERS = [r.strip() for r in os.getenv('DNS_RESOLVERS', '').split(',') if r.strip()]
+DNS_TIMEOUT = float(os.getenv('DNS_TIMEOUT', '2'))
+DNS_RETRIES = int(os.getenv('DNS_RETRIES', '2'))
+DNS_SOCKETS = int(os.getenv('DNS_SOCKETS', '4'))
+DNS_MAX_INFLIGHT = int(os.getenv('DNS_MAX_INFLIGHT', '2000'))
+DNS_CACHE_SIZE = int(os.getenv('DNS_CACHE_SIZE', '100000'))
+DNS_NEGATIVE_TTL = int(os.getenv('DNS_NEGATIVE_TTL', '300'))
+DNS_MAX_TTL = int(os.getenv('DNS_MAX_TTL', '86400'))
+# Open DNS relay detection (recursive query for DNS_RELAY_TEST_DOMAIN)
+DNS_RELAY_TEST_DOMAIN = os.getenv('DNS_RELAY_TEST_DOMAIN', 'google.com')
+DNS_RELAY_TIMEOUT = float(os.getenv('DNS_RELAY_TIMEOUT', '2'))
+DNS_RELAY_RETRIES = int(os.getenv('DNS_RELAY_RETRIES', '1'))
+DNS_RELAY_CONCURRENCY = int(os.getenv('DNS_RELAY_CONCURRENCY', '2000'))
+
+# Proxy liveness checks (tunnel to PROXY_CHECK_TARGET and expect PROXY_CHECK_EXPECT back)
+PROXY_CHECK_TARGET = os.getenv('PROXY_CHECK_TARGET', 'example.com:80')
+PROXY_CHECK_EXPECT = os.getenv('PROXY_CHECK_EXPECT', 'HTTP/')
+PROXY_CHECK_TIMEOUT = float(os.getenv('PROXY_CHECK_TIMEOUT', '5'))
+PROXY_CHECK_CONCURRENCY = int(os.getenv('PROXY_CHECK_CONCURRENCY', '1000'))
+# Consecutive failures before a proxy is marked dead / disabled
+PROXY_DEAD_AFTER_FAILURES = int(os.getenv('PROXY_DEAD_AFTER_FAILURES', '3'))
+PROXY_DISABLE_AFTER_FAILURES = int(os.getenv('PROXY_DISABLE_AFTER_FAILURES', '20'))
+# Route banner/TLS/HTTP probe connections through the Proxy table (proxy_pool)
+PROBE_USE_PROXY_POOL = os.getenv('PROBE_USE_PROXY_POOL', 'False') == 'True'
+PROXY_POOL_MAX_PER_PROXY = int(os.getenv('PROXY_POOL_MAX_PER_PROXY', '50'))
+PROXY_POOL_REFRESH_INTERVAL = int(os.getenv('PROXY_POOL_REFRESH_INTERVAL', '300'))
+PROXY_POOL_FAILURE_THRESHOLD = int(os.getenv('PROXY_POOL_FAILURE_THRESHOLD', '5'))
+PROXY_POOL_RECOVERY_TIMEOUT = int(os.getenv('PROXY_POOL_RECOVERY_TIMEOUT', '60'))
+PROXY_POOL_ACQUIRE_TIMEOUT = float(os.getenv('PROXY_POOL_ACQUIRE_TIMEOUT', '10'))
+
+# HTTP fingerprinting (title, headers, redirects, favicon hash)
+HTTP_FINGERPRINT_TIMEOUT = float(os.getenv('HTTP_FINGERPRINT_TIMEOUT', '5'))
+HTTP_FINGERPRINT_CONCURRENCY = int(os.getenv('HTTP_FINGERPRINT_CONCURRENCY', '500'))
+HTTP_FINGERPRINT_MAX_BODY = int(os.getenv('HTTP_FINGERPRINT_MAX_BODY', '65536'))
+
+# UDP service probing (per-port payloads over shared datagram sockets)
+UDP_PROBE_TIMEOUT = float(os.getenv('UDP_PROBE_TIMEOUT', '1.5'))
+UDP_PROBE_RETRIES = int(os.getenv('UDP_PROBE_RETRIES', '2'))
+UDP_PROBE_SOCKETS = int(os.getenv('UDP_PROBE_SOCKETS', '4'))
+UDP_PROBE_CONCURRENCY = int(os.getenv('UDP_PROBE_CONCURRENCY', '2000'))
+
 # Admin Interface Configuration
 # Remove the jet configuration since we're not using it
 # JET_DEFAULT_THEME = 'light-gray'
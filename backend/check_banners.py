@@ -9,10 +9,11 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fauxdan.settings')
 django.setup()
 
 from internet.models import Port, AncillaryJob
+from internet.lib.banner_store import ports_with_banners
 
 print("=== BANNER GRAB STATISTICS ===")
 print(f"Total ports: {Port.objects.count()}")
-print(f"Ports with banners: {Port.objects.exclude(banner__isnull=True).exclude(banner='').count()}")
+print(f"Ports with banners: {ports_with_banners().count()}")
 
 print("\n=== ANCILLARY JOB STATUS ===")
 print(f"Banner grab jobs - Pending: {AncillaryJob.objects.filter(job_type='banner_grab', status='pending').count()}")
@@ -36,10 +37,10 @@ print("\n=== PORTS FOR 34.210.241.32 ===")
 from internet.models import Host
 host = Host.objects.filter(ip='34.210.241.32').first()
 if host:
-    ports = Port.objects.filter(host=host)
+    ports = Port.objects.filter(host=host).select_related('banner_ref')
     print(f"Found {ports.count()} ports for 34.210.241.32:")
     for port in ports:
-        banner = port.banner or 'No banner'
+        banner = port.banner_text or 'No banner'
         print(f"  {port.port_number}/{port.proto} - Banner: '{banner}'")
 else:
     print("Host 34.210.241.32 not found in database")
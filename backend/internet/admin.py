@@ -80,7 +80,7 @@ class HostAdmin(ImportExportModelAdmin):
 class PortResource(resources.ModelResource):
     class Meta:
         model = Port
-        fields = ('id', 'port_number', 'proto', 'status', 'last_seen', 'banner', 'scan', 'host')
+        fields = ('id', 'port_number', 'proto', 'status', 'last_seen', 'banner', 'banner_ref', 'scan', 'host')
         export_order = fields
 
 @admin.register(Port)
@@ -88,14 +88,16 @@ class PortAdmin(ImportExportModelAdmin):
     resource_class = PortResource
     list_display = ('port_number', 'proto', 'status', 'host', 'scan', 'last_seen', 'get_banner_preview', 'get_ssl_info')
     list_filter = ('status', 'proto', 'port_number', 'last_seen', 'scan__scan_type')
-    search_fields = ('port_number', 'host__ip', 'banner')
+    search_fields = ('port_number', 'host__ip', 'banner_ref__text', 'banner')
     readonly_fields = ('id', 'last_seen')
+    raw_id_fields = ('banner_ref',)
     list_per_page = 100
     
     def get_banner_preview(self, obj):
-        if obj.banner:
-            preview = obj.banner[:50] + "..." if len(obj.banner) > 50 else obj.banner
-            return format_html('<span title="{}">{}</span>', obj.banner, preview)
+        banner = obj.banner_text
+        if banner:
+            preview = banner[:50] + "..." if len(banner) > 50 else banner
+            return format_html('<span title="{}">{}</span>', banner, preview)
         return "-"
     get_banner_preview.short_description = "Banner"
     
@@ -107,7 +109,7 @@ class PortAdmin(ImportExportModelAdmin):
     get_ssl_info.short_description = "SSL"
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('host', 'scan').prefetch_related('ssl_certificates')
+        return super().get_queryset(request).select_related('host', 'scan', 'banner_ref').prefetch_related('ssl_certificates')
 
 class ProxyResource(resources.ModelResource):
     class Meta:
@@ -118,10 +120,10 @@ class ProxyResource(resources.ModelResource):
 @admin.register(Proxy)
 class ProxyAdmin(ImportExportModelAdmin):
     resource_class = ProxyResource
-    list_display = ('proxy_type', 'host_name', 'port_number', 'username', 'enabled', 'dead', 'get_status')
+    list_display = ('proxy_type', 'host_name', 'port_number', 'username', 'enabled', 'dead', 'get_status', 'latency_ms', 'last_checked')
     list_filter = ('proxy_type', 'enabled', 'dead')
     search_fields = ('host_name', 'username')
-    readonly_fields = ('id',)
+    readonly_fields = ('id', 'latency_ms', 'last_checked', 'fail_count')
     list_per_page = 50
     
     def get_status(self, obj):
@@ -0,0 +1,372 @@
+"""
+Asyncio DNS client with query multiplexing and TTL caching
+"""
+import asyncio
+import itertools
+import logging
+import random
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+# Optional DNS imports - handle gracefully if not available
+try:
+    import dns.exception
+    import dns.flags
+    import dns.message
+    import dns.rcode
+    import dns.rdatatype
+    import dns.resolver
+    import dns.reversename
+    DNS_AVAILABLE = True
+except ImportError:
+    DNS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+Server = Tuple[str, int]
+
+
+def parse_server(value) -> Server:
+    """Parse '8.8.8.8', '127.0.0.1:5353', '[::1]:53' or a (host, port) tuple"""
+    if isinstance(value, (tuple, list)):
+        return str(value[0]), int(value[1])
+    value = value.strip()
+    if value.startswith('['):
+        host, _, port = value[1:].partition(']')
+        return host, int(port.lstrip(':') or 53)
+    if value.count(':') == 1:
+        host, port = value.split(':')
+        return host, int(port)
+    return value, 53
+
+
+class DNSCache:
+    """Bounded LRU of answers that honours record TTLs, including negative answers"""
+
+    def __init__(self, max_entries: int = 100000, max_ttl: int = 86400):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries: 'OrderedDict[tuple, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[List[str]]:
+        """Return cached answers ([] for a cached negative answer) or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, answers = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return answers
+
+    def put(self, key: tuple, answers: List[str], ttl: int) -> None:
+        """Store answers for ttl seconds (capped at max_ttl)"""
+        ttl = min(int(ttl), self.max_ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, answers)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _DNSClientProtocol(asyncio.DatagramProtocol):
+    """One UDP socket; replies are routed to waiting queries by message ID"""
+
+    def __init__(self):
+        self.transport = None
+        self.pending: Dict[int, Tuple[Server, asyncio.Future]] = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < 2:
+            return
+        query_id = int.from_bytes(data[:2], 'big')
+        waiter = self.pending.get(query_id)
+        if waiter is None:
+            return
+        server, future = waiter
+        # Ignore spoofed or late replies from anyone but the queried server
+        if (addr[0], addr[1]) != server or future.done():
+            return
+        future.set_result(data)
+
+    def error_received(self, exc):
+        logger.debug(f"DNS socket error: {exc}")
+
+    def connection_lost(self, exc):
+        for _, future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc or ConnectionError('DNS socket closed'))
+
+
+class AsyncDNSResolver:
+    """Resolve many names concurrently over a small pool of UDP sockets"""
+
+    def __init__(self, resolvers: List = None, timeout: float = None, retries: int = None,
+                 sockets: int = None, max_inflight: int = None, cache: DNSCache = None):
+        configured = resolvers if resolvers is not None else getattr(settings, 'DNS_RESOLVERS', [])
+        if not configured and DNS_AVAILABLE:
+            # Fall back to the system resolvers from /etc/resolv.conf
+            try:
+                configured = dns.resolver.Resolver().nameservers
+            except Exception:
+                configured = []
+        self.resolvers: List[Server] = [parse_server(server) for server in configured]
+        self.timeout = timeout or getattr(settings, 'DNS_TIMEOUT', 2)
+        self.retries = retries if retries is not None else getattr(settings, 'DNS_RETRIES', 2)
+        self.socket_count = sockets or getattr(settings, 'DNS_SOCKETS', 4)
+        self.max_inflight = max_inflight or getattr(settings, 'DNS_MAX_INFLIGHT', 2000)
+        self.negative_ttl = getattr(settings, 'DNS_NEGATIVE_TTL', 300)
+        self.cache = cache if cache is not None else DNSCache(
+            max_entries=getattr(settings, 'DNS_CACHE_SIZE', 100000),
+            max_ttl=getattr(settings, 'DNS_MAX_TTL', 86400),
+        )
+        # Sockets, semaphore and in-flight lookups belong to one event loop
+        self._loop = None
+        self._endpoints: Dict[int, List[_DNSClientProtocol]] = {}
+        self._endpoint_cycle: Dict[int, itertools.cycle] = {}
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self._semaphore = None
+        self._endpoint_lock = None
+
+    async def resolve(self, qname: str, rdtype: str = 'A') -> List[str]:
+        """
+        Resolve a name, using the cache and sharing concurrent identical lookups
+
+        Args:
+            qname: Name to look up
+            rdtype: Record type (A, AAAA, PTR, TXT, ...)
+
+        Returns:
+            List of answers as text (trailing dots removed), empty if none
+        """
+        if not DNS_AVAILABLE or not self.resolvers:
+            return []
+
+        key = (qname.lower().rstrip('.'), rdtype.upper())
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        self._bind_loop()
+        shared = self._inflight.get(key)
+        if shared is not None:
+            return await asyncio.shield(shared)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        answers: List[str] = []
+        try:
+            answers = await self._resolve_uncached(key)
+        except Exception as e:
+            logger.debug(f"DNS lookup failed for {qname} {rdtype}: {e}")
+        finally:
+            self._inflight.pop(key, None)
+            if not future.done():
+                future.set_result(answers)
+        return answers
+
+    async def resolve_ptr(self, ip: str) -> List[str]:
+        """
+        Reverse-resolve an IP address with a single PTR query
+
+        Args:
+            ip: IPv4 or IPv6 address
+
+        Returns:
+            List of PTR hostnames
+        """
+        if not DNS_AVAILABLE:
+            return []
+        try:
+            reverse_name = dns.reversename.from_address(ip).to_text()
+        except (dns.exception.SyntaxError, ValueError):
+            return []
+        return await self.resolve(reverse_name, 'PTR')
+
+    async def resolve_ptr_batch(self, ips: List[str]) -> Dict[str, List[str]]:
+        """
+        Reverse-resolve many IP addresses concurrently
+
+        Args:
+            ips: IP addresses
+
+        Returns:
+            Dictionary mapping IP to its PTR hostnames (only IPs with answers)
+        """
+        answers = await asyncio.gather(*(self.resolve_ptr(ip) for ip in ips))
+        return {ip: names for ip, names in zip(ips, answers) if names}
+
+    async def query(self, server: Server, qname: str, rdtype: str = 'A',
+                    recursion_desired: bool = True, timeout: float = None) -> Optional['dns.message.Message']:
+        """
+        Send one query to one server and wait for its reply (no cache, no retries)
+
+        Args:
+            server: (host, port) of the DNS server
+            qname: Name to query
+            rdtype: Record type
+            recursion_desired: Set the RD flag
+            timeout: Seconds to wait for the reply
+
+        Returns:
+            Parsed response message or None on timeout/invalid reply
+        """
+        if not DNS_AVAILABLE:
+            return None
+
+        self._bind_loop()
+        server = parse_server(server)
+        request = dns.message.make_query(qname, rdtype)
+        if not recursion_desired:
+            request.flags &= ~dns.flags.RD
+
+        async with self._semaphore:
+            protocol = await self._next_endpoint(server)
+            query_id = self._allocate_id(protocol)
+            request.id = query_id
+            future = asyncio.get_running_loop().create_future()
+            protocol.pending[query_id] = (server, future)
+            try:
+                protocol.transport.sendto(request.to_wire(), server)
+                wire = await asyncio.wait_for(future, timeout=timeout or self.timeout)
+            except (asyncio.TimeoutError, OSError) as e:
+                logger.debug(f"DNS query {qname} {rdtype} to {server[0]}:{server[1]} failed: {e!r}")
+                return None
+            finally:
+                protocol.pending.pop(query_id, None)
+
+        try:
+            response = dns.message.from_wire(wire)
+        except dns.exception.DNSException as e:
+            logger.debug(f"Malformed DNS reply from {server[0]}:{server[1]}: {e}")
+            return None
+        if not request.is_response(response):
+            return None
+        return response
+
+    async def _resolve_uncached(self, key: tuple) -> List[str]:
+        """Query the configured resolvers in turn and cache the outcome"""
+        qname, rdtype = key
+        servers = list(self.resolvers)
+        random.shuffle(servers)
+
+        for attempt in range(self.retries + 1):
+            server = servers[attempt % len(servers)]
+            response = await self.query(server, qname, rdtype)
+            if response is None:
+                continue
+
+            rcode = response.rcode()
+            if rcode == dns.rcode.NOERROR:
+                answers, ttl = self._extract_answers(response, rdtype)
+                if answers:
+                    self.cache.put(key, answers, ttl)
+                    return answers
+                self.cache.put(key, [], self._negative_ttl(response))
+                return []
+            if rcode == dns.rcode.NXDOMAIN:
+                self.cache.put(key, [], self._negative_ttl(response))
+                return []
+            # SERVFAIL/REFUSED: try another resolver
+            logger.debug(f"{server[0]} answered {dns.rcode.to_text(rcode)} for {qname} {rdtype}")
+
+        return []
+
+    @staticmethod
+    def _extract_answers(response: 'dns.message.Message', rdtype: str) -> Tuple[List[str], int]:
+        """Collect answers of the requested type and their smallest TTL"""
+        wanted = dns.rdatatype.from_text(rdtype)
+        answers: List[str] = []
+        ttl = None
+        for rrset in response.answer:
+            if rrset.rdtype != wanted:
+                continue
+            ttl = rrset.ttl if ttl is None else min(ttl, rrset.ttl)
+            for rdata in rrset:
+                answers.append(rdata.to_text().rstrip('.'))
+        return answers, ttl or 0
+
+    def _negative_ttl(self, response: 'dns.message.Message') -> int:
+        """Negative-cache TTL from the SOA in the authority section (RFC 2308)"""
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return min(rrset.ttl, rrset[0].minimum)
+        return self.negative_ttl
+
+    def _bind_loop(self) -> None:
+        """Reset per-loop state when called from a new event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self.close()
+        self._loop = loop
+        self._semaphore = asyncio.Semaphore(self.max_inflight)
+        self._endpoint_lock = asyncio.Lock()
+
+    async def _next_endpoint(self, server: Server) -> _DNSClientProtocol:
+        """Round-robin over this address family's sockets, creating them on first use"""
+        family = socket.AF_INET6 if ':' in server[0] else socket.AF_INET
+        if family not in self._endpoints:
+            async with self._endpoint_lock:
+                if family not in self._endpoints:
+                    loop = asyncio.get_running_loop()
+                    local = ('::', 0) if family == socket.AF_INET6 else ('0.0.0.0', 0)
+                    endpoints = []
+                    for _ in range(self.socket_count):
+                        _, protocol = await loop.create_datagram_endpoint(
+                            _DNSClientProtocol, local_addr=local, family=family,
+                        )
+                        endpoints.append(protocol)
+                    self._endpoints[family] = endpoints
+                    self._endpoint_cycle[family] = itertools.cycle(endpoints)
+        return next(self._endpoint_cycle[family])
+
+    @staticmethod
+    def _allocate_id(protocol: _DNSClientProtocol) -> int:
+        """Random query ID not already in flight on this socket"""
+        while True:
+            query_id = random.getrandbits(16)
+            if query_id not in protocol.pending:
+                return query_id
+
+    def close(self) -> None:
+        """Close the UDP sockets"""
+        for endpoints in self._endpoints.values():
+            for protocol in endpoints:
+                try:
+                    protocol.transport.abort()
+                except Exception:
+                    # The owning loop may already be closed
+                    pass
+        self._endpoints = {}
+        self._endpoint_cycle = {}
+        self._inflight = {}
+        self._loop = None
+
+
+# Global async DNS resolver instance
+_dns_resolver = None
+
+def get_dns_resolver() -> AsyncDNSResolver:
+    """Get the global async DNS resolver instance"""
+    global _dns_resolver
+    if _dns_resolver is None:
+        _dns_resolver = AsyncDNSResolver()
+    return _dns_resolver
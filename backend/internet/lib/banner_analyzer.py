@@ -1,15 +1,33 @@
 """
 Banner analysis service for intelligent service detection and job queuing
 """
-import re
+import json
 import logging
-from typing import Dict, List, Optional, Set
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Set, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
+from django.conf import settings
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
 
+# Versioned signature database shipped with the app
+DEFAULT_SIGNATURES_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'signatures', 'service_signatures.json'
+)
+
+
 class ServiceType(Enum):
     """Enumeration of detected service types"""
     HTTP = "http"
@@ -28,6 +46,7 @@ class ServiceType(Enum):
     POP3 = "pop3"
     RDP = "rdp"
     VNC = "vnc"
+    PROXY = "proxy"
     UNKNOWN = "unknown"
 
 
@@ -38,117 +57,171 @@ class ServiceDetection:
     confidence: float  # 0.0 to 1.0
     version: Optional[str] = None
     additional_info: Dict[str, str] = None
+    signature_version: Optional[int] = None
+    product: Optional[str] = None
     
     def __post_init__(self):
         if self.additional_info is None:
             self.additional_info = {}
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize for storage in job result data"""
+        return {
+            'service_type': self.service_type.value,
+            'product': self.product,
+            'confidence': self.confidence,
+            'version': self.version,
+            'additional_info': self.additional_info,
+            'signature_version': self.signature_version,
+        }
+
+
+@dataclass(frozen=True)
+class CompiledSignature:
+    """A service pattern compiled once, with the literals that must appear for it to match"""
+    service_type: ServiceType
+    regex: Pattern
+    confidence: float
+    literals: Optional[Tuple[str, ...]] = None
+    product: Optional[str] = None
+
+
+# Characters that stand for themselves when backslash-escaped
+_ESCAPED_LITERALS = set('.^$*+?{}[]()|\\/-')
+
+
+def _required_literals(pattern: str) -> Optional[Tuple[str, ...]]:
+    """
+    Lowercase literals of which every match of pattern must contain at least one
+
+    Understands the shapes used by the signatures (literal runs with escapes,
+    classes, groups, quantifiers and one top-level group of plain alternatives).
+    Returns None when no literal can be derived safely; such patterns always run.
+    """
+    body = pattern[4:] if pattern.startswith('(?i)') else pattern
+    alternatives = re.fullmatch(r'\(([^\\.^$*+?{}\[\]()|]+(?:\|[^\\.^$*+?{}\[\]()|]+)+)\)', body)
+    if alternatives:
+        return tuple(alternative.lower() for alternative in alternatives.group(1).split('|'))
+
+    runs = []
+    run = ''
+    depth = 0
+    i = 0
+    while i < len(body):
+        char = body[i]
+        i += 1
+        if char == '\\':
+            escaped = body[i:i + 1]
+            i += 1
+            if depth == 0 and escaped and escaped in _ESCAPED_LITERALS:
+                run += escaped
+                continue
+        elif char == '[':
+            end = body.find(']', i + 1)
+            if end == -1:
+                return None
+            i = end + 1
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|':
+            if depth == 0:
+                return None
+        elif char in '*?{':
+            # The preceding atom is optional
+            run = run[:-1]
+            if char == '{':
+                end = body.find('}', i)
+                if end == -1:
+                    return None
+                i = end + 1
+        elif char not in '.^$+' and depth == 0:
+            run += char
+            continue
+        runs.append(run)
+        run = ''
+    runs.append(run)
+
+    longest = max(runs, key=len)
+    return (longest.lower(),) if longest else None
 
 
 class BannerAnalyzer:
     """Analyzes banners to detect services and determine appropriate follow-up actions"""
     
-    def __init__(self):
-        self.service_patterns = self._build_service_patterns()
-        self.ssl_indicators = self._build_ssl_indicators()
-        self.web_indicators = self._build_web_indicators()
-    
-    def _build_service_patterns(self) -> Dict[ServiceType, List[Dict]]:
-        """Build regex patterns for service detection"""
-        return {
-            ServiceType.HTTP: [
-                {'pattern': r'(?i)(apache|httpd)', 'confidence': 0.9},
-                {'pattern': r'(?i)nginx', 'confidence': 0.9},
-                {'pattern': r'(?i)iis', 'confidence': 0.9},
-                {'pattern': r'(?i)lighttpd', 'confidence': 0.8},
-                {'pattern': r'(?i)caddy', 'confidence': 0.8},
-                {'pattern': r'(?i)http/1\.[01]', 'confidence': 0.7},
-                {'pattern': r'(?i)server:\s*([^\r\n]+)', 'confidence': 0.6},
-            ],
-            ServiceType.HTTPS: [
-                {'pattern': r'(?i)https', 'confidence': 0.8},
-                {'pattern': r'(?i)ssl', 'confidence': 0.7},
-                {'pattern': r'(?i)tls', 'confidence': 0.7},
-                {'pattern': r'(?i)secure', 'confidence': 0.6},
-            ],
-            ServiceType.SSH: [
-                {'pattern': r'(?i)ssh-2\.0', 'confidence': 0.95},
-                {'pattern': r'(?i)openssh', 'confidence': 0.9},
-                {'pattern': r'(?i)dropbear', 'confidence': 0.8},
-                {'pattern': r'(?i)libssh', 'confidence': 0.7},
-            ],
-            ServiceType.FTP: [
-                {'pattern': r'(?i)vsftpd', 'confidence': 0.9},
-                {'pattern': r'(?i)proftpd', 'confidence': 0.8},
-                {'pattern': r'(?i)pure-ftpd', 'confidence': 0.8},
-                {'pattern': r'(?i)220.*ftp', 'confidence': 0.7},
-            ],
-            ServiceType.SMTP: [
-                {'pattern': r'(?i)postfix', 'confidence': 0.9},
-                {'pattern': r'(?i)sendmail', 'confidence': 0.8},
-                {'pattern': r'(?i)exim', 'confidence': 0.8},
-                {'pattern': r'(?i)220.*smtp', 'confidence': 0.7},
-                {'pattern': r'(?i)esmtp', 'confidence': 0.7},
-            ],
-            ServiceType.DNS: [
-                {'pattern': r'(?i)bind', 'confidence': 0.9},
-                {'pattern': r'(?i)dnsmasq', 'confidence': 0.8},
-                {'pattern': r'(?i)powerdns', 'confidence': 0.8},
-                {'pattern': r'(?i)53.*dns', 'confidence': 0.6},
-            ],
-            ServiceType.MYSQL: [
-                {'pattern': r'(?i)mysql', 'confidence': 0.9},
-                {'pattern': r'(?i)mariadb', 'confidence': 0.9},
-                {'pattern': r'(?i)percona', 'confidence': 0.8},
-            ],
-            ServiceType.POSTGRESQL: [
-                {'pattern': r'(?i)postgresql', 'confidence': 0.9},
-                {'pattern': r'(?i)postgres', 'confidence': 0.8},
-            ],
-            ServiceType.REDIS: [
-                {'pattern': r'(?i)redis', 'confidence': 0.9},
-            ],
-            ServiceType.MONGODB: [
-                {'pattern': r'(?i)mongodb', 'confidence': 0.9},
-                {'pattern': r'(?i)mongo', 'confidence': 0.8},
-            ],
-            ServiceType.MSSQL: [
-                {'pattern': r'(?i)mssql', 'confidence': 0.9},
-                {'pattern': r'(?i)sql server', 'confidence': 0.8},
-            ],
-            ServiceType.TELNET: [
-                {'pattern': r'(?i)telnet', 'confidence': 0.8},
-            ],
-            ServiceType.IMAP: [
-                {'pattern': r'(?i)imap', 'confidence': 0.8},
-                {'pattern': r'(?i)dovecot', 'confidence': 0.9},
-            ],
-            ServiceType.POP3: [
-                {'pattern': r'(?i)pop3', 'confidence': 0.8},
-            ],
-            ServiceType.RDP: [
-                {'pattern': r'(?i)rdp', 'confidence': 0.8},
-                {'pattern': r'(?i)terminal services', 'confidence': 0.7},
-            ],
-            ServiceType.VNC: [
-                {'pattern': r'(?i)vnc', 'confidence': 0.8},
-                {'pattern': r'(?i)tightvnc', 'confidence': 0.9},
-                {'pattern': r'(?i)tigervnc', 'confidence': 0.9},
-            ],
+    def __init__(self, signatures: Dict[str, Any] = None, path: str = None,
+                 use_ahocorasick: bool = None):
+        """
+        Args:
+            signatures: Parsed signature database (default: read from path)
+            path: Signature JSON file (default: SERVICE_SIGNATURES_PATH)
+            use_ahocorasick: Prefilter with an Aho-Corasick automaton (default: when installed)
+        """
+        if signatures is None:
+            signatures = load_signatures(path)
+        self.use_ahocorasick = AHOCORASICK_AVAILABLE if use_ahocorasick is None else use_ahocorasick
+        self.signature_version = signatures['version']
+        self.service_patterns = self._service_types(signatures.get('services', {}))
+        # Indicators are matched against the lowercased banner
+        self.ssl_indicators = [indicator.lower() for indicator in signatures.get('ssl_indicators', [])]
+        self.web_indicators = [indicator.lower() for indicator in signatures.get('web_indicators', [])]
+        self.version_patterns = self._service_types(signatures.get('version_patterns', {}))
+        self.port_adjustments = {
+            service_type: {int(port): float(adjustment) for port, adjustment in adjustments.items()}
+            for service_type, adjustments in self._service_types(signatures.get('port_adjustments', {})).items()
         }
+        self._compile()
     
-    def _build_ssl_indicators(self) -> List[str]:
-        """Build list of SSL/TLS indicators"""
-        return [
-            'ssl', 'tls', 'https', 'starttls', 'ssl/tls', 'tls/ssl',
-            'secure', 'encrypted', 'certificate', 'x509'
-        ]
+    @staticmethod
+    def _service_types(section: Dict[str, Any]) -> Dict[ServiceType, Any]:
+        """Key a signature file section by ServiceType, skipping names this code does not know"""
+        keyed = {}
+        for name, value in section.items():
+            try:
+                keyed[ServiceType(name)] = value
+            except ValueError:
+                logger.warning(f"Ignoring signatures for unknown service type {name!r}")
+        return keyed
     
-    def _build_web_indicators(self) -> List[str]:
-        """Build list of web service indicators"""
-        return [
-            'http', 'https', 'www', 'web', 'server', 'apache', 'nginx',
-            'iis', 'lighttpd', 'caddy', 'tomcat', 'jetty'
-        ]
+    def _compile(self) -> None:
+        """Compile every pattern once and index signatures by their required literals"""
+        self._signatures: List[CompiledSignature] = []
+        for service_type, patterns in self.service_patterns.items():
+            for pattern_info in patterns:
+                self._signatures.append(CompiledSignature(
+                    service_type=service_type,
+                    regex=re.compile(pattern_info['pattern']),
+                    confidence=pattern_info['confidence'],
+                    literals=_required_literals(pattern_info['pattern']),
+                    product=pattern_info.get('product'),
+                ))
+        
+        # Signatures without a usable literal are tried on every banner
+        self._unfiltered = [i for i, sig in enumerate(self._signatures) if not sig.literals]
+        self._literal_index: Dict[str, List[int]] = {}
+        for i, signature in enumerate(self._signatures):
+            for literal in signature.literals or ():
+                self._literal_index.setdefault(literal, []).append(i)
+        
+        # Indicators ride along in the same literal scan
+        self._web_indicator_set = set(self.web_indicators)
+        self._ssl_indicator_set = set(self.ssl_indicators)
+        self._literals = sorted(set(self._literal_index) | self._web_indicator_set | self._ssl_indicator_set)
+        
+        self._automaton = None
+        if self.use_ahocorasick and AHOCORASICK_AVAILABLE:
+            self._automaton = ahocorasick.Automaton()
+            for literal in self._literals:
+                self._automaton.add_word(literal, literal)
+            self._automaton.make_automaton()
+        
+        self._version_patterns = {
+            service_type: [re.compile(pattern) for pattern in patterns]
+            for service_type, patterns in self.version_patterns.items()
+        }
+        self._server_header = re.compile(r'(?i)server:\s*([^\r\n]+)')
+        self._ssh_software = re.compile(r'(?i)ssh-([0-9.]+)-([^\s]+)')
     
     def analyze_banner(self, banner: str, port_number: int) -> List[ServiceDetection]:
         """
@@ -162,95 +235,115 @@ class BannerAnalyzer:
             List of ServiceDetection objects
         """
         if not banner or not banner.strip():
-            return [ServiceDetection(ServiceType.UNKNOWN, 0.0)]
+            return [ServiceDetection(ServiceType.UNKNOWN, 0.0, signature_version=self.signature_version)]
         
         banner_lower = banner.lower()
+        hits = self._literal_hits(banner_lower)
         detections = []
+        # Version and extra info depend only on the service type, not the pattern
+        extracted: Dict[ServiceType, Tuple[Optional[str], Dict[str, str]]] = {}
         
-        # Check each service type
-        for service_type, patterns in self.service_patterns.items():
-            for pattern_info in patterns:
-                pattern = pattern_info['pattern']
-                base_confidence = pattern_info['confidence']
-                
-                match = re.search(pattern, banner_lower)
-                if match:
-                    # Calculate confidence based on pattern match and context
-                    confidence = self._calculate_confidence(
-                        base_confidence, banner_lower, port_number, service_type
-                    )
-                    
-                    # Extract version if possible
-                    version = self._extract_version(banner_lower, service_type)
-                    
-                    # Extract additional info
-                    additional_info = self._extract_additional_info(banner_lower, service_type)
-                    
-                    detections.append(ServiceDetection(
-                        service_type=service_type,
-                        confidence=confidence,
-                        version=version,
-                        additional_info=additional_info
-                    ))
+        # Only signatures whose literals occur (or that have none) reach the regex engine.
+        # Case-insensitive regexes also fold some non-ASCII letters, so those banners skip the prefilter
+        candidates = self._candidates(hits) if banner_lower.isascii() else self._signatures
+        for signature in candidates:
+            if not signature.regex.search(banner_lower):
+                continue
+            service_type = signature.service_type
+            
+            # Calculate confidence based on pattern match and context
+            confidence = self._calculate_confidence(
+                signature.confidence, banner_lower, port_number, service_type, hits
+            )
+            
+            if service_type not in extracted:
+                extracted[service_type] = (
+                    self._extract_version(banner_lower, service_type),
+                    self._extract_additional_info(banner_lower, service_type),
+                )
+            version, additional_info = extracted[service_type]
+            
+            detections.append(ServiceDetection(
+                service_type=service_type,
+                confidence=confidence,
+                version=version,
+                additional_info=dict(additional_info),
+                signature_version=self.signature_version,
+                product=signature.product,
+            ))
         
         # If no specific service detected, check for generic indicators
         if not detections:
-            if any(indicator in banner_lower for indicator in self.ssl_indicators):
-                detections.append(ServiceDetection(ServiceType.HTTPS, 0.5))
-            elif any(indicator in banner_lower for indicator in self.web_indicators):
-                detections.append(ServiceDetection(ServiceType.HTTP, 0.5))
+            if hits & self._ssl_indicator_set:
+                detections.append(ServiceDetection(ServiceType.HTTPS, 0.5, signature_version=self.signature_version))
+            elif hits & self._web_indicator_set:
+                detections.append(ServiceDetection(ServiceType.HTTP, 0.5, signature_version=self.signature_version))
             else:
-                detections.append(ServiceDetection(ServiceType.UNKNOWN, 0.0))
+                detections.append(ServiceDetection(ServiceType.UNKNOWN, 0.0, signature_version=self.signature_version))
         
         # Special handling for HTTPS: if we detect HTTP on port 443, it's likely HTTPS
         if port_number == 443 and any(d.service_type == ServiceType.HTTP for d in detections):
             # Add HTTPS detection with high confidence
-            detections.append(ServiceDetection(ServiceType.HTTPS, 0.9))
+            detections.append(ServiceDetection(ServiceType.HTTPS, 0.9, signature_version=self.signature_version))
         
         # Sort by confidence (highest first)
         detections.sort(key=lambda x: x.confidence, reverse=True)
         
         return detections
     
+    def analyze_banners(self, banners: Iterable[Tuple[str, int]]) -> List[List[ServiceDetection]]:
+        """
+        Analyze many banners, evaluating each distinct (banner, port) pair once
+        
+        Args:
+            banners: (banner, port_number) pairs
+            
+        Returns:
+            Detections for each input pair, in input order
+        """
+        seen: Dict[Tuple[str, int], List[ServiceDetection]] = {}
+        results = []
+        for banner, port_number in banners:
+            key = (banner, port_number)
+            if key not in seen:
+                seen[key] = self.analyze_banner(banner, port_number)
+            results.append(list(seen[key]))
+        return results
+    
+    def _literal_hits(self, banner: str) -> Set[str]:
+        """Signature literals and indicators present in a lowercased banner, found in one pass"""
+        if self._automaton is not None:
+            return {literal for _, literal in self._automaton.iter(banner)}
+        return {literal for literal in self._literals if literal in banner}
+    
+    def _candidates(self, hits: Set[str]) -> List[CompiledSignature]:
+        """Signatures that can match given the literal hits, in declaration order"""
+        indexes = set(self._unfiltered)
+        for literal in hits:
+            indexes.update(self._literal_index.get(literal, ()))
+        return [self._signatures[i] for i in sorted(indexes)]
+    
     def _calculate_confidence(self, base_confidence: float, banner: str, 
-                            port_number: int, service_type: ServiceType) -> float:
+                            port_number: int, service_type: ServiceType,
+                            hits: Set[str] = None) -> float:
         """Calculate confidence score based on context"""
         confidence = base_confidence
+        if hits is None:
+            hits = self._literal_hits(banner)
         
         # Port-based adjustments (but not assumptions)
-        port_adjustments = {
-            ServiceType.HTTP: {80: 0.1, 8080: 0.1, 8000: 0.1},
-            ServiceType.HTTPS: {443: 0.1, 8443: 0.1, 9443: 0.1},
-            ServiceType.SSH: {22: 0.1},
-            ServiceType.FTP: {21: 0.1},
-            ServiceType.SMTP: {25: 0.1, 587: 0.1, 465: 0.1},
-            ServiceType.DNS: {53: 0.1},
-            ServiceType.MYSQL: {3306: 0.1},
-            ServiceType.POSTGRESQL: {5432: 0.1},
-            ServiceType.REDIS: {6379: 0.1},
-            ServiceType.MONGODB: {27017: 0.1},
-            ServiceType.MSSQL: {1433: 0.1},
-            ServiceType.TELNET: {23: 0.1},
-            ServiceType.IMAP: {143: 0.1, 993: 0.1},
-            ServiceType.POP3: {110: 0.1, 995: 0.1},
-            ServiceType.RDP: {3389: 0.1},
-            ServiceType.VNC: {5900: 0.1, 5901: 0.1},
-        }
-        
-        if service_type in port_adjustments:
-            port_adj = port_adjustments[service_type].get(port_number, 0)
+        if service_type in self.port_adjustments:
+            port_adj = self.port_adjustments[service_type].get(port_number, 0)
             confidence += port_adj
         
         # Multiple indicators boost confidence
         if service_type in [ServiceType.HTTP, ServiceType.HTTPS]:
-            web_indicators = sum(1 for indicator in self.web_indicators if indicator in banner)
-            if web_indicators > 1:
+            if len(hits & self._web_indicator_set) > 1:
                 confidence += 0.1
         
         # SSL indicators boost HTTPS confidence
         if service_type == ServiceType.HTTPS:
-            ssl_indicators = sum(1 for indicator in self.ssl_indicators if indicator in banner)
-            if ssl_indicators > 1:
+            if len(hits & self._ssl_indicator_set) > 1:
                 confidence += 0.1
         
         # Cap at 1.0
@@ -258,36 +351,10 @@ class BannerAnalyzer:
     
     def _extract_version(self, banner: str, service_type: ServiceType) -> Optional[str]:
         """Extract version information from banner"""
-        version_patterns = {
-            ServiceType.HTTP: [
-                r'(?i)apache/([0-9.]+)',
-                r'(?i)nginx/([0-9.]+)',
-                r'(?i)iis/([0-9.]+)',
-                r'(?i)server:\s*([^\r\n]+)',
-            ],
-            ServiceType.SSH: [
-                r'(?i)openssh_([0-9.]+)',
-                r'(?i)ssh-2\.0-([^\s]+)',
-            ],
-            ServiceType.FTP: [
-                r'(?i)vsftpd\s+([0-9.]+)',
-                r'(?i)proftpd\s+([0-9.]+)',
-            ],
-            ServiceType.SMTP: [
-                r'(?i)postfix/([0-9.]+)',
-                r'(?i)sendmail\s+([0-9.]+)',
-            ],
-            ServiceType.MYSQL: [
-                r'(?i)mysql\s+([0-9.]+)',
-                r'(?i)mariadb\s+([0-9.]+)',
-            ],
-        }
-        
-        if service_type in version_patterns:
-            for pattern in version_patterns[service_type]:
-                match = re.search(pattern, banner)
-                if match:
-                    return match.group(1)
+        for pattern in self._version_patterns.get(service_type, ()):
+            match = pattern.search(banner)
+            if match:
+                return match.group(1)
         
         return None
     
@@ -297,13 +364,13 @@ class BannerAnalyzer:
         
         # Extract server headers for web services
         if service_type in [ServiceType.HTTP, ServiceType.HTTPS]:
-            server_match = re.search(r'(?i)server:\s*([^\r\n]+)', banner)
+            server_match = self._server_header.search(banner)
             if server_match:
                 info['server'] = server_match.group(1).strip()
         
         # Extract SSH version info
         if service_type == ServiceType.SSH:
-            ssh_match = re.search(r'(?i)ssh-([0-9.]+)-([^\s]+)', banner)
+            ssh_match = self._ssh_software.search(banner)
             if ssh_match:
                 info['ssh_version'] = ssh_match.group(1)
                 info['software'] = ssh_match.group(2)
@@ -351,3 +418,126 @@ class BannerAnalyzer:
             priority += 1
         
         return priority
+
+
+# Expected type of each optional top-level section of a signature file
+SIGNATURE_SECTIONS = {
+    'services': dict,
+    'version_patterns': dict,
+    'port_adjustments': dict,
+    'ssl_indicators': list,
+    'web_indicators': list,
+}
+
+
+def load_signatures(path: str = None) -> Dict[str, Any]:
+    """
+    Read and validate a signature database file
+    
+    Args:
+        path: Signature JSON file (default: SERVICE_SIGNATURES_PATH)
+        
+    Returns:
+        Parsed signature database
+        
+    Raises:
+        ValueError: If the file is not a valid signature database
+    """
+    path = path or getattr(settings, 'SERVICE_SIGNATURES_PATH', None) or DEFAULT_SIGNATURES_PATH
+    with open(path, encoding='utf-8') as f:
+        signatures = json.load(f)
+    if not isinstance(signatures, dict) or not isinstance(signatures.get('version'), int):
+        raise ValueError(f"{path}: signature database needs an integer 'version'")
+    for section, section_type in SIGNATURE_SECTIONS.items():
+        if not isinstance(signatures.get(section, section_type()), section_type):
+            raise ValueError(f"{path}: '{section}' must be a {section_type.__name__}")
+    for section in ('ssl_indicators', 'web_indicators'):
+        if not all(isinstance(indicator, str) for indicator in signatures.get(section, [])):
+            raise ValueError(f"{path}: '{section}' must only hold strings")
+    for section in ('services', 'version_patterns'):
+        for service, patterns in signatures.get(section, {}).items():
+            if not isinstance(patterns, list):
+                raise ValueError(f"{path}: {section} for {service} must be a list")
+    for service, patterns in signatures.get('services', {}).items():
+        for pattern_info in patterns:
+            try:
+                re.compile(pattern_info['pattern'])
+                float(pattern_info['confidence'])
+                if not isinstance(pattern_info.get('product') or '', str):
+                    raise TypeError('product must be a string')
+            except (KeyError, TypeError, ValueError, re.error) as e:
+                raise ValueError(f"{path}: bad {service} signature {pattern_info!r}: {e}")
+    for service, patterns in signatures.get('version_patterns', {}).items():
+        for pattern in patterns:
+            try:
+                re.compile(pattern)
+            except (TypeError, re.error) as e:
+                raise ValueError(f"{path}: bad {service} version pattern {pattern!r}: {e}")
+    for service, adjustments in signatures.get('port_adjustments', {}).items():
+        try:
+            for port, adjustment in adjustments.items():
+                int(port)
+                float(adjustment)
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ValueError(f"{path}: bad {service} port adjustments {adjustments!r}: {e}")
+    return signatures
+
+
+# Global banner analyzer instance, rebuilt when the signature file's version changes
+_banner_analyzer = None
+_signatures_mtime = None
+_signatures_checked_at = 0.0
+_banner_analyzer_lock = threading.Lock()
+
+def get_banner_analyzer() -> BannerAnalyzer:
+    """Get the global banner analyzer, hot-reloading signatures at most every SERVICE_SIGNATURES_RELOAD_INTERVAL"""
+    interval = getattr(settings, 'SERVICE_SIGNATURES_RELOAD_INTERVAL', 60)
+    if _banner_analyzer is None or time.monotonic() - _signatures_checked_at >= interval:
+        reload_banner_analyzer()
+    return _banner_analyzer
+
+def reload_banner_analyzer(force: bool = False) -> bool:
+    """
+    Recompile the global analyzer if the signature file carries a new version
+    
+    A file that fails to load keeps the current analyzer in service.
+    
+    Args:
+        force: Re-read the file even if its modification time is unchanged
+        
+    Returns:
+        True if a new analyzer was installed
+    """
+    global _banner_analyzer, _signatures_mtime, _signatures_checked_at
+    
+    path = getattr(settings, 'SERVICE_SIGNATURES_PATH', None) or DEFAULT_SIGNATURES_PATH
+    with _banner_analyzer_lock:
+        _signatures_checked_at = time.monotonic()
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError as e:
+            if _banner_analyzer is None:
+                raise
+            logger.error(f"Cannot stat signature file {path}: {e}")
+            return False
+        if _banner_analyzer is not None and not force and mtime == _signatures_mtime:
+            return False
+        
+        try:
+            signatures = load_signatures(path)
+            if _banner_analyzer is not None and signatures['version'] == _banner_analyzer.signature_version:
+                _signatures_mtime = mtime
+                return False
+            analyzer = BannerAnalyzer(signatures)
+        except (OSError, ValueError, re.error) as e:
+            if _banner_analyzer is None:
+                raise
+            # The mtime is not recorded, so a fixed file is picked up on the next check
+            logger.error(f"Keeping signature version {_banner_analyzer.signature_version}: {e}")
+            return False
+        
+        # Readers keep using the old analyzer until the reference is swapped
+        _banner_analyzer = analyzer
+        _signatures_mtime = mtime
+        logger.info(f"Loaded service signatures version {_banner_analyzer.signature_version}")
+        return True
@@ -1,67 +1,257 @@
-import socket
 import asyncio
 import logging
-from typing import Optional, Dict, List, Tuple
-from concurrent.futures import ThreadPoolExecutor
 import ssl
-import subprocess
+from dataclasses import dataclass
+from typing import Optional, Dict, List, Tuple
 import xml.etree.ElementTree as ET
 
+from django.conf import settings
+
+from .proxy_pool import connect_socket
+
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class Probe:
+    """A payload sent after connecting to elicit a banner.
+
+    Names follow the probe names in nmap-service-probes so captured
+    responses can be classified against the matching probe's rules.
+    """
+    name: str
+    payload: bytes = b''
+    tls: bool = False
+
+
+@dataclass
+class BannerResult:
+    """Raw and normalized output of a single banner grab"""
+    host: str
+    port: int
+    protocol: str
+    probe: str
+    raw: bytes
+    banner: Optional[str]
+    tls: bool = False
+
+
+# Wait for the server to speak first (SSH, FTP, SMTP, POP3, IMAP, MySQL, VNC, ...)
+NULL_PROBE = Probe('NULL')
+TLS_NULL_PROBE = Probe('NULL', tls=True)
+HTTP_PROBE = Probe('GetRequest', b'GET / HTTP/1.0\r\nHost: {host}\r\n\r\n')
+HTTPS_PROBE = Probe('GetRequest', b'GET / HTTP/1.0\r\nHost: {host}\r\n\r\n', tls=True)
+REDIS_PROBE = Probe('redis-server', b'*1\r\n$4\r\ninfo\r\n')
+MEMCACHED_PROBE = Probe('Memcache', b'stats\r\n')
+DNS_VERSION_PROBE = Probe(
+    'DNSVersionBindReqTCP',
+    b'\x00\x1e\x00\x06\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00'
+    b'\x07version\x04bind\x00\x00\x10\x00\x03',
+)
+
+HTTP_PORTS = {
+    80, 81, 591, 2375, 3000, 4200, 5000, 7001, 8000, 8001, 8008, 8080, 8081, 8082,
+    8083, 8084, 8085, 8086, 8087, 8088, 8089, 8090, 8181, 8282, 8888, 8983, 9000,
+    9090, 9091, 9093, 9100, 9200, 10255, 15672,
+}
+HTTPS_PORTS = {443, 2376, 4443, 6443, 8443, 9443, 10250, 10443}
+GREETING_PORTS = {21, 22, 23, 25, 110, 143, 587, 3306, 5900, 5901, 5902}
+TLS_GREETING_PORTS = {465, 990, 993, 995}
+
+PORT_PROBES: Dict[int, Probe] = {
+    **{port: HTTP_PROBE for port in HTTP_PORTS},
+    **{port: HTTPS_PROBE for port in HTTPS_PORTS},
+    **{port: NULL_PROBE for port in GREETING_PORTS},
+    **{port: TLS_NULL_PROBE for port in TLS_GREETING_PORTS},
+    6379: REDIS_PROBE,
+    6380: REDIS_PROBE,
+    6381: REDIS_PROBE,
+    11211: MEMCACHED_PROBE,
+    53: DNS_VERSION_PROBE,
+}
+
+
+def clean_banner_text(banner: str) -> str:
+    """Normalize and truncate banner text consistently."""
+    banner = banner.replace('\r\n', ' ').replace('\n', ' ').replace('\r', ' ')
+    banner = ' '.join(banner.split())
+    if len(banner) > 500:
+        banner = banner[:500] + "..."
+    return banner
+
+
+def banner_from_nmap_port(port_elem: ET.Element) -> Optional[str]:
+    """Assemble a banner from an nmap <port> element's service and banner script."""
+    service_elem = port_elem.find("service")
+    if service_elem is not None:
+        name = service_elem.get("name") or ""
+        product = service_elem.get("product") or ""
+        version = service_elem.get("version") or ""
+        extrainfo = service_elem.get("extrainfo") or ""
+        banner_attr = service_elem.get("banner") or ""
+
+        parts: List[str] = []
+        if name:
+            parts.append(name)
+        if product:
+            parts.append(product)
+        if version:
+            parts.append(version)
+        if extrainfo:
+            parts.append(f"({extrainfo})")
+
+        if not parts and banner_attr:
+            parts.append(banner_attr)
+
+        if parts:
+            return " ".join(parts)
+
+    # Check for banner script output if service-based assembly failed
+    script_elem = port_elem.find("script[@id='banner']")
+    if script_elem is not None:
+        out = script_elem.get("output") or ""
+        if out:
+            return out
+
+    return None
+
+
 class BannerGrabber:
     """Utility class for grabbing banners from open ports"""
-    
-    def __init__(self, timeout: int = 3, max_workers: int = 50):
-        self.timeout = timeout
-        self.max_workers = max_workers
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
-    
+
+    def __init__(self, timeout: int = None, max_concurrency: int = None,
+                 use_nmap_fallback: bool = None, max_bytes: int = 4096):
+        self.timeout = timeout if timeout is not None else getattr(settings, 'BANNER_GRAB_TIMEOUT', 3)
+        self.max_concurrency = max_concurrency or getattr(settings, 'BANNER_GRAB_CONCURRENCY', 1000)
+        self.use_nmap_fallback = (
+            use_nmap_fallback if use_nmap_fallback is not None
+            else getattr(settings, 'BANNER_NMAP_FALLBACK', False)
+        )
+        self.max_bytes = max_bytes
+        # Once a response has started, stop reading after this much silence
+        self.idle_timeout = min(0.5, self.timeout)
+        self._semaphore = None
+        self._semaphore_loop = None
+        self._ssl_context = self._build_ssl_context()
+
     async def grab_banner(self, host: str, port: int, protocol: str = 'tcp') -> Optional[str]:
         """
         Grab banner from a specific host:port combination
-        
+
         Args:
             host: IP address or hostname
             port: Port number
             protocol: Protocol (tcp/udp)
-            
+
         Returns:
             Banner string or None if no banner could be grabbed
         """
-        if protocol.lower() != 'tcp':
-            # UDP banner grabbing is more complex and less reliable
+        result = await self.grab(host, port, protocol)
+        return result.banner if result else None
+
+    async def grab(self, host: str, port: int, protocol: str = 'tcp') -> Optional[BannerResult]:
+        """
+        Grab a banner and keep the raw response bytes and probe used
+
+        Args:
+            host: IP address or hostname
+            port: Port number
+            protocol: Protocol (tcp/udp)
+
+        Returns:
+            BannerResult or None if nothing answered
+        """
+        protocol = protocol.lower()
+        if protocol == 'udp':
+            # Imported lazily: udp_prober builds on BannerResult from this module
+            from .udp_prober import get_udp_prober
+            return await get_udp_prober().probe(host, port)
+        if protocol != 'tcp':
             return None
-            
+
         try:
-            # Run banner grabbing in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            banner = await loop.run_in_executor(
-                self.executor, 
-                self._grab_banner_sync, 
-                host, 
-                port
-            )
-            return banner
+            async with self._get_semaphore():
+                return await self._grab_tcp(host, port)
         except Exception as e:
             logger.debug(f"Failed to grab banner from {host}:{port}: {e}")
             return None
-    
-    def _grab_banner_sync(self, host: str, port: int) -> Optional[str]:
-        """Synchronous banner grabbing that prefers nmap and falls back to sockets."""
-        # Try with nmap first
-        try:
-            banner = self._grab_banner_via_nmap(host, port)
+
+    async def _grab_tcp(self, host: str, port: int) -> Optional[BannerResult]:
+        """Run the port's probe, then generic fallbacks for unknown services"""
+        probe = PORT_PROBES.get(port)
+        known_service = probe is not None
+        probes = [probe] if known_service else [NULL_PROBE, HTTP_PROBE]
+
+        for candidate in probes:
+            try:
+                raw = await self._run_probe(host, port, candidate)
+            except (ConnectionRefusedError, asyncio.TimeoutError, OSError) as e:
+                # A closed/filtered port will not answer the next probe either
+                logger.debug(f"{candidate.name} probe failed for {host}:{port}: {e}")
+                return None
+            if raw:
+                return self._build_result(host, port, candidate, raw)
+
+        if self.use_nmap_fallback and not known_service:
+            banner = await self._grab_banner_via_nmap(host, port)
             if banner:
-                return banner
-        except Exception as nmap_exc:
-            logger.debug(f"nmap banner grab failed for {host}:{port}: {nmap_exc}")
+                return BannerResult(host, port, 'tcp', 'nmap', banner.encode(), banner)
+
+        return None
+
+    async def _run_probe(self, host: str, port: int, probe: Probe) -> bytes:
+        """Connect, send the probe payload and collect the response"""
+        async with connect_socket(host, port, timeout=self.timeout) as sock:
+            # The socket is owned by the transport from here on
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    sock=sock,
+                    ssl=self._ssl_context if probe.tls else None,
+                    server_hostname='' if probe.tls else None,
+                ),
+                timeout=self.timeout,
+            )
+            try:
+                if probe.payload:
+                    writer.write(probe.payload.replace(b'{host}', host.encode()))
+                    await writer.drain()
+                return await self._read_response(reader)
+            finally:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except Exception:
+                    pass
 
-        # Fallback to socket-based approach
-        return self._grab_banner_via_socket(host, port)
+    async def _read_response(self, reader: asyncio.StreamReader) -> bytes:
+        """Read until EOF, size cap, or the server goes quiet"""
+        data = b''
+        wait = self.timeout
+        while len(data) < self.max_bytes:
+            try:
+                chunk = await asyncio.wait_for(reader.read(self.max_bytes - len(data)), timeout=wait)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            data += chunk
+            wait = self.idle_timeout
+        return data
+
+    def _build_result(self, host: str, port: int, probe: Probe, raw: bytes) -> BannerResult:
+        """Wrap a raw response in a BannerResult"""
+        text = raw.decode('utf-8', errors='ignore').strip()
+        return BannerResult(
+            host=host,
+            port=port,
+            protocol='tcp',
+            probe=probe.name,
+            raw=raw,
+            banner=clean_banner_text(text) if text else None,
+            tls=probe.tls,
+        )
 
-    def _grab_banner_via_nmap(self, host: str, port: int) -> Optional[str]:
+    async def _grab_banner_via_nmap(self, host: str, port: int) -> Optional[str]:
         """Use nmap -sV (and banner script) to detect service banner and version."""
         cmd = [
             "nmap",
@@ -82,161 +272,86 @@ class BannerGrabber:
             host,
         ]
         try:
-            completed = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=max(self.timeout + 5, 10),
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
             )
-            stdout = completed.stdout or ""
-            if not stdout.strip():
-                return None
-
-            # Parse XML output
-            root = ET.fromstring(stdout)
-            service_elem = root.find(f".//port[@portid='{port}']/service")
-            banner_text: Optional[str] = None
-            if service_elem is not None:
-                name = service_elem.get("name") or ""
-                product = service_elem.get("product") or ""
-                version = service_elem.get("version") or ""
-                extrainfo = service_elem.get("extrainfo") or ""
-                banner_attr = service_elem.get("banner") or ""
-
-                parts: List[str] = []
-                if name:
-                    parts.append(name)
-                if product:
-                    parts.append(product)
-                if version:
-                    parts.append(version)
-                if extrainfo:
-                    parts.append(f"({extrainfo})")
-
-                if not parts and banner_attr:
-                    parts.append(banner_attr)
-
-                if parts:
-                    banner_text = " ".join(parts)
-
-            # Check for banner script output if service-based assembly failed
-            if not banner_text:
-                script_elem = root.find(f".//port[@portid='{port}']/script[@id='banner']")
-                if script_elem is not None:
-                    out = script_elem.get("output") or ""
-                    if out:
-                        banner_text = out
-
-            if banner_text:
-                return self._clean_banner_text(banner_text)
+        except FileNotFoundError:
+            logger.debug("nmap not installed, skipping nmap banner fallback")
+            return None
 
+        try:
+            stdout, _ = await asyncio.wait_for(
+                process.communicate(),
+                timeout=max(self.timeout + 5, 10),
+            )
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
             return None
-        except subprocess.TimeoutExpired:
+
+        stdout = (stdout or b'').decode('utf-8', errors='ignore')
+        if not stdout.strip():
             return None
+
+        try:
+            root = ET.fromstring(stdout)
         except ET.ParseError as parse_err:
             logger.debug(f"nmap XML parse error for {host}:{port}: {parse_err}")
             return None
 
-    def _grab_banner_via_socket(self, host: str, port: int) -> Optional[str]:
-        """Legacy socket-based banner grabbing as a fallback."""
-        sock = None
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(self.timeout)
-            sock.connect((host, port))
+        port_elem = root.find(f".//port[@portid='{port}']")
+        if port_elem is None:
+            return None
+        banner_text = banner_from_nmap_port(port_elem)
+        return clean_banner_text(banner_text) if banner_text else None
 
-            banner = sock.recv(1024).decode('utf-8', errors='ignore').strip()
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Concurrency limit bound to the currently running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
 
-            if port in [443, 8443, 9443] and not banner:
-                try:
-                    context = ssl.create_default_context()
-                    context.check_hostname = False
-                    context.verify_mode = ssl.CERT_NONE
-                    ssl_sock = context.wrap_socket(sock, server_hostname=host)
-                    ssl_sock.settimeout(self.timeout)
-                    ssl_sock.send(b"GET / HTTP/1.1\r\nHost: " + host.encode() + b"\r\n\r\n")
-                    banner = ssl_sock.recv(1024).decode('utf-8', errors='ignore').strip()
-                    ssl_sock.close()
-                except Exception:
-                    pass
-            elif port in [80, 8080, 8000, 8008, 8888] and not banner:
-                try:
-                    sock.send(b"GET / HTTP/1.1\r\nHost: " + host.encode() + b"\r\n\r\n")
-                    banner = sock.recv(1024).decode('utf-8', errors='ignore').strip()
-                except Exception:
-                    pass
-            elif port == 22 and not banner:
-                try:
-                    banner = sock.recv(1024).decode('utf-8', errors='ignore').strip()
-                except Exception:
-                    pass
-            elif port == 21 and not banner:
-                try:
-                    banner = sock.recv(1024).decode('utf-8', errors='ignore').strip()
-                except Exception:
-                    pass
-            elif port in [25, 587, 465] and not banner:
-                try:
-                    banner = sock.recv(1024).decode('utf-8', errors='ignore').strip()
-                except Exception:
-                    pass
-            else:
-                try:
-                    banner = sock.recv(1024).decode('utf-8', errors='ignore').strip()
-                except Exception:
-                    pass
+    @staticmethod
+    def _build_ssl_context() -> ssl.SSLContext:
+        """TLS context that accepts any certificate (we only want the banner)"""
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
 
-            if banner:
-                return self._clean_banner_text(banner)
-            return None
-        except Exception as e:
-            logger.debug(f"Socket banner grab failed for {host}:{port}: {e}")
-            return None
-        finally:
-            try:
-                if sock:
-                    sock.close()
-            except Exception:
-                pass
-
-    def _clean_banner_text(self, banner: str) -> str:
-        """Normalize and truncate banner text consistently."""
-        banner = banner.replace('\r\n', ' ').replace('\n', ' ').replace('\r', ' ')
-        banner = ' '.join(banner.split())
-        if len(banner) > 500:
-            banner = banner[:500] + "..."
-        return banner
-    
     async def grab_banners_batch(self, port_data: List[Tuple[str, int, str]]) -> Dict[Tuple[str, int], str]:
         """
         Grab banners for multiple ports in batch
-        
+
         Args:
             port_data: List of (host, port, protocol) tuples
-            
+
         Returns:
             Dictionary mapping (host, port) to banner string
         """
-        tasks = []
-        for host, port, protocol in port_data:
-            task = self.grab_banner(host, port, protocol)
-            tasks.append((host, port, task))
-        
+        banners = await asyncio.gather(
+            *(self.grab_banner(host, port, protocol) for host, port, protocol in port_data),
+            return_exceptions=True,
+        )
+
         results = {}
-        for host, port, task in tasks:
-            try:
-                banner = await task
-                if banner:
-                    results[(host, port)] = banner
-            except Exception as e:
-                logger.debug(f"Batch banner grab failed for {host}:{port}: {e}")
-        
+        for (host, port, _), banner in zip(port_data, banners):
+            if isinstance(banner, Exception):
+                logger.debug(f"Batch banner grab failed for {host}:{port}: {banner}")
+            elif banner:
+                results[(host, port)] = banner
+
         return results
-    
+
     def cleanup(self):
         """Clean up resources"""
-        if self.executor:
-            self.executor.shutdown(wait=True)
+        # Connections are closed per grab; nothing is pooled between calls
+        self._semaphore = None
+        self._semaphore_loop = None
 
 
 # Global banner grabber instance
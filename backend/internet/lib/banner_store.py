@@ -0,0 +1,142 @@
+"""
+Content-addressed banner storage: each distinct banner text is stored once and referenced by ports
+"""
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.db.models.functions import Coalesce
+
+from internet.models import Banner, Port
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def banner_digest(text: str) -> str:
+    """SHA-256 hex digest addressing a normalized banner text"""
+    return hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def ports_with_banners(ports: QuerySet = None) -> QuerySet:
+    """
+    Ports that have a banner, annotated with it as banner_value
+
+    Interned banners take precedence; ports not yet moved by intern_banners
+    fall back to the legacy inline column.
+
+    Args:
+        ports: Port queryset to narrow (default: all ports)
+
+    Returns:
+        Annotated queryset excluding ports without a banner
+    """
+    ports = Port.objects.all() if ports is None else ports
+    return (
+        ports.annotate(banner_value=Coalesce('banner_ref__text', 'banner'))
+        .exclude(banner_value__isnull=True)
+        .exclude(banner_value='')
+    )
+
+
+class BannerStore:
+    """Intern banner texts into the Banner table, optionally with compressed raw bytes"""
+
+    def __init__(self, store_raw: bool = None, compression_level: int = None, batch_size: int = 1000):
+        """
+        Args:
+            store_raw: Keep zstd-compressed raw bytes (default: BANNER_STORE_RAW, when zstandard is installed)
+            compression_level: zstd level (default: BANNER_STORE_ZSTD_LEVEL)
+            batch_size: Rows per multi-row insert and digest lookup
+        """
+        if store_raw is None:
+            store_raw = getattr(settings, 'BANNER_STORE_RAW', True)
+        self.store_raw = store_raw and ZSTD_AVAILABLE
+        self.compression_level = compression_level or getattr(settings, 'BANNER_STORE_ZSTD_LEVEL', 3)
+        self.batch_size = batch_size
+        self._compressor = zstandard.ZstdCompressor(level=self.compression_level) if self.store_raw else None
+
+    def intern(self, text: str, raw: bytes = None) -> int:
+        """
+        Get or create the Banner row for a text
+
+        Args:
+            text: Normalized banner text
+            raw: Raw response bytes, kept only when the banner is new
+
+        Returns:
+            Banner id
+        """
+        return self.intern_many([(text, raw)])[text]
+
+    def intern_many(self, items: Iterable[Tuple[str, Optional[bytes]]]) -> Dict[str, int]:
+        """
+        Get or create Banner rows for many texts with a few set-based queries
+
+        Args:
+            items: (text, raw bytes or None) pairs; repeated texts are stored once
+
+        Returns:
+            Banner id for each distinct text
+        """
+        by_digest: Dict[str, Tuple[str, Optional[bytes]]] = {}
+        for text, raw in items:
+            digest = banner_digest(text)
+            if digest not in by_digest or (raw and not by_digest[digest][1]):
+                by_digest[digest] = (text, raw)
+        if not by_digest:
+            return {}
+
+        ids = self._lookup(list(by_digest))
+        missing = [digest for digest in by_digest if digest not in ids]
+        if missing:
+            # Only new banners pay for compression; concurrent writers of the same text are ignored
+            Banner.objects.bulk_create(
+                [self._build(digest, *by_digest[digest]) for digest in missing],
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+            ids.update(self._lookup(missing))
+        return {by_digest[digest][0]: banner_id for digest, banner_id in ids.items()}
+
+    def decompress(self, banner: Banner) -> Optional[bytes]:
+        """Original response bytes of a banner, if they were stored"""
+        if banner.raw is None:
+            return None
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError('zstandard is required to read raw banner bytes')
+        return zstandard.ZstdDecompressor().decompress(bytes(banner.raw))
+
+    def _build(self, digest: str, text: str, raw: Optional[bytes]) -> Banner:
+        banner = Banner(sha256=digest, text=text)
+        if raw and self._compressor is not None:
+            banner.raw = self._compressor.compress(raw)
+            banner.raw_size = len(raw)
+        return banner
+
+    def _lookup(self, digests: List[str]) -> Dict[str, int]:
+        """Existing banner ids by digest, queried in batches"""
+        ids = {}
+        for i in range(0, len(digests), self.batch_size):
+            ids.update(
+                Banner.objects.filter(sha256__in=digests[i:i + self.batch_size]).values_list('sha256', 'id')
+            )
+        return ids
+
+
+# Global banner store instance
+_banner_store = None
+
+def get_banner_store() -> BannerStore:
+    """Get the global banner store instance"""
+    global _banner_store
+    if _banner_store is None:
+        _banner_store = BannerStore()
+    return _banner_store
@@ -0,0 +1,234 @@
+"""
+Bulk enqueue service for high-volume ancillary job creation
+"""
+import ipaddress
+import logging
+from typing import Dict, List, Optional, Any
+
+from django.db.models import Exists, OuterRef, QuerySet
+
+from internet.models import AncillaryJob, Host, Port
+
+from .probe_freshness import ProbeFreshnessIndex, get_probe_freshness_index
+
+logger = logging.getLogger(__name__)
+
+
+# Statuses that count as "already queued" when deduplicating new jobs
+ACTIVE_JOB_STATUSES = ['pending', 'queued', 'running']
+
+# Host-level jobs are keyed on the host, port-level jobs on the port
+HOST_JOB_TYPES = ['domain_enum', 'geolocation']
+PORT_JOB_TYPES = ['banner_grab', 'ssl_cert', 'dns_relay']
+
+# Port-level jobs that only make sense on specific port numbers
+PORT_JOB_PORT_NUMBERS = {
+    'dns_relay': [53],
+}
+
+# Mirrors the priorities used when jobs are queued during masscan discovery
+DEFAULT_JOB_PRIORITIES = {
+    'banner_grab': 0,
+    'domain_enum': 1,
+    'ssl_cert': 2,
+    'geolocation': 2,
+    'dns_relay': 2,
+}
+
+
+class BulkEnqueueService:
+    """Create ancillary jobs for large host/port sets without per-row queries"""
+
+    def __init__(self, chunk_size: int = 5000, batch_size: int = 1000,
+                 freshness: ProbeFreshnessIndex = None):
+        """
+        Args:
+            chunk_size: Rows fetched per round trip from the server-side cursor
+            batch_size: Rows per multi-row INSERT issued by bulk_create
+            freshness: Probe freshness index (default: global index)
+        """
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.freshness = freshness or get_probe_freshness_index()
+
+    def hosts_without_active_job(self, job_type: str, hosts: QuerySet = None) -> QuerySet:
+        """Anti-join hosts against active jobs of the given type"""
+        if hosts is None:
+            hosts = Host.objects.all()
+        active_jobs = AncillaryJob.objects.filter(
+            host=OuterRef('pk'),
+            job_type=job_type,
+            status__in=ACTIVE_JOB_STATUSES,
+        )
+        return hosts.filter(~Exists(active_jobs))
+
+    def ports_without_active_job(self, job_type: str, ports: QuerySet = None) -> QuerySet:
+        """Anti-join ports against active jobs of the given type"""
+        if ports is None:
+            ports = Port.objects.all()
+        active_jobs = AncillaryJob.objects.filter(
+            port=OuterRef('pk'),
+            job_type=job_type,
+            status__in=ACTIVE_JOB_STATUSES,
+        )
+        return ports.filter(~Exists(active_jobs))
+
+    def enqueue_host_jobs(
+        self,
+        job_type: str,
+        hosts: QuerySet = None,
+        priority: Optional[int] = None,
+        skip_private: bool = True,
+        scanner_job=None,
+        metadata: Dict[str, Any] = None,
+        dry_run: bool = False,
+        force_refresh: bool = False,
+    ) -> Dict[str, int]:
+        """
+        Queue one host-level job per host that has no active job of this type
+        and was not probed within the type's freshness TTL
+
+        Args:
+            job_type: Host-level job type (domain_enum, geolocation)
+            hosts: Candidate hosts (default: all hosts)
+            priority: Job priority (default: per-type default)
+            skip_private: Skip RFC1918/loopback/link-local addresses
+            scanner_job: Optional ScannerJob to link the jobs to
+            metadata: Metadata stored on every created job
+            dry_run: Count candidates without inserting anything
+            force_refresh: Also queue hosts whose last probe is still fresh
+
+        Returns:
+            Dictionary with 'queued' and 'skipped' counts
+        """
+        if job_type not in HOST_JOB_TYPES:
+            raise ValueError(f"Unsupported host-level job type: {job_type}")
+
+        if priority is None:
+            priority = DEFAULT_JOB_PRIORITIES.get(job_type, 0)
+
+        hosts = hosts if hosts is not None else Host.objects.all()
+        if not force_refresh:
+            hosts = self.freshness.exclude_fresh_hosts(job_type, hosts)
+
+        candidates = (
+            self.hosts_without_active_job(job_type, hosts)
+            .order_by()
+            .values_list('id', 'ip')
+            .iterator(chunk_size=self.chunk_size)
+        )
+
+        queued = 0
+        skipped = 0
+        pending: List[AncillaryJob] = []
+
+        for host_id, ip in candidates:
+            if skip_private and self._is_private_ip(ip):
+                skipped += 1
+                continue
+
+            pending.append(AncillaryJob(
+                job_type=job_type,
+                host_ip=ip,
+                host_id=host_id,
+                scanner_job=scanner_job,
+                status='pending',
+                priority=priority,
+                metadata=dict(metadata or {}),
+            ))
+
+            if len(pending) >= self.chunk_size:
+                queued += self._flush(pending, dry_run)
+                pending = []
+
+        queued += self._flush(pending, dry_run)
+
+        logger.info(f"Bulk enqueued {queued} {job_type} jobs ({skipped} skipped)")
+        return {'queued': queued, 'skipped': skipped}
+
+    def enqueue_port_jobs(
+        self,
+        job_type: str,
+        ports: QuerySet = None,
+        priority: Optional[int] = None,
+        scanner_job=None,
+        metadata: Dict[str, Any] = None,
+        dry_run: bool = False,
+        force_refresh: bool = False,
+    ) -> Dict[str, int]:
+        """
+        Queue one port-level job per port that has no active job of this type
+        and was not probed within the type's freshness TTL
+
+        Args:
+            job_type: Port-level job type (banner_grab, ssl_cert, dns_relay)
+            ports: Candidate ports (default: all ports)
+            priority: Job priority (default: per-type default)
+            scanner_job: Optional ScannerJob to link the jobs to
+            metadata: Metadata stored on every created job
+            dry_run: Count candidates without inserting anything
+            force_refresh: Also queue ports whose last probe is still fresh
+
+        Returns:
+            Dictionary with 'queued' and 'skipped' counts
+        """
+        if job_type not in PORT_JOB_TYPES:
+            raise ValueError(f"Unsupported port-level job type: {job_type}")
+
+        if priority is None:
+            priority = DEFAULT_JOB_PRIORITIES.get(job_type, 0)
+
+        ports = ports if ports is not None else Port.objects.all()
+        if job_type in PORT_JOB_PORT_NUMBERS:
+            ports = ports.filter(port_number__in=PORT_JOB_PORT_NUMBERS[job_type])
+        if not force_refresh:
+            ports = self.freshness.exclude_fresh_ports(job_type, ports)
+
+        candidates = (
+            self.ports_without_active_job(job_type, ports)
+            .order_by()
+            .values_list('id', 'host_id', 'host__ip', 'port_number', 'proto')
+            .iterator(chunk_size=self.chunk_size)
+        )
+
+        queued = 0
+        pending: List[AncillaryJob] = []
+
+        for port_id, host_id, ip, port_number, proto in candidates:
+            pending.append(AncillaryJob(
+                job_type=job_type,
+                host_ip=ip,
+                port_number=port_number,
+                protocol=proto,
+                port_id=port_id,
+                host_id=host_id,
+                scanner_job=scanner_job,
+                status='pending',
+                priority=priority,
+                metadata=dict(metadata or {}),
+            ))
+
+            if len(pending) >= self.chunk_size:
+                queued += self._flush(pending, dry_run)
+                pending = []
+
+        queued += self._flush(pending, dry_run)
+
+        logger.info(f"Bulk enqueued {queued} {job_type} jobs")
+        return {'queued': queued, 'skipped': 0}
+
+    def _flush(self, jobs: List[AncillaryJob], dry_run: bool) -> int:
+        """Insert a chunk of jobs with multi-row INSERTs"""
+        if not jobs:
+            return 0
+        if not dry_run:
+            AncillaryJob.objects.bulk_create(jobs, batch_size=self.batch_size)
+        return len(jobs)
+
+    @staticmethod
+    def _is_private_ip(ip: str) -> bool:
+        """Check if IP address is private/internal"""
+        try:
+            return ipaddress.ip_address(ip).is_private
+        except ValueError:
+            return False
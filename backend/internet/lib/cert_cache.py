@@ -0,0 +1,138 @@
+"""
+Fingerprint-keyed cache of parsed SSL certificates
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from django.conf import settings
+
+try:
+    import redis.asyncio as redis_asyncio
+    REDIS_ASYNC_AVAILABLE = True
+except ImportError:
+    REDIS_ASYNC_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+# Fields that describe one observation of a certificate rather than the certificate itself
+OBSERVATION_FIELDS = ('host_ip', 'port', 'created_at')
+
+
+class CertificateCache:
+    """Bounded worker-local LRU of parsed certificates, optionally shared through Redis"""
+
+    def __init__(self, max_entries: int = None, use_redis: bool = None, redis_ttl: int = None):
+        self.max_entries = max_entries or getattr(settings, 'CERT_CACHE_SIZE', 5000)
+        self.use_redis = (
+            use_redis if use_redis is not None
+            else getattr(settings, 'CERT_CACHE_REDIS', False)
+        ) and REDIS_ASYNC_AVAILABLE
+        self.redis_ttl = redis_ttl or getattr(settings, 'CERT_CACHE_REDIS_TTL', 86400)
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_loop = None
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, digest: str) -> Optional[Dict]:
+        """
+        Look up a parsed certificate by the SHA-256 of its DER bytes
+
+        Args:
+            digest: Upper-case hex SHA-256 of the DER certificate
+
+        Returns:
+            Parsed certificate fields (without observation fields) or None
+        """
+        with self._lock:
+            cert_data = self._entries.get(digest)
+            if cert_data is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return cert_data
+
+        if self.use_redis:
+            cert_data = await self._redis_get(digest)
+            if cert_data is not None:
+                self._store_local(digest, cert_data)
+                with self._lock:
+                    self.hits += 1
+                return cert_data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    async def put(self, digest: str, cert_data: Dict) -> None:
+        """
+        Cache a freshly parsed certificate
+
+        Args:
+            digest: Upper-case hex SHA-256 of the DER certificate
+            cert_data: Certificate dict as built by SSLCertGrabber
+        """
+        cert_data = {k: v for k, v in cert_data.items() if k not in OBSERVATION_FIELDS}
+        self._store_local(digest, cert_data)
+        if self.use_redis:
+            await self._redis_set(digest, cert_data)
+
+    def clear(self) -> None:
+        """Drop all worker-local entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store_local(self, digest: str, cert_data: Dict) -> None:
+        """Insert into the LRU, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[digest] = cert_data
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_redis(self):
+        """Redis client bound to the currently running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._redis is None or self._redis_loop is not loop:
+            self._redis_loop = loop
+            self._redis = redis_asyncio.Redis(
+                host=settings.REDIS_HOST,
+                port=int(settings.REDIS_PORT),
+                db=int(settings.REDIS_DB),
+            )
+        return self._redis
+
+    async def _redis_get(self, digest: str) -> Optional[Dict]:
+        """Fetch a certificate from the shared Redis cache"""
+        try:
+            value = await self._get_redis().get(f"certcache:{digest}")
+            return json.loads(value) if value else None
+        except Exception as e:
+            logger.debug(f"Certificate cache Redis lookup failed: {e}")
+            return None
+
+    async def _redis_set(self, digest: str, cert_data: Dict) -> None:
+        """Store a certificate in the shared Redis cache"""
+        try:
+            await self._get_redis().set(f"certcache:{digest}", json.dumps(cert_data), ex=self.redis_ttl)
+        except Exception as e:
+            logger.debug(f"Certificate cache Redis store failed: {e}")
+
+
+# Global certificate cache instance
+_cert_cache = None
+
+def get_cert_cache() -> CertificateCache:
+    """Get the global certificate cache instance"""
+    global _cert_cache
+    if _cert_cache is None:
+        _cert_cache = CertificateCache()
+    return _cert_cache
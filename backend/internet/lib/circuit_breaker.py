@@ -0,0 +1,96 @@
+"""
+Circuit breaker for ejecting failing upstreams (proxies, API providers)
+"""
+import logging
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures, half-open trial calls after a cool-down.
+
+    Not thread-safe; each breaker is meant to be used from a single event loop.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 60.0,
+                 half_open_max_calls: int = 1, name: str = '',
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            recovery_timeout: Seconds the circuit stays open before trial calls are allowed
+            half_open_max_calls: Trial calls allowed while half-open
+            name: Label used in log messages
+            clock: Monotonic time source (injectable for tests)
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.name = name
+        self._clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+    @property
+    def state(self) -> str:
+        """Current state, moving open -> half-open once the cool-down has passed"""
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    @property
+    def failures(self) -> int:
+        return self._failures
+
+    def allow(self) -> bool:
+        """
+        Ask whether a call may go through, reserving a trial slot when half-open
+
+        Returns:
+            True if the caller may proceed
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+            self._half_open_calls += 1
+            return True
+        return False
+
+    def release(self) -> None:
+        """Give back a half-open trial slot that was reserved but never used"""
+        if self._state == self.HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def record_success(self) -> None:
+        """A call succeeded; close the circuit"""
+        if self._state != self.CLOSED:
+            logger.info(f"Circuit {self.name} closed")
+        self._state = self.CLOSED
+        self._failures = 0
+        self._half_open_calls = 0
+
+    def record_failure(self) -> None:
+        """A call failed; open the circuit when the threshold is reached or a trial fails"""
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                logger.info(f"Circuit {self.name} opened after {self._failures} failures")
+            self._state = self.OPEN
+            self._opened_at = self._clock()
+            self._half_open_calls = 0
+
+    def reset(self) -> None:
+        """Forget all failures"""
+        self._state = self.CLOSED
+        self._failures = 0
+        self._half_open_calls = 0
@@ -0,0 +1,108 @@
+"""
+Concurrent open DNS relay (recursive resolver) detection
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .async_dns import AsyncDNSResolver, DNS_AVAILABLE
+
+if DNS_AVAILABLE:
+    import dns.flags
+    import dns.rcode
+    import dns.rdatatype
+
+logger = logging.getLogger(__name__)
+
+
+class DNSRelayChecker:
+    """Send recursion-desired queries to many DNS servers over shared UDP sockets"""
+
+    def __init__(self, test_domain: str = None, timeout: float = None, retries: int = None,
+                 max_inflight: int = None, resolver: AsyncDNSResolver = None):
+        self.test_domain = test_domain or getattr(settings, 'DNS_RELAY_TEST_DOMAIN', 'google.com')
+        self.timeout = timeout or getattr(settings, 'DNS_RELAY_TIMEOUT', 2)
+        self.retries = retries if retries is not None else getattr(settings, 'DNS_RELAY_RETRIES', 1)
+        self.max_inflight = max_inflight or getattr(settings, 'DNS_RELAY_CONCURRENCY', 2000)
+        # Only AsyncDNSResolver.query is used, so the target servers are passed per query
+        self.resolver = resolver or AsyncDNSResolver(
+            resolvers=[], timeout=self.timeout, max_inflight=self.max_inflight,
+        )
+
+    async def check(self, host: str, port: int = 53) -> Optional[Dict]:
+        """
+        Ask a server to recursively resolve the test domain
+
+        Args:
+            host: IP address of the DNS server
+            port: DNS port
+
+        Returns:
+            Dictionary with open_relay, recursion_available, rcode and answers,
+            or None if the server never replied
+        """
+        if not DNS_AVAILABLE:
+            return None
+
+        response = None
+        for _ in range(self.retries + 1):
+            response = await self.resolver.query((host, port), self.test_domain, 'A', timeout=self.timeout)
+            if response is not None:
+                break
+        if response is None:
+            return None
+
+        answers = [
+            rdata.to_text()
+            for rrset in response.answer if rrset.rdtype == dns.rdatatype.A
+            for rdata in rrset
+        ]
+        recursion_available = bool(response.flags & dns.flags.RA)
+        rcode = dns.rcode.to_text(response.rcode())
+        return {
+            # A relay must both advertise recursion and actually return the answer
+            'open_relay': recursion_available and rcode == 'NOERROR' and bool(answers),
+            'recursion_available': recursion_available,
+            'rcode': rcode,
+            'answers': answers,
+        }
+
+    async def check_batch(self, targets: List[Tuple[str, int]]) -> Dict[Tuple[str, int], Dict]:
+        """
+        Check many DNS servers concurrently
+
+        Args:
+            targets: List of (host, port) tuples
+
+        Returns:
+            Dictionary mapping (host, port) to check results for servers that replied
+        """
+        results = await asyncio.gather(
+            *(self.check(host, port) for host, port in targets),
+            return_exceptions=True,
+        )
+
+        checked = {}
+        for target, result in zip(targets, results):
+            if isinstance(result, Exception):
+                logger.debug(f"DNS relay check failed for {target[0]}:{target[1]}: {result}")
+            elif result is not None:
+                checked[target] = result
+        return checked
+
+    def close(self) -> None:
+        """Close the UDP sockets"""
+        self.resolver.close()
+
+
+# Global DNS relay checker instance
+_dns_relay_checker = None
+
+def get_dns_relay_checker() -> DNSRelayChecker:
+    """Get the global DNS relay checker instance"""
+    global _dns_relay_checker
+    if _dns_relay_checker is None:
+        _dns_relay_checker = DNSRelayChecker()
+    return _dns_relay_checker
@@ -1,190 +1,128 @@
 import socket
 import asyncio
 import logging
-import ssl
 from typing import Optional, List, Dict, Tuple
-from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 import re
 
-# Optional DNS imports - handle gracefully if not available
-try:
-    import dns.resolver
-    import dns.reversename
-    DNS_AVAILABLE = True
-except ImportError:
-    DNS_AVAILABLE = False
-    logger = logging.getLogger(__name__)
-    logger.warning("dnspython not available - DNS enumeration will be limited")
+from .async_dns import AsyncDNSResolver, DNS_AVAILABLE, get_dns_resolver
+from .banner_grabber import HTTP_PORTS, HTTPS_PORTS
+from .http_fingerprint import get_http_fingerprinter
+from .ssl_cert_grabber import get_ssl_cert_grabber
 
 logger = logging.getLogger(__name__)
 
+# Ports probed when the host's open ports are unknown
+DEFAULT_HTTPS_PORTS = [443, 8443, 9443, 10443]
+DEFAULT_HTTP_PORTS = [80, 8080, 8000, 8008, 8888, 3000, 5000]
+
+if not DNS_AVAILABLE:
+    logger.warning("dnspython not available - DNS enumeration will be limited")
+
 
 class DomainEnumerator:
     """Utility class for enumerating domains from IP addresses"""
     
-    def __init__(self, timeout: int = 5, max_workers: int = 20):
+    def __init__(self, timeout: int = 5, max_workers: int = 20, dns_resolver: AsyncDNSResolver = None):
         self.timeout = timeout
         self.max_workers = max_workers
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.dns_resolver = dns_resolver or get_dns_resolver()
+        # Shares the TLS handshake path, certificate cache and proxy pool with ssl_cert jobs
+        self.ssl_cert_grabber = get_ssl_cert_grabber()
+        self.http_fingerprinter = get_http_fingerprinter()
     
-    async def enumerate_domains(self, host_ip: str) -> List[str]:
+    async def enumerate_domains(self, host_ip: str, open_ports: Optional[List[int]] = None,
+                                known_domains: Optional[List[str]] = None,
+                                cert_ports: Optional[List[int]] = None,
+                                fingerprinted_ports: Optional[List[int]] = None) -> List[str]:
         """
         Enumerate domains for a given IP address
         
         Args:
             host_ip: IP address to enumerate domains for
+            open_ports: Known open TCP ports; only these are probed (None probes the defaults)
+            known_domains: Domains already collected for the host (certificate CN/SANs, HTTP fingerprints)
+            cert_ports: Ports whose certificate is already stored and need no new handshake
+            fingerprinted_ports: Web ports already fingerprinted by a banner grab job
             
         Returns:
             List of domain names found
         """
+        https_ports, http_ports = self._select_ports(open_ports, cert_ports)
+        skip_http = set(fingerprinted_ports or [])
+        http_ports = [port for port in http_ports if port not in skip_http]
+        
         try:
-            # Run domain enumeration in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            domains = await loop.run_in_executor(
-                self.executor, 
-                self._enumerate_domains_sync, 
-                host_ip
+            found = await asyncio.gather(
+                self._get_dns_domains(host_ip),
+                self._get_http_domains(host_ip, http_ports),
+                self._get_ssl_domains(host_ip, https_ports),
             )
-            return domains
+            domains = list(known_domains or [])
+            for domain_list in found:
+                domains.extend(domain_list)
+            return self._clean_domains(domains)
         except Exception as e:
             logger.debug(f"Failed to enumerate domains for {host_ip}: {e}")
             return []
     
-    def _enumerate_domains_sync(self, host_ip: str) -> List[str]:
-        """Synchronous domain enumeration function"""
-        domains = set()
-        
-        try:
-            # 1. Reverse DNS lookup
-            try:
-                reverse_dns = socket.gethostbyaddr(host_ip)[0]
-                if reverse_dns and reverse_dns != host_ip:
-                    domains.add(reverse_dns)
-            except (socket.herror, socket.gaierror):
-                pass
-            
-            # 2. SSL certificate enumeration
-            ssl_domains = self._get_ssl_domains(host_ip)
-            domains.update(ssl_domains)
-            
-            # 3. HTTP/HTTPS response headers
-            http_domains = self._get_http_domains(host_ip)
-            domains.update(http_domains)
-            
-            # 4. DNS PTR record lookup
-            dns_domains = self._get_dns_domains(host_ip)
-            domains.update(dns_domains)
-            
-            # Filter and clean domains
-            cleaned_domains = []
-            for domain in domains:
-                if self._is_valid_domain(domain):
-                    cleaned_domains.append(domain.lower().strip())
-            
-            return list(set(cleaned_domains))
-            
-        except Exception as e:
-            logger.debug(f"Domain enumeration failed for {host_ip}: {e}")
-            return []
+    @staticmethod
+    def _select_ports(open_ports: Optional[List[int]],
+                      cert_ports: Optional[List[int]]) -> Tuple[List[int], List[int]]:
+        """Pick the TLS and HTTP ports worth connecting to"""
+        if open_ports is None:
+            https_ports, http_ports = list(DEFAULT_HTTPS_PORTS), list(DEFAULT_HTTP_PORTS)
+        else:
+            open_set = set(open_ports)
+            https_ports = sorted(open_set & (HTTPS_PORTS | set(DEFAULT_HTTPS_PORTS)))
+            http_ports = sorted(open_set & (HTTP_PORTS | set(DEFAULT_HTTP_PORTS)))
+        
+        skip = set(cert_ports or [])
+        return [port for port in https_ports if port not in skip], http_ports
+    
+    def _clean_domains(self, domains: List[str]) -> List[str]:
+        """Filter and normalize candidate domains"""
+        cleaned_domains = []
+        for domain in domains:
+            if self._is_valid_domain(domain):
+                cleaned_domains.append(domain.lower().strip())
+        
+        return list(set(cleaned_domains))
     
-    def _get_ssl_domains(self, host_ip: str) -> List[str]:
+    async def _get_ssl_domains(self, host_ip: str, https_ports: List[int]) -> List[str]:
         """Get domains from SSL certificates"""
-        domains = set()
-        
-        # Common HTTPS ports
-        https_ports = [443, 8443, 9443, 10443]
-        
-        for port in https_ports:
-            try:
-                context = ssl.create_default_context()
-                context.check_hostname = False
-                context.verify_mode = ssl.CERT_NONE
-                
-                with socket.create_connection((host_ip, port), timeout=self.timeout) as sock:
-                    with context.wrap_socket(sock, server_hostname=host_ip) as ssock:
-                        cert = ssock.getpeercert()
-                        
-                        # Get Common Name
-                        if 'subject' in cert:
-                            for item in cert['subject']:
-                                for key, value in item:
-                                    if key == 'commonName':
-                                        domains.add(value)
-                        
-                        # Get Subject Alternative Names
-                        if 'subjectAltName' in cert:
-                            for san_type, san_value in cert['subjectAltName']:
-                                if san_type == 'DNS':
-                                    domains.add(san_value)
-                                    
-            except Exception:
-                continue
+        if not https_ports:
+            return []
         
+        certs = await self.ssl_cert_grabber.grab_certificates_batch(
+            [(host_ip, port) for port in https_ports]
+        )
+        domains = set()
+        for cert_data in certs.values():
+            domains.update(cert_data.get('domains') or [])
         return list(domains)
     
-    def _get_http_domains(self, host_ip: str) -> List[str]:
-        """Get domains from HTTP response headers"""
-        domains = set()
-        
-        # Common HTTP ports
-        http_ports = [80, 8080, 8000, 8008, 8888, 3000, 5000]
-        
-        for port in http_ports:
-            try:
-                with socket.create_connection((host_ip, port), timeout=self.timeout) as sock:
-                    # Send HTTP request
-                    request = f"GET / HTTP/1.1\r\nHost: {host_ip}\r\n\r\n"
-                    sock.send(request.encode())
-                    
-                    # Read response
-                    response = sock.recv(4096).decode('utf-8', errors='ignore')
-                    
-                    # Look for domain patterns in headers
-                    domain_patterns = [
-                        r'Server:\s*([^\r\n]+)',
-                        r'X-Powered-By:\s*([^\r\n]+)',
-                        r'Location:\s*https?://([^/\r\n]+)',
-                        r'Set-Cookie:.*domain=([^;\r\n]+)',
-                    ]
-                    
-                    for pattern in domain_patterns:
-                        matches = re.findall(pattern, response, re.IGNORECASE)
-                        for match in matches:
-                            if self._is_valid_domain(match):
-                                domains.add(match)
-                                
-            except Exception:
-                continue
+    async def _get_http_domains(self, host_ip: str, http_ports: List[int]) -> List[str]:
+        """Get domains from HTTP redirects and cookie scopes"""
+        if not http_ports:
+            return []
         
+        fingerprints = await self.http_fingerprinter.fingerprint_batch(
+            [(host_ip, port) for port in http_ports]
+        )
+        domains = set()
+        for fingerprint in fingerprints.values():
+            domains.update(fingerprint.domains)
         return list(domains)
     
-    def _get_dns_domains(self, host_ip: str) -> List[str]:
-        """Get domains from DNS PTR records"""
-        domains = set()
-        
-        if not DNS_AVAILABLE:
-            return list(domains)
-        
+    async def _get_dns_domains(self, host_ip: str) -> List[str]:
+        """Get domains from a single (cached) DNS PTR lookup"""
         try:
-            # Create reverse DNS query
-            reverse_name = dns.reversename.from_address(host_ip)
-            
-            # Query PTR record
-            resolver = dns.resolver.Resolver()
-            resolver.timeout = self.timeout
-            resolver.lifetime = self.timeout
-            
-            answers = resolver.resolve(reverse_name, 'PTR')
-            for answer in answers:
-                domain = str(answer).rstrip('.')
-                if self._is_valid_domain(domain):
-                    domains.add(domain)
-                    
-        except Exception:
-            pass
-        
-        return list(domains)
+            names = await self.dns_resolver.resolve_ptr(host_ip)
+        except Exception as e:
+            logger.debug(f"PTR lookup failed for {host_ip}: {e}")
+            return []
+        return [name for name in names if self._is_valid_domain(name)]
     
     def _is_valid_domain(self, domain: str) -> bool:
         """Check if a string is a valid domain name"""
@@ -220,26 +158,23 @@ class DomainEnumerator:
         Returns:
             Dictionary mapping IP to list of domains
         """
-        tasks = []
-        for host_ip in host_ips:
-            task = self.enumerate_domains(host_ip)
-            tasks.append((host_ip, task))
+        domain_lists = await asyncio.gather(
+            *(self.enumerate_domains(host_ip) for host_ip in host_ips),
+            return_exceptions=True,
+        )
         
         results = {}
-        for host_ip, task in tasks:
-            try:
-                domains = await task
-                if domains:
-                    results[host_ip] = domains
-            except Exception as e:
-                logger.debug(f"Batch domain enumeration failed for {host_ip}: {e}")
+        for host_ip, domains in zip(host_ips, domain_lists):
+            if isinstance(domains, Exception):
+                logger.debug(f"Batch domain enumeration failed for {host_ip}: {domains}")
+            elif domains:
+                results[host_ip] = domains
         
         return results
     
     def cleanup(self):
         """Clean up resources"""
-        if self.executor:
-            self.executor.shutdown(wait=True)
+        # Probes use the shared async clients; nothing is pooled here
 
 
 # Global domain enumerator instance
@@ -0,0 +1,162 @@
+"""
+Geolocation cache keyed by network range, so one lookup answers every address in the same allocation
+"""
+import bisect
+import ipaddress
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+class PrefixRangeCache:
+    """Sorted, non-overlapping address ranges mapped to location data, searched with bisect"""
+
+    def __init__(self, ttl: float = None, max_entries: int = None,
+                 ipv4_prefix: int = None, ipv6_prefix: int = None):
+        """
+        Args:
+            ttl: Seconds a cached range stays valid (default: GEOLOCATION_RANGE_CACHE_TTL)
+            max_entries: Ranges kept before the soonest-expiring are evicted (default: GEOLOCATION_RANGE_CACHE_SIZE)
+            ipv4_prefix: Range assumed for IPv4 results without a network (default: GEOLOCATION_RANGE_PREFIX_V4)
+            ipv6_prefix: Range assumed for IPv6 results without a network (default: GEOLOCATION_RANGE_PREFIX_V6)
+        """
+        self.ttl = ttl or getattr(settings, 'GEOLOCATION_RANGE_CACHE_TTL', 86400)
+        self.max_entries = max_entries or getattr(settings, 'GEOLOCATION_RANGE_CACHE_SIZE', 100000)
+        self.prefixes = {
+            4: ipv4_prefix or getattr(settings, 'GEOLOCATION_RANGE_PREFIX_V4', 24),
+            6: ipv6_prefix or getattr(settings, 'GEOLOCATION_RANGE_PREFIX_V6', 48),
+        }
+        # Per IP version: range starts (for bisect) and parallel (start, end, network, data, expires_at) entries
+        self._starts: Dict[int, List[int]] = {4: [], 6: []}
+        self._entries: Dict[int, List[Tuple[int, int, str, Dict, float]]] = {4: [], 6: []}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries[4]) + len(self._entries[6])
+
+    def get(self, ip_address: str) -> Optional[Dict]:
+        """
+        Location data for any cached range containing the address
+
+        Args:
+            ip_address: IP address to look up
+
+        Returns:
+            Copy of the cached data with 'ip' set to the address, or None on a miss
+        """
+        try:
+            ip = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+        value = int(ip)
+        with self._lock:
+            starts, entries = self._starts[ip.version], self._entries[ip.version]
+            i = bisect.bisect_right(starts, value) - 1
+            if i < 0:
+                return None
+            start, end, network, data, expires_at = entries[i]
+            if value > end:
+                return None
+            if expires_at <= time.monotonic():
+                del starts[i], entries[i]
+                return None
+        return dict(data, ip=ip_address, network=network)
+
+    def add(self, ip_address: str, data: Dict) -> Optional[str]:
+        """
+        Cache a lookup result for the network it came from
+
+        The provider-reported 'network' is used when it contains the address,
+        otherwise the configured fallback prefix around the address. Newer
+        ranges replace any cached ranges they overlap.
+
+        Args:
+            ip_address: Address that was looked up
+            data: Location data returned for it
+
+        Returns:
+            The cached network, or None if the address is invalid
+        """
+        try:
+            network = self._network_for(ipaddress.ip_address(ip_address), data.get('network'))
+        except ValueError:
+            return None
+        start, end = int(network.network_address), int(network.broadcast_address)
+        entry = (start, end, str(network), dict(data), time.monotonic() + self.ttl)
+        with self._lock:
+            starts, entries = self._starts[network.version], self._entries[network.version]
+            # Cached ranges never overlap, so the ones this range covers are contiguous
+            first = bisect.bisect_right(starts, start) - 1
+            if first < 0 or entries[first][1] < start:
+                first += 1
+            last = bisect.bisect_right(starts, end)
+            starts[first:last] = [start]
+            entries[first:last] = [entry]
+            if len(self) > self.max_entries:
+                self._evict()
+        return str(network)
+
+    def clear(self) -> None:
+        with self._lock:
+            for version in (4, 6):
+                self._starts[version].clear()
+                self._entries[version].clear()
+
+    def fallback_network(self, ip_address: str) -> Optional[str]:
+        """Network a result for the address is cached under when the provider reports none"""
+        try:
+            return str(self._network_for(ipaddress.ip_address(ip_address), None))
+        except ValueError:
+            return None
+
+    def _network_for(self, ip: Union[ipaddress.IPv4Address, ipaddress.IPv6Address],
+                     reported: Optional[str]) -> IPNetwork:
+        """Provider network when it is valid for the address, else the fallback prefix"""
+        if reported:
+            try:
+                network = ipaddress.ip_network(reported, strict=False)
+                if ip in network:
+                    return network
+            except ValueError:
+                pass
+        return ipaddress.ip_network(f"{ip}/{self.prefixes[ip.version]}", strict=False)
+
+    def _evict(self) -> None:
+        """Drop expired ranges, then the soonest-expiring tenth if still over capacity (lock held)"""
+        now = time.monotonic()
+        for version in (4, 6):
+            kept = [entry for entry in self._entries[version] if entry[4] > now]
+            self._entries[version] = kept
+            self._starts[version] = [entry[0] for entry in kept]
+        excess = len(self) - self.max_entries
+        if excess <= 0:
+            return
+        excess += self.max_entries // 10
+        doomed = sorted(
+            ((entry[4], version, entry[0]) for version in (4, 6) for entry in self._entries[version])
+        )[:excess]
+        for version in (4, 6):
+            drop = {start for _, v, start in doomed if v == version}
+            kept = [entry for entry in self._entries[version] if entry[0] not in drop]
+            self._entries[version] = kept
+            self._starts[version] = [entry[0] for entry in kept]
+        logger.debug(f"Evicted {len(doomed)} geolocation ranges")
+
+
+# Global range cache instance
+_prefix_range_cache = None
+
+def get_prefix_range_cache() -> PrefixRangeCache:
+    """Get the global prefix range cache instance"""
+    global _prefix_range_cache
+    if _prefix_range_cache is None:
+        _prefix_range_cache = PrefixRangeCache()
+    return _prefix_range_cache
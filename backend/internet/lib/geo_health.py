@@ -0,0 +1,142 @@
+"""
+Per-provider health for remote geolocation: circuit breakers, recent success rate and latency
+"""
+import logging
+import math
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+
+from .circuit_breaker import CircuitBreaker
+
+try:
+    from metrics.metrics import (
+        geolocation_provider_circuit_state,
+        geolocation_provider_latency_seconds,
+        geolocation_provider_p50_latency_seconds,
+        geolocation_provider_requests_total,
+        geolocation_provider_success_rate,
+    )
+    METRICS_AVAILABLE = True
+except ImportError:
+    METRICS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+CIRCUIT_STATE_VALUES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+
+class ProviderHealth:
+    """Circuit breaker plus a sliding window of recent calls for one provider.
+
+    Thread-safe: the sync lookup path calls providers from worker threads.
+    """
+
+    def __init__(self, name: str, window: int = None, failure_threshold: int = None,
+                 recovery_timeout: float = None, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            name: Provider name, used as the metrics label
+            window: Recent calls kept for success rate and latency (default: GEOLOCATION_HEALTH_WINDOW)
+            failure_threshold: Consecutive failures that open the circuit (default: GEOLOCATION_BREAKER_FAILURES)
+            recovery_timeout: Seconds before a half-open probe (default: GEOLOCATION_BREAKER_RECOVERY)
+            clock: Monotonic time source (injectable for tests)
+        """
+        self.name = name
+        self.breaker = CircuitBreaker(
+            failure_threshold=failure_threshold or getattr(settings, 'GEOLOCATION_BREAKER_FAILURES', 5),
+            recovery_timeout=recovery_timeout or getattr(settings, 'GEOLOCATION_BREAKER_RECOVERY', 60),
+            name=f"geolocation {name}",
+            clock=clock,
+        )
+        # (succeeded, seconds, addresses) per call, newest last
+        self._calls = deque(maxlen=window or getattr(settings, 'GEOLOCATION_HEALTH_WINDOW', 50))
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self.breaker.state
+
+    @property
+    def success_rate(self) -> Optional[float]:
+        """Share of recent calls that succeeded, None before the first call"""
+        with self._lock:
+            if not self._calls:
+                return None
+            return sum(1 for ok, _, _ in self._calls if ok) / len(self._calls)
+
+    @property
+    def p50_latency(self) -> Optional[float]:
+        """Median seconds of recent successful calls, None before the first success"""
+        with self._lock:
+            latencies = [seconds for ok, seconds, _ in self._calls if ok]
+        return statistics.median(latencies) if latencies else None
+
+    @property
+    def cost(self) -> float:
+        """Lower is better: median seconds per answered address, inflated by the failure rate"""
+        with self._lock:
+            per_address = [seconds / addresses for ok, seconds, addresses in self._calls if ok]
+            if not per_address:
+                return math.inf
+            return statistics.median(per_address) * len(self._calls) / len(per_address)
+
+    def allow(self) -> bool:
+        """Whether a call may go through now (reserves the probe slot when half-open)"""
+        with self._lock:
+            allowed = self.breaker.allow()
+        if not allowed and METRICS_AVAILABLE:
+            geolocation_provider_requests_total.labels(provider=self.name, outcome='rejected').inc()
+        return allowed
+
+    def release(self) -> None:
+        """Hand back an allowed call that was never made"""
+        with self._lock:
+            self.breaker.release()
+
+    def record(self, succeeded: bool, seconds: float, addresses: int = 1) -> None:
+        """
+        Feed a call outcome into the breaker and the recent-call window
+
+        Args:
+            succeeded: False for transport errors, timeouts and error statuses
+            seconds: Call duration
+            addresses: Addresses the call looked up
+        """
+        with self._lock:
+            self._calls.append((succeeded, seconds, max(1, addresses)))
+            if succeeded:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+        if METRICS_AVAILABLE:
+            self._export(succeeded, seconds)
+
+    def snapshot(self) -> Dict:
+        """Current health figures for logs and status output"""
+        return {
+            'provider': self.name,
+            'state': self.state,
+            'success_rate': self.success_rate,
+            'p50_latency': self.p50_latency,
+            'calls': len(self._calls),
+            'consecutive_failures': self.breaker.failures,
+        }
+
+    def _export(self, succeeded: bool, seconds: float) -> None:
+        labels = {'provider': self.name}
+        geolocation_provider_requests_total.labels(
+            outcome='success' if succeeded else 'failure', **labels
+        ).inc()
+        geolocation_provider_latency_seconds.labels(**labels).observe(seconds)
+        geolocation_provider_circuit_state.labels(**labels).set(CIRCUIT_STATE_VALUES[self.state])
+        geolocation_provider_success_rate.labels(**labels).set(self.success_rate)
+        p50 = self.p50_latency
+        if p50 is not None:
+            geolocation_provider_p50_latency_seconds.labels(**labels).set(p50)
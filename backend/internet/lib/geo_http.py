@@ -0,0 +1,99 @@
+"""
+Pooled asyncio HTTP client for the remote geolocation providers
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Mapping
+
+from django.conf import settings
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+from .geo_providers import ProviderRequest
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProviderResponse:
+    """Status, headers and decoded body of one provider call"""
+    status: int
+    headers: Mapping[str, str]
+    # Decoded JSON; None for error statuses
+    payload: Any = None
+
+
+class GeoHTTPClient:
+    """Keep-alive HTTP/1.1 connection pool shared by every provider request.
+
+    aiohttp sessions belong to the event loop that created them, so the
+    session is recreated when the client is used from a different loop.
+    """
+
+    def __init__(self, limit: int = None, limit_per_host: int = None, timeout: float = None,
+                 keepalive_timeout: float = None):
+        """
+        Args:
+            limit: Open connections across all providers (default: GEOLOCATION_HTTP_POOL_SIZE)
+            limit_per_host: Open connections per provider host (default: GEOLOCATION_HTTP_POOL_PER_HOST)
+            timeout: Total seconds per request (default: GEOLOCATION_HTTP_TIMEOUT)
+            keepalive_timeout: Seconds idle connections are kept open (default: GEOLOCATION_HTTP_KEEPALIVE)
+        """
+        self.limit = limit or getattr(settings, 'GEOLOCATION_HTTP_POOL_SIZE', 100)
+        self.limit_per_host = limit_per_host or getattr(settings, 'GEOLOCATION_HTTP_POOL_PER_HOST', 10)
+        self.timeout = timeout or getattr(settings, 'GEOLOCATION_HTTP_TIMEOUT', 10)
+        self.keepalive_timeout = keepalive_timeout or getattr(settings, 'GEOLOCATION_HTTP_KEEPALIVE', 30)
+        self._session = None
+        self._loop = None
+
+    async def fetch(self, request: ProviderRequest) -> ProviderResponse:
+        """
+        Send a provider request over a pooled connection
+
+        Args:
+            request: Request built by a provider adapter
+
+        Returns:
+            ProviderResponse; error statuses are returned, not raised, so limits can be read from them
+        """
+        session = self._get_session()
+        async with session.request(
+            request.method, request.url, params=request.params or None,
+            headers=request.headers or None, json=request.json
+        ) as response:
+            if response.status >= 400:
+                # Drain the body so the connection goes back to the pool
+                await response.read()
+                return ProviderResponse(response.status, response.headers)
+            payload = await response.json(content_type=None)
+            return ProviderResponse(response.status, response.headers, payload)
+
+    async def close(self) -> None:
+        """Close the pooled connections of the current event loop's session"""
+        session = self._session
+        if session is not None and self._loop is asyncio.get_running_loop():
+            self._session = None
+            self._loop = None
+            await session.close()
+
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._loop = loop
+            logger.debug(f"Opened geolocation HTTP pool ({self.limit} connections, {self.limit_per_host} per host)")
+        return self._session
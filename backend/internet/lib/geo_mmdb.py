@@ -0,0 +1,165 @@
+"""
+Offline geolocation from GeoLite2/DB-IP compatible .mmdb databases through memory-mapped readers
+"""
+import ipaddress
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+
+try:
+    import maxminddb
+    MAXMINDDB_AVAILABLE = True
+except ImportError:
+    MAXMINDDB_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class _MMDBFile:
+    """A memory-mapped reader for one database file, reopened when the file is replaced"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.reader = None
+        self._identity = None
+
+    def refresh(self) -> None:
+        """Open the file, or reopen it if a new file was moved into place"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            if self.reader is not None:
+                logger.warning(f"MMDB database {self.path} disappeared, keeping the loaded copy")
+            return
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if identity == self._identity:
+            return
+        try:
+            reader = maxminddb.open_database(self.path, maxminddb.MODE_MMAP)
+        except Exception as e:
+            logger.error(f"Failed to open MMDB database {self.path}: {e}")
+            return
+        # Swap the reference only; lookups still holding the old reader finish on the old mapping
+        self.reader = reader
+        self._identity = identity
+        logger.info(f"Loaded MMDB database {self.path} ({reader.metadata().database_type})")
+
+    def get(self, ip: str) -> Tuple[Optional[Dict], int]:
+        reader = self.reader
+        if reader is None:
+            return None, 0
+        return reader.get_with_prefix_len(ip)
+
+
+class MMDBGeolocationProvider:
+    """Look up IPs in local City and (optionally) ASN databases"""
+
+    name = 'mmdb'
+
+    def __init__(self, city_path: str = None, asn_path: str = None, check_interval: float = None):
+        """
+        Args:
+            city_path: GeoLite2-City / DB-IP City database (default: GEOLOCATION_MMDB_PATH)
+            asn_path: GeoLite2-ASN / DB-IP ASN database (default: GEOLOCATION_MMDB_ASN_PATH)
+            check_interval: Seconds between checks for a replaced file (default: GEOLOCATION_MMDB_CHECK_INTERVAL)
+        """
+        city_path = city_path if city_path is not None else getattr(settings, 'GEOLOCATION_MMDB_PATH', '')
+        asn_path = asn_path if asn_path is not None else getattr(settings, 'GEOLOCATION_MMDB_ASN_PATH', '')
+        self.check_interval = (
+            check_interval if check_interval is not None
+            else getattr(settings, 'GEOLOCATION_MMDB_CHECK_INTERVAL', 60)
+        )
+        if (city_path or asn_path) and not MAXMINDDB_AVAILABLE:
+            logger.warning("maxminddb is not installed, offline geolocation is disabled")
+        self._city = _MMDBFile(city_path) if MAXMINDDB_AVAILABLE and city_path else None
+        self._asn = _MMDBFile(asn_path) if MAXMINDDB_AVAILABLE and asn_path else None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether a City database is configured"""
+        return self._city is not None
+
+    def lookup(self, ip_address: str) -> Optional[Dict]:
+        """
+        Geolocate an IP from the local databases
+
+        Args:
+            ip_address: IP address to geolocate
+
+        Returns:
+            Location data in the remote providers' format plus the database network,
+            or None when the City database has no record for the address
+        """
+        if self._city is None:
+            return None
+        self._refresh_if_due()
+        try:
+            city, prefix_len = self._city.get(ip_address)
+        except ValueError:
+            return None
+        if not city:
+            return None
+
+        location = city.get('location') or {}
+        subdivisions = city.get('subdivisions') or [{}]
+        data = {
+            'ip': ip_address,
+            'country': _name(city.get('country')),
+            'country_code': (city.get('country') or {}).get('iso_code'),
+            'region': _name(subdivisions[0]),
+            'city': _name(city.get('city')),
+            'latitude': location.get('latitude'),
+            'longitude': location.get('longitude'),
+            'timezone': location.get('time_zone'),
+            'network': str(ipaddress.ip_network(f"{ip_address}/{prefix_len}", strict=False)),
+            'provider': self.name,
+        }
+
+        if self._asn is not None:
+            asn, _ = self._asn.get(ip_address)
+            if asn:
+                number = asn.get('autonomous_system_number')
+                organization = asn.get('autonomous_system_organization')
+                data['isp'] = organization
+                data['organization'] = organization
+                if number:
+                    # Same "AS<number> <org>" form that ip-api.com reports
+                    data['asn'] = f"AS{number} {organization}" if organization else f"AS{number}"
+        return data
+
+    def reload(self) -> None:
+        """Check for replaced database files now"""
+        with self._lock:
+            for db in (self._city, self._asn):
+                if db is not None:
+                    db.refresh()
+            self._checked_at = time.monotonic()
+
+    def _refresh_if_due(self) -> None:
+        """Stat the files at most every check_interval seconds; updates are installed with os.replace"""
+        checked_at = self._checked_at
+        if checked_at is not None and time.monotonic() - checked_at < self.check_interval:
+            return
+        self.reload()
+
+
+def _name(record: Optional[Dict]) -> Optional[str]:
+    """English name of a country/subdivision/city record"""
+    return ((record or {}).get('names') or {}).get('en')
+
+
+# Global MMDB provider instance
+_mmdb_provider = None
+
+def get_mmdb_provider() -> MMDBGeolocationProvider:
+    """Get the global MMDB geolocation provider instance"""
+    global _mmdb_provider
+    if _mmdb_provider is None:
+        _mmdb_provider = MMDBGeolocationProvider()
+    return _mmdb_provider
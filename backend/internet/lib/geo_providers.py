@@ -0,0 +1,246 @@
+"""
+Remote geolocation API adapters: request building, response parsing and per-provider rate limits
+"""
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional
+
+from django.conf import settings
+
+from .rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProviderRequest:
+    """One HTTP call an adapter wants made, and the bucket that pays for it"""
+    method: str
+    url: str
+    limiter: TokenBucket
+    params: Dict[str, str] = field(default_factory=dict)
+    headers: Dict[str, str] = field(default_factory=dict)
+    json: Any = None
+
+
+class GeoProvider(ABC):
+    """Adapter between the geolocation service and one remote API.
+
+    Adapters only describe requests and interpret responses; the service
+    owns the transport, so every provider shares its connection handling.
+    """
+
+    name = ''
+    # Endpoint root, overridable per provider name in GEOLOCATION_PROVIDER_URLS
+    base_url = ''
+    # Addresses per request; above 1 the service coalesces lookups into batches
+    batch_size = 1
+    # Default quota, overridable per provider name in GEOLOCATION_PROVIDER_RATE_LIMITS
+    requests_per_minute = 60
+
+    def __init__(self, requests_per_minute: float = None, base_url: str = None):
+        self.base_url = (
+            base_url or getattr(settings, 'GEOLOCATION_PROVIDER_URLS', {}).get(self.name) or self.base_url
+        ).rstrip('/')
+        self.limiter = self._bucket(self.name, requests_per_minute or self.requests_per_minute)
+
+    @property
+    def supports_batch(self) -> bool:
+        return self.batch_size > 1
+
+    @abstractmethod
+    def build_request(self, ips: List[str]) -> ProviderRequest:
+        """
+        Describe the call that looks up the given addresses
+
+        Args:
+            ips: Up to batch_size addresses
+
+        Returns:
+            ProviderRequest for the service to send
+        """
+
+    @abstractmethod
+    def parse(self, ips: List[str], payload: Any) -> Dict[str, Optional[Dict]]:
+        """
+        Turn a decoded JSON response into location data per requested address
+
+        Args:
+            ips: Addresses the request was built for
+            payload: Decoded response body
+
+        Returns:
+            Location data (or None) for each requested address
+        """
+
+    def update_limits(self, request: ProviderRequest, status: int, headers: Mapping[str, str]) -> None:
+        """Feed rate limit information from a response back into the request's bucket"""
+        if status == 429:
+            request.limiter.penalize(_header_float(headers, 'Retry-After', 60.0))
+
+    @staticmethod
+    def _bucket(name: str, default_rpm: float) -> TokenBucket:
+        """Token bucket allowing a minute's quota as burst"""
+        rpm = getattr(settings, 'GEOLOCATION_PROVIDER_RATE_LIMITS', {}).get(name, default_rpm)
+        return TokenBucket(rate=rpm / 60.0, capacity=rpm, name=name)
+
+
+class IPAPIProvider(GeoProvider):
+    """ip-api.com: free, no key; single lookups and a 100-address batch endpoint with separate quotas"""
+
+    name = 'ip-api.com'
+    base_url = 'http://ip-api.com'
+    batch_size = 100
+    requests_per_minute = 45
+    batch_requests_per_minute = 15
+    fields = 'status,message,country,countryCode,region,regionName,city,lat,lon,timezone,isp,org,as,query'
+
+    def __init__(self, requests_per_minute: float = None, batch_requests_per_minute: float = None,
+                 base_url: str = None):
+        super().__init__(requests_per_minute, base_url)
+        self.batch_limiter = self._bucket(
+            f'{self.name}/batch', batch_requests_per_minute or self.batch_requests_per_minute
+        )
+
+    def build_request(self, ips: List[str]) -> ProviderRequest:
+        if len(ips) == 1:
+            return ProviderRequest('GET', f'{self.base_url}/json/{ips[0]}', self.limiter,
+                                   params={'fields': self.fields})
+        return ProviderRequest('POST', f'{self.base_url}/batch', self.batch_limiter,
+                               params={'fields': self.fields}, json=list(ips))
+
+    def parse(self, ips: List[str], payload: Any) -> Dict[str, Optional[Dict]]:
+        records = payload if isinstance(payload, list) else [payload]
+        found = {
+            record.get('query'): self._location(record)
+            for record in records
+            if isinstance(record, dict) and record.get('status') == 'success'
+        }
+        return {ip: found.get(ip) for ip in ips}
+
+    def update_limits(self, request: ProviderRequest, status: int, headers: Mapping[str, str]) -> None:
+        # X-Rl: requests left in the current window, X-Ttl: seconds until it resets
+        remaining = _header_float(headers, 'X-Rl')
+        reset_after = _header_float(headers, 'X-Ttl')
+        if status == 429:
+            request.limiter.penalize(reset_after if reset_after is not None else 60.0)
+        elif remaining is not None and reset_after is not None:
+            request.limiter.update(remaining, reset_after)
+
+    @staticmethod
+    def _location(data: Dict) -> Dict:
+        return {
+            'ip': data.get('query'),
+            'country': data.get('country'),
+            'country_code': data.get('countryCode'),
+            'region': data.get('regionName'),
+            'city': data.get('city'),
+            'latitude': data.get('lat'),
+            'longitude': data.get('lon'),
+            'timezone': data.get('timezone'),
+            'isp': data.get('isp'),
+            'organization': data.get('org'),
+            'asn': data.get('as'),
+            'provider': 'ip-api.com'
+        }
+
+
+class IPInfoProvider(GeoProvider):
+    """ipinfo.io: free tier, higher limits with IPINFO_TOKEN"""
+
+    name = 'ipinfo.io'
+    base_url = 'https://ipinfo.io'
+    requests_per_minute = 60
+
+    def build_request(self, ips: List[str]) -> ProviderRequest:
+        headers = {}
+        token = getattr(settings, 'IPINFO_TOKEN', None)
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        return ProviderRequest('GET', f'{self.base_url}/{ips[0]}/json', self.limiter, headers=headers)
+
+    def parse(self, ips: List[str], payload: Any) -> Dict[str, Optional[Dict]]:
+        if 'error' in payload:
+            return {ips[0]: None}
+        loc = payload.get('loc', '').split(',')
+        return {ips[0]: {
+            'ip': payload.get('ip'),
+            'country': payload.get('country'),
+            'region': payload.get('region'),
+            'city': payload.get('city'),
+            'latitude': float(loc[0]) if len(loc) > 0 and loc[0] else None,
+            'longitude': float(loc[1]) if len(loc) > 1 and loc[1] else None,
+            'timezone': payload.get('timezone'),
+            'isp': payload.get('org'),
+            'postal': payload.get('postal'),
+            'provider': 'ipinfo.io'
+        }}
+
+
+class FreeIPAPIProvider(GeoProvider):
+    """freeipapi.com: free, no key"""
+
+    name = 'freeipapi.com'
+    base_url = 'https://freeipapi.com'
+    requests_per_minute = 60
+
+    def build_request(self, ips: List[str]) -> ProviderRequest:
+        return ProviderRequest('GET', f'{self.base_url}/api/json/{ips[0]}', self.limiter)
+
+    def parse(self, ips: List[str], payload: Any) -> Dict[str, Optional[Dict]]:
+        return {ips[0]: {
+            'ip': ips[0],
+            'country': payload.get('countryName'),
+            'country_code': payload.get('countryCode'),
+            'region': payload.get('regionName'),
+            'city': payload.get('cityName'),
+            'latitude': payload.get('latitude'),
+            'longitude': payload.get('longitude'),
+            'timezone': payload.get('timeZone'),
+            'provider': 'freeipapi.com'
+        }}
+
+
+class IPGeolocationProvider(GeoProvider):
+    """ipgeolocation.io: free tier of 1000 requests/day, IPGEOLOCATION_API_KEY for more"""
+
+    name = 'ipgeolocation.io'
+    base_url = 'https://api.ipgeolocation.io'
+    requests_per_minute = 1
+
+    def build_request(self, ips: List[str]) -> ProviderRequest:
+        params = {'ip': ips[0]}
+        api_key = getattr(settings, 'IPGEOLOCATION_API_KEY', None)
+        if api_key:
+            params['apiKey'] = api_key
+        return ProviderRequest('GET', f'{self.base_url}/ipgeo', self.limiter, params=params)
+
+    def parse(self, ips: List[str], payload: Any) -> Dict[str, Optional[Dict]]:
+        if 'message' in payload:  # An error message means failure
+            return {ips[0]: None}
+        return {ips[0]: {
+            'ip': payload.get('ip'),
+            'country': payload.get('country_name'),
+            'country_code': payload.get('country_code2'),
+            'region': payload.get('state_prov'),
+            'city': payload.get('city'),
+            'latitude': float(payload.get('latitude')) if payload.get('latitude') else None,
+            'longitude': float(payload.get('longitude')) if payload.get('longitude') else None,
+            'timezone': payload.get('time_zone', {}).get('name'),
+            'isp': payload.get('isp'),
+            'provider': 'ipgeolocation.io'
+        }}
+
+
+def default_providers() -> List[GeoProvider]:
+    """Remote providers in fallback order"""
+    return [IPAPIProvider(), IPInfoProvider(), FreeIPAPIProvider(), IPGeolocationProvider()]
+
+
+def _header_float(headers: Mapping[str, str], name: str, default: float = None) -> Optional[float]:
+    """Numeric response header, or default when missing or malformed"""
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return default
@@ -2,27 +2,105 @@ import requests
 import logging
 import time
 import asyncio
+import weakref
 import concurrent.futures
-from typing import Dict, Optional, List
+from typing import Awaitable, Callable, Dict, Optional, List
 from django.conf import settings
 from django.core.cache import cache
 from asgiref.sync import sync_to_async
 
+from .circuit_breaker import CircuitBreaker
+from .geo_cache import PrefixRangeCache, get_prefix_range_cache
+from .geo_health import ProviderHealth
+from .geo_http import AIOHTTP_AVAILABLE, GeoHTTPClient
+from .geo_mmdb import MMDBGeolocationProvider, get_mmdb_provider
+from .geo_providers import GeoProvider, ProviderRequest, default_providers
+
 logger = logging.getLogger(__name__)
 
 
+class ProviderHTTPError(Exception):
+    """A geolocation provider answered with an error status"""
+
+
+class _BatchAccumulator:
+    """Coalesces concurrent lookups for one batch-capable provider into batch requests"""
+    
+    def __init__(self, provider: GeoProvider,
+                 send: Callable[[GeoProvider, List[str]], Awaitable[Dict[str, Optional[Dict]]]],
+                 linger: float):
+        self.provider = provider
+        self.linger = linger
+        self._send = send
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._timer = None
+        self._tasks = set()
+    
+    async def lookup(self, ip_address: str) -> Optional[Dict]:
+        """Queue an address for the next batch and wait for its result"""
+        future = self._pending.get(ip_address)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[ip_address] = future
+            if len(self._pending) >= self.provider.batch_size:
+                self._flush()
+            elif self._timer is None:
+                # Give concurrent callers a moment to fill the batch
+                self._timer = loop.call_later(self.linger, self._flush)
+        # Shared by every caller asking for the address; one being cancelled must not cancel the rest
+        return await asyncio.shield(future)
+    
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._send_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _send_batch(self, batch: Dict[str, asyncio.Future]) -> None:
+        results = {}
+        try:
+            results = await self._send(self.provider, list(batch))
+        finally:
+            for ip, future in batch.items():
+                if not future.done():
+                    future.set_result(results.get(ip))
+
+
 class GeolocationService:
     """IP Geolocation service with multiple providers, caching, and async support"""
     
-    def __init__(self, max_workers: int = 10):
-        self.providers = [
-            self._get_ipapi_data,
-            self._get_ipinfo_data,
-            self._get_freeipapi_data,
-            self._get_ipgeolocation_data
-        ]
+    def __init__(self, max_workers: int = 10, mmdb_provider: MMDBGeolocationProvider = None,
+                 range_cache: PrefixRangeCache = None, providers: List[GeoProvider] = None,
+                 http_client: GeoHTTPClient = None):
+        # Local database first; the remote APIs are only asked about addresses it does not cover
+        self.mmdb_provider = mmdb_provider or get_mmdb_provider()
+        # Remote results answer later lookups anywhere in the same network
+        self.range_cache = range_cache or get_prefix_range_cache()
+        # Remote APIs in configured order, each paced by its own token buckets
+        self.providers = providers if providers is not None else default_providers()
+        # Breakers and recent latency per provider name; lookups try the healthiest, fastest first
+        self.health: Dict[str, ProviderHealth] = {}
+        # Longest a lookup waits for a provider's quota before falling through to the next one
+        self.max_wait = getattr(settings, 'GEOLOCATION_RATE_LIMIT_MAX_WAIT', 60)
+        # How long a batch waits for more concurrent lookups before it is sent part-full
+        self.batch_linger = getattr(settings, 'GEOLOCATION_BATCH_LINGER', 0.05)
+        self.timeout = getattr(settings, 'GEOLOCATION_HTTP_TIMEOUT', 10)
+        # Async lookups share one keep-alive pool; without aiohttp they fall back to the thread pool
+        self.http = http_client or (GeoHTTPClient() if AIOHTTP_AVAILABLE else None)
+        # Sync lookups reuse connections through a pooled requests session
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=len(self.providers) or 1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.max_workers = max_workers
         self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        # Batch accumulators hold futures, so they are kept per event loop
+        self._accumulators = weakref.WeakKeyDictionary()
     
     def get_location(self, ip_address: str) -> Optional[Dict]:
         """
@@ -34,31 +112,39 @@ class GeolocationService:
         Returns:
             Dictionary with location data or None if all providers fail
         """
-        # Check cache first
-        cache_key = f"geolocation:{ip_address}"
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            return cached_data
+        # Memory-mapped and in-process range lookups are cheaper than a cache round trip
+        data = self._get_local_data(ip_address) or self._get_cached_data(ip_address)
+        if data:
+            return data
         
         # Try each provider until one succeeds
-        for provider in self.providers:
+        for provider in self.ordered_providers():
+            health = self._get_health(provider)
+            if not health.allow():
+                continue
+            request = provider.build_request([ip_address])
+            if not request.limiter.acquire_blocking(max_wait=self.max_wait):
+                health.release()
+                logger.debug(f"Skipping {provider.name} for {ip_address}: rate limit window exhausted")
+                continue
+            started = time.monotonic()
             try:
-                data = provider(ip_address)
-                if data:
-                    # Cache successful result for 24 hours
-                    cache.set(cache_key, data, 86400)
-                    return data
+                data = self._call_provider(provider, request, [ip_address]).get(ip_address)
             except Exception as e:
-                logger.warning(f"Geolocation provider failed for {ip_address}: {e}")
+                health.record(False, time.monotonic() - started)
+                logger.warning(f"Geolocation provider {provider.name} failed for {ip_address}: {e}")
                 continue
+            health.record(True, time.monotonic() - started)
+            if data:
+                self._remember(ip_address, data)
+                return data
         
-        # Cache negative result for 1 hour to avoid repeated failures
-        cache.set(cache_key, None, 3600)
+        self._remember(ip_address, None)
         return None
     
     async def get_location_async(self, ip_address: str) -> Optional[Dict]:
         """
-        Async version of get_location using thread pool
+        Async version of get_location; concurrent calls share batch requests
         
         Args:
             ip_address: IP address to geolocate
@@ -66,152 +152,183 @@ class GeolocationService:
         Returns:
             Dictionary with location data or None if all providers fail
         """
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(self.executor, self.get_location, ip_address)
+        # Local hits are answered inline without a thread hop
+        data = self._get_local_data(ip_address)
+        if data:
+            return data
+        
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(self.executor, self._get_cached_data, ip_address)
+        if data:
+            return data
+        
+        for provider in self.ordered_providers():
+            if self._get_health(provider).state == CircuitBreaker.OPEN:
+                continue
+            if provider.supports_batch:
+                data = await self._get_accumulator(provider).lookup(ip_address)
+            else:
+                data = (await self._query(provider, [ip_address])).get(ip_address)
+            if data:
+                break
+        
+        await loop.run_in_executor(self.executor, self._remember, ip_address, data)
+        return data
     
     async def get_locations_batch_async(self, ip_addresses: List[str], 
-                                      batch_size: int = 20) -> Dict[str, Optional[Dict]]:
+                                      batch_size: int = 100) -> Dict[str, Optional[Dict]]:
         """
         Async batch geolocation with concurrent processing
         
         Args:
             ip_addresses: List of IP addresses to geolocate
-            batch_size: Number of concurrent requests
+            batch_size: Number of addresses in flight at once
             
         Returns:
             Dictionary mapping IP addresses to geolocation data
         """
         results = {}
         
-        # Process in batches to avoid overwhelming APIs
+        # One address per network goes first; the rest are then mostly answered by the range cache
+        leaders, followers = [], []
+        seen_networks = set()
+        for ip in ip_addresses:
+            network = self.range_cache.fallback_network(ip)
+            (followers if network in seen_networks else leaders).append(ip)
+            seen_networks.add(network)
+        
+        await self._resolve_batches(leaders, batch_size, results)
+        pending = []
+        for ip in followers:
+            data = self._get_local_data(ip)
+            if data:
+                results[ip] = data
+            else:
+                pending.append(ip)
+        await self._resolve_batches(pending, batch_size, results)
+        
+        return results
+    
+    async def _resolve_batches(self, ip_addresses: List[str], batch_size: int,
+                               results: Dict[str, Optional[Dict]]) -> None:
+        """Geolocate addresses batch_size at a time; provider token buckets do the pacing"""
         for i in range(0, len(ip_addresses), batch_size):
             batch = ip_addresses[i:i + batch_size]
             
-            # Create tasks for concurrent processing
-            tasks = [
-                self.get_location_async(ip) 
-                for ip in batch
-            ]
+            # Concurrent lookups are coalesced into provider batch requests
+            batch_results = await asyncio.gather(
+                *(self.get_location_async(ip) for ip in batch), return_exceptions=True
+            )
             
-            # Wait for batch completion
-            batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Process results
             for ip, result in zip(batch, batch_results):
                 if isinstance(result, Exception):
                     logger.error(f"Error geolocating {ip}: {result}")
                     results[ip] = None
                 else:
                     results[ip] = result
-            
-            # Rate limiting between batches
-            if i + batch_size < len(ip_addresses):
-                await asyncio.sleep(1)
-        
+    
+    async def _query(self, provider: GeoProvider, ip_addresses: List[str]) -> Dict[str, Optional[Dict]]:
+        """Send one rate-limited request to a provider; failures and skipped calls come back empty"""
+        health = self._get_health(provider)
+        if not health.allow():
+            return {}
+        request = provider.build_request(ip_addresses)
+        if not await request.limiter.acquire(max_wait=self.max_wait):
+            health.release()
+            logger.debug(f"Skipping {provider.name} for {len(ip_addresses)} address(es): rate limit window exhausted")
+            return {}
+        started = time.monotonic()
+        try:
+            results = await self._fetch(provider, request, ip_addresses)
+        except Exception as e:
+            health.record(False, time.monotonic() - started, len(ip_addresses))
+            logger.warning(f"Geolocation provider {provider.name} failed for {len(ip_addresses)} address(es): {e}")
+            return {}
+        health.record(True, time.monotonic() - started, len(ip_addresses))
         return results
     
-    def _get_ipapi_data(self, ip_address: str) -> Optional[Dict]:
-        """Get data from ip-api.com (free, no API key required)"""
-        url = f"http://ip-api.com/json/{ip_address}?fields=status,message,country,countryCode,region,regionName,city,lat,lon,timezone,isp,org,as,query"
-        
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data.get('status') == 'success':
-            return {
-                'ip': data.get('query'),
-                'country': data.get('country'),
-                'country_code': data.get('countryCode'),
-                'region': data.get('regionName'),
-                'city': data.get('city'),
-                'latitude': data.get('lat'),
-                'longitude': data.get('lon'),
-                'timezone': data.get('timezone'),
-                'isp': data.get('isp'),
-                'organization': data.get('org'),
-                'asn': data.get('as'),
-                'provider': 'ip-api.com'
-            }
-        return None
+    async def _fetch(self, provider: GeoProvider, request: ProviderRequest,
+                     ip_addresses: List[str]) -> Dict[str, Optional[Dict]]:
+        """Make the HTTP call on the event loop and let the provider adjust its limits from the response"""
+        if self.http is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, self._call_provider, provider, request, ip_addresses
+            )
+        response = await self.http.fetch(request)
+        provider.update_limits(request, response.status, response.headers)
+        if response.status >= 400:
+            raise ProviderHTTPError(f"{provider.name} returned HTTP {response.status}")
+        return provider.parse(ip_addresses, response.payload)
     
-    def _get_ipinfo_data(self, ip_address: str) -> Optional[Dict]:
-        """Get data from ipinfo.io (free tier available)"""
-        # You can add your API token here for higher limits
-        token = getattr(settings, 'IPINFO_TOKEN', None)
-        url = f"https://ipinfo.io/{ip_address}/json"
-        
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        
-        response = requests.get(url, headers=headers, timeout=10)
+    def _call_provider(self, provider: GeoProvider, request: ProviderRequest,
+                       ip_addresses: List[str]) -> Dict[str, Optional[Dict]]:
+        """Make the HTTP call from a thread and let the provider adjust its limits from the response"""
+        response = self.session.request(
+            request.method, request.url, params=request.params, headers=request.headers,
+            json=request.json, timeout=self.timeout
+        )
+        provider.update_limits(request, response.status_code, response.headers)
         response.raise_for_status()
-        data = response.json()
-        
-        if 'error' not in data:
-            loc = data.get('loc', '').split(',')
-            return {
-                'ip': data.get('ip'),
-                'country': data.get('country'),
-                'region': data.get('region'),
-                'city': data.get('city'),
-                'latitude': float(loc[0]) if len(loc) > 0 and loc[0] else None,
-                'longitude': float(loc[1]) if len(loc) > 1 and loc[1] else None,
-                'timezone': data.get('timezone'),
-                'isp': data.get('org'),
-                'postal': data.get('postal'),
-                'provider': 'ipinfo.io'
-            }
-        return None
+        return provider.parse(ip_addresses, response.json())
     
-    def _get_freeipapi_data(self, ip_address: str) -> Optional[Dict]:
-        """Get data from freeipapi.com (free, no API key required)"""
-        url = f"https://freeipapi.com/api/json/{ip_address}"
-        
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        return {
-            'ip': ip_address,
-            'country': data.get('countryName'),
-            'country_code': data.get('countryCode'),
-            'region': data.get('regionName'),
-            'city': data.get('cityName'),
-            'latitude': data.get('latitude'),
-            'longitude': data.get('longitude'),
-            'timezone': data.get('timeZone'),
-            'provider': 'freeipapi.com'
-        }
+    def ordered_providers(self) -> List[GeoProvider]:
+        """Providers with open circuits last, the rest by median seconds per answered address"""
+        return sorted(
+            self.providers,
+            key=lambda p: (self._get_health(p).state == CircuitBreaker.OPEN, self._get_health(p).cost),
+        )
     
-    def _get_ipgeolocation_data(self, ip_address: str) -> Optional[Dict]:
-        """Get data from ipgeolocation.io (free tier available)"""
-        # You can add your API key here for higher limits
-        api_key = getattr(settings, 'IPGEOLOCATION_API_KEY', None)
-        url = f"https://api.ipgeolocation.io/ipgeo?ip={ip_address}"
-        
-        if api_key:
-            url += f"&apiKey={api_key}"
-        
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        if 'message' not in data:  # No error message means success
-            return {
-                'ip': data.get('ip'),
-                'country': data.get('country_name'),
-                'country_code': data.get('country_code2'),
-                'region': data.get('state_prov'),
-                'city': data.get('city'),
-                'latitude': float(data.get('latitude')) if data.get('latitude') else None,
-                'longitude': float(data.get('longitude')) if data.get('longitude') else None,
-                'timezone': data.get('time_zone', {}).get('name'),
-                'isp': data.get('isp'),
-                'provider': 'ipgeolocation.io'
-            }
-        return None
+    def provider_health(self) -> List[Dict]:
+        """Health snapshot of every provider, in the order lookups currently try them"""
+        return [self._get_health(provider).snapshot() for provider in self.ordered_providers()]
+    
+    async def close(self) -> None:
+        """Close the pooled async connections of the running event loop"""
+        if self.http is not None:
+            await self.http.close()
+    
+    def _get_health(self, provider: GeoProvider) -> ProviderHealth:
+        health = self.health.get(provider.name)
+        if health is None:
+            health = self.health.setdefault(provider.name, ProviderHealth(provider.name))
+        return health
+    
+    def _get_accumulator(self, provider: GeoProvider) -> _BatchAccumulator:
+        accumulators = self._accumulators.setdefault(asyncio.get_running_loop(), {})
+        accumulator = accumulators.get(provider.name)
+        if accumulator is None:
+            accumulator = _BatchAccumulator(provider, self._query, self.batch_linger)
+            accumulators[provider.name] = accumulator
+        return accumulator
+    
+    def _get_cached_data(self, ip_address: str) -> Optional[Dict]:
+        """Per-address result from the Django cache, also filed under its network range"""
+        data = cache.get(f"geolocation:{ip_address}")
+        if data:
+            self.range_cache.add(ip_address, data)
+        return data
+    
+    def _remember(self, ip_address: str, data: Optional[Dict]) -> None:
+        """Cache a provider result for 24 hours, or a failure for 1 hour"""
+        if data:
+            cache.set(f"geolocation:{ip_address}", data, 86400)
+            self.range_cache.add(ip_address, data)
+        else:
+            # Avoid repeated failures
+            cache.set(f"geolocation:{ip_address}", None, 3600)
+    
+    def _get_local_data(self, ip_address: str) -> Optional[Dict]:
+        """Answer from the MMDB database or a cached network range, without network I/O"""
+        return self._get_mmdb_data(ip_address) or self.range_cache.get(ip_address)
+    
+    def _get_mmdb_data(self, ip_address: str) -> Optional[Dict]:
+        """Get data from the local MMDB database, if one is configured"""
+        try:
+            return self.mmdb_provider.lookup(ip_address)
+        except Exception as e:
+            logger.warning(f"MMDB lookup failed for {ip_address}: {e}")
+            return None
 
 
 # Global instance
@@ -229,15 +346,21 @@ async def get_ip_geolocation_async(ip_address: str) -> Optional[Dict]:
 
 
 async def get_ip_geolocations_batch_async(ip_addresses: List[str], 
-                                        batch_size: int = 20) -> Dict[str, Optional[Dict]]:
+                                        batch_size: int = 100) -> Dict[str, Optional[Dict]]:
     """Async convenience function for batch geolocation"""
     return await geolocation_service.get_locations_batch_async(ip_addresses, batch_size)
 
 
+async def close_geolocation_http():
+    """Close the shared async connection pool before the running event loop ends"""
+    await geolocation_service.close()
+
+
 def cleanup_geolocation_service():
     """Cleanup function to properly shutdown thread pool"""
     if geolocation_service.executor:
         geolocation_service.executor.shutdown(wait=True)
+    geolocation_service.session.close()
 
 
 def bulk_geolocate_hosts(host_ips: list, delay: float = 0.1) -> Dict[str, Dict]:
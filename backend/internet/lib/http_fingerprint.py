@@ -0,0 +1,464 @@
+"""
+Asyncio HTTP fingerprinting: status, headers, title, redirects and favicon hash
+"""
+import asyncio
+import base64
+import contextlib
+import html
+import ipaddress
+import logging
+import re
+import ssl
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+from .banner_grabber import HTTPS_PORTS, clean_banner_text
+from .proxy_pool import connect_socket
+
+try:
+    import mmh3
+    MMH3_AVAILABLE = True
+except ImportError:
+    MMH3_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+USER_AGENT = 'Mozilla/5.0 (compatible; Fauxdan/1.0)'
+TITLE_PATTERN = re.compile(rb'<title[^>]*>(.*?)</title', re.IGNORECASE | re.DOTALL)
+COOKIE_DOMAIN_PATTERN = re.compile(r';\s*domain\s*=\s*\.?([^;\s]+)', re.IGNORECASE)
+
+
+def murmur3_32(data: bytes, seed: int = 0) -> int:
+    """Signed 32-bit MurmurHash3 (x86), matching mmh3.hash()"""
+    if MMH3_AVAILABLE:
+        return mmh3.hash(data, seed)
+
+    c1, c2 = 0xcc9e2d51, 0x1b873593
+    length = len(data)
+    h1 = seed & 0xffffffff
+    rounded_end = length & ~0x3
+
+    for i in range(0, rounded_end, 4):
+        k1 = int.from_bytes(data[i:i + 4], 'little')
+        k1 = (k1 * c1) & 0xffffffff
+        k1 = ((k1 << 15) | (k1 >> 17)) & 0xffffffff
+        k1 = (k1 * c2) & 0xffffffff
+        h1 ^= k1
+        h1 = ((h1 << 13) | (h1 >> 19)) & 0xffffffff
+        h1 = (h1 * 5 + 0xe6546b64) & 0xffffffff
+
+    k1 = 0
+    tail = length & 0x3
+    if tail == 3:
+        k1 ^= data[rounded_end + 2] << 16
+    if tail >= 2:
+        k1 ^= data[rounded_end + 1] << 8
+    if tail >= 1:
+        k1 ^= data[rounded_end]
+        k1 = (k1 * c1) & 0xffffffff
+        k1 = ((k1 << 15) | (k1 >> 17)) & 0xffffffff
+        k1 = (k1 * c2) & 0xffffffff
+        h1 ^= k1
+
+    h1 ^= length
+    h1 ^= h1 >> 16
+    h1 = (h1 * 0x85ebca6b) & 0xffffffff
+    h1 ^= h1 >> 13
+    h1 = (h1 * 0xc2b2ae35) & 0xffffffff
+    h1 ^= h1 >> 16
+
+    return h1 - 0x100000000 if h1 & 0x80000000 else h1
+
+
+def favicon_hash(data: bytes) -> int:
+    """Shodan-style favicon hash: mmh3 of the base64 (76-column) encoding"""
+    return murmur3_32(base64.encodebytes(data))
+
+
+@dataclass
+class HTTPResponse:
+    """Parsed status line, headers and capped body of one response"""
+    status_code: int
+    status_line: str
+    headers: List[Tuple[str, str]]
+    head: bytes
+    body: bytes
+    reusable: bool
+
+    def header(self, name: str) -> Optional[str]:
+        """First value of a header (case-insensitive)"""
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return None
+
+    def header_values(self, name: str) -> List[str]:
+        """All values of a repeated header (case-insensitive)"""
+        name = name.lower()
+        return [value for key, value in self.headers if key.lower() == name]
+
+
+@dataclass
+class HTTPFingerprint:
+    """Everything learned from one web port"""
+    host: str
+    port: int
+    tls: bool
+    status_code: int
+    status_line: str
+    server: Optional[str] = None
+    location: Optional[str] = None
+    title: Optional[str] = None
+    cookie_domains: List[str] = field(default_factory=list)
+    favicon_hash: Optional[int] = None
+    headers: Dict[str, str] = field(default_factory=dict)
+    raw_head: bytes = b''
+
+    @property
+    def banner(self) -> str:
+        """Single-line banner in the format stored on Port.banner"""
+        banner = self.raw_head.decode('utf-8', errors='ignore')
+        if self.title:
+            banner = f"{banner} Title: {self.title}"
+        return clean_banner_text(banner)
+
+    @property
+    def domains(self) -> List[str]:
+        """Hostnames disclosed through redirects and cookie scopes"""
+        found = set(self.cookie_domains)
+        if self.location:
+            redirect_host = urlsplit(self.location).hostname
+            if redirect_host:
+                found.add(redirect_host)
+        return sorted(found)
+
+    def to_dict(self) -> Dict:
+        """Serialize for storage in job result data"""
+        data = asdict(self)
+        data.pop('raw_head')
+        data['domains'] = self.domains
+        return data
+
+
+class HTTPFingerprinter:
+    """Fingerprint web ports over a single reused connection per port"""
+
+    def __init__(self, timeout: float = None, max_concurrency: int = None,
+                 max_header_bytes: int = 16384, max_body_bytes: int = None,
+                 max_favicon_bytes: int = 262144, fetch_favicon: bool = True):
+        self.timeout = timeout or getattr(settings, 'HTTP_FINGERPRINT_TIMEOUT', 5)
+        self.max_concurrency = max_concurrency or getattr(settings, 'HTTP_FINGERPRINT_CONCURRENCY', 500)
+        self.max_header_bytes = max_header_bytes
+        self.max_body_bytes = max_body_bytes or getattr(settings, 'HTTP_FINGERPRINT_MAX_BODY', 65536)
+        self.max_favicon_bytes = max_favicon_bytes
+        self.fetch_favicon = fetch_favicon
+        self._semaphore = None
+        self._semaphore_loop = None
+        self._ssl_context = self._build_ssl_context()
+
+    async def fingerprint(self, host: str, port: int, tls: bool = None,
+                          hostname: str = None) -> Optional[HTTPFingerprint]:
+        """
+        Fetch / (and /favicon.ico on the same connection when possible)
+
+        Args:
+            host: IP address to connect to
+            port: Port number
+            tls: Use HTTPS (default: guessed from the port)
+            hostname: Host header / SNI value (default: the IP)
+
+        Returns:
+            HTTPFingerprint or None if the port does not speak HTTP
+        """
+        if tls is None:
+            tls = port in HTTPS_PORTS
+        try:
+            async with self._get_semaphore():
+                return await asyncio.wait_for(
+                    self._fingerprint(host, port, tls, hostname or host),
+                    # Covers both requests, including a reconnect for the favicon
+                    timeout=self.timeout * 3,
+                )
+        except Exception as e:
+            logger.debug(f"HTTP fingerprint failed for {host}:{port}: {e!r}")
+            return None
+
+    async def fingerprint_batch(self, targets: List[Tuple[str, int]]) -> Dict[Tuple[str, int], HTTPFingerprint]:
+        """
+        Fingerprint many web ports concurrently
+
+        Args:
+            targets: List of (host, port) tuples
+
+        Returns:
+            Dictionary mapping (host, port) to HTTPFingerprint for ports that answered
+        """
+        fingerprints = await asyncio.gather(
+            *(self.fingerprint(host, port) for host, port in targets),
+            return_exceptions=True,
+        )
+        results = {}
+        for target, fingerprint in zip(targets, fingerprints):
+            if isinstance(fingerprint, Exception):
+                logger.debug(f"Batch HTTP fingerprint failed for {target[0]}:{target[1]}: {fingerprint}")
+            elif fingerprint:
+                results[target] = fingerprint
+        return results
+
+    async def _fingerprint(self, host: str, port: int, tls: bool, hostname: str) -> Optional[HTTPFingerprint]:
+        """Open a connection and fingerprint over it"""
+        # Outbound sockets (possibly proxy leases) are released when the stack unwinds
+        async with contextlib.AsyncExitStack() as sockets:
+            reader, writer = await self._connect(sockets, host, port, tls, hostname)
+            try:
+                return await self.fingerprint_stream(
+                    reader, writer, host, port, tls, hostname,
+                    reconnect=lambda: self._connect(sockets, host, port, tls, hostname),
+                )
+            finally:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except Exception:
+                    pass
+
+    async def fingerprint_stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                 host: str, port: int, tls: bool, hostname: str = None,
+                                 reconnect: Callable[[], Awaitable] = None) -> Optional[HTTPFingerprint]:
+        """
+        Fingerprint over a connection the caller already opened (and will close)
+
+        Args:
+            reader: Stream reader of the open connection
+            writer: Stream writer of the open connection
+            host: IP address
+            port: Port number
+            tls: Whether the connection is TLS
+            hostname: Host header / SNI name (default: host)
+            reconnect: Coroutine factory opening a fresh connection for the favicon
+                when the server does not keep the first one alive; without it the
+                favicon is skipped in that case
+
+        Returns:
+            HTTPFingerprint or None if the response is not HTTP
+        """
+        hostname = hostname or host
+        response = await self._request(reader, writer, hostname, '/', self.max_body_bytes)
+        if response is None:
+            return None
+        fingerprint = self._build_fingerprint(host, port, tls, response)
+
+        if self.fetch_favicon and (response.reusable or reconnect is not None):
+            favicon_writer = None
+            try:
+                if not response.reusable:
+                    reader, favicon_writer = await reconnect()
+                    writer = favicon_writer
+                favicon = await self._request(reader, writer, hostname, '/favicon.ico', self.max_favicon_bytes)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                logger.debug(f"Favicon fetch failed for {host}:{port}: {e!r}")
+                favicon = None
+            finally:
+                if favicon_writer is not None:
+                    favicon_writer.close()
+            if favicon and favicon.status_code == 200 and favicon.body:
+                fingerprint.favicon_hash = favicon_hash(favicon.body)
+
+        return fingerprint
+
+    async def _connect(self, sockets: contextlib.AsyncExitStack, host: str, port: int, tls: bool,
+                       hostname: str) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Open a (TLS) stream whose buffer limit caps the header block size"""
+        server_hostname = None
+        if tls:
+            # No SNI for bare IP addresses
+            server_hostname = '' if self._is_ip(hostname) else hostname
+        sock = await sockets.enter_async_context(connect_socket(host, port, timeout=self.timeout))
+        return await asyncio.wait_for(
+            asyncio.open_connection(
+                sock=sock,
+                ssl=self._ssl_context if tls else None,
+                server_hostname=server_hostname,
+                limit=self.max_header_bytes,
+            ),
+            timeout=self.timeout,
+        )
+
+    async def _request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                       hostname: str, path: str, max_body: int) -> Optional[HTTPResponse]:
+        """Send one keep-alive GET and read the response with size caps"""
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {hostname}\r\n"
+            f"User-Agent: {USER_AGENT}\r\n"
+            f"Accept: */*\r\n"
+            f"Connection: keep-alive\r\n\r\n"
+        )
+        writer.write(request.encode())
+        await writer.drain()
+
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=self.timeout)
+        except asyncio.IncompleteReadError as e:
+            # Some servers close right after a bare header block
+            head = e.partial
+        except asyncio.LimitOverrunError:
+            return None
+
+        status_code, status_line, headers = self._parse_head(head)
+        if status_code is None:
+            return None
+
+        response = HTTPResponse(status_code, status_line, headers, head.rstrip(b'\r\n'), b'', False)
+        response.body, response.reusable = await self._read_body(reader, response, max_body)
+        return response
+
+    @staticmethod
+    def _parse_head(head: bytes) -> Tuple[Optional[int], str, List[Tuple[str, str]]]:
+        """Parse the status line and header fields"""
+        lines = head.decode('iso-8859-1').split('\r\n')
+        status_line = lines[0].strip()
+        parts = status_line.split(' ', 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/') or not parts[1].isdigit():
+            return None, status_line, []
+
+        headers = []
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(':')
+            if sep:
+                headers.append((name.strip(), value.strip()))
+        return int(parts[1]), status_line, headers
+
+    async def _read_body(self, reader: asyncio.StreamReader, response: HTTPResponse,
+                         max_body: int) -> Tuple[bytes, bool]:
+        """Read up to max_body bytes; report whether the connection can be reused"""
+        keep_alive = (
+            response.status_line.startswith('HTTP/1.1')
+            and (response.header('Connection') or '').lower() != 'close'
+        )
+        if response.status_code in (204, 304) or 100 <= response.status_code < 200:
+            return b'', keep_alive
+
+        if (response.header('Transfer-Encoding') or '').lower() == 'chunked':
+            return await self._read_chunked(reader, max_body, keep_alive)
+
+        length = response.header('Content-Length')
+        if length is not None and length.isdigit():
+            length = int(length)
+            body = await self._read_exactly(reader, min(length, max_body))
+            return body, keep_alive and length <= max_body and len(body) == length
+
+        # Delimited by connection close
+        return await self._read_exactly(reader, max_body), False
+
+    async def _read_chunked(self, reader: asyncio.StreamReader, max_body: int,
+                            keep_alive: bool) -> Tuple[bytes, bool]:
+        """Decode a chunked body, stopping at the size cap"""
+        body = b''
+        while True:
+            size_line = await asyncio.wait_for(reader.readline(), timeout=self.timeout)
+            try:
+                size = int(size_line.split(b';', 1)[0].strip() or b'0', 16)
+            except ValueError:
+                return body, False
+            if size == 0:
+                # Trailer section ends with an empty line
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), timeout=self.timeout)
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                return body, keep_alive
+            if len(body) + size > max_body:
+                body += await self._read_exactly(reader, max_body - len(body))
+                return body, False
+            body += await self._read_exactly(reader, size)
+            await asyncio.wait_for(reader.readline(), timeout=self.timeout)
+
+    async def _read_exactly(self, reader: asyncio.StreamReader, size: int) -> bytes:
+        """Read size bytes or until EOF/timeout"""
+        data = b''
+        while len(data) < size:
+            try:
+                chunk = await asyncio.wait_for(reader.read(size - len(data)), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def _build_fingerprint(self, host: str, port: int, tls: bool,
+                           response: HTTPResponse) -> HTTPFingerprint:
+        """Extract the interesting fields from the page response"""
+        cookie_domains = set()
+        for cookie in response.header_values('Set-Cookie'):
+            for domain in COOKIE_DOMAIN_PATTERN.findall(cookie):
+                cookie_domains.add(domain.lower())
+
+        title = None
+        title_match = TITLE_PATTERN.search(response.body)
+        if title_match:
+            title = html.unescape(
+                ' '.join(title_match.group(1).decode('utf-8', errors='ignore').split())
+            )[:200] or None
+
+        headers = {}
+        for name, value in response.headers:
+            headers.setdefault(name.lower(), value)
+
+        return HTTPFingerprint(
+            host=host,
+            port=port,
+            tls=tls,
+            status_code=response.status_code,
+            status_line=response.status_line,
+            server=response.header('Server'),
+            location=response.header('Location'),
+            title=title,
+            cookie_domains=sorted(cookie_domains),
+            headers=headers,
+            raw_head=response.head,
+        )
+
+    @staticmethod
+    def _is_ip(value: str) -> bool:
+        """Check whether a string is an IP literal"""
+        try:
+            ipaddress.ip_address(value)
+            return True
+        except ValueError:
+            return False
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Concurrency limit bound to the currently running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    @staticmethod
+    def _build_ssl_context() -> ssl.SSLContext:
+        """TLS context that accepts any certificate"""
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+
+
+# Global HTTP fingerprinter instance
+_http_fingerprinter = None
+
+def get_http_fingerprinter() -> HTTPFingerprinter:
+    """Get the global HTTP fingerprinter instance"""
+    global _http_fingerprinter
+    if _http_fingerprinter is None:
+        _http_fingerprinter = HTTPFingerprinter()
+    return _http_fingerprinter
@@ -0,0 +1,200 @@
+"""
+Batched nmap service detection with streaming XML parsing
+"""
+import asyncio
+import inspect
+import logging
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+
+from .banner_grabber import banner_from_nmap_port, clean_banner_text
+
+logger = logging.getLogger(__name__)
+
+
+# Called once per requested (host, port) with the banner or None
+ResultCallback = Callable[[str, int, Optional[str]], object]
+
+
+class NmapBatchScanner:
+    """Run one nmap -sV invocation for many host:port targets at once"""
+
+    def __init__(self, nmap_path: str = 'nmap', host_timeout: int = None,
+                 max_retries: int = 1, version_light: bool = True,
+                 banner_script: bool = True, process_timeout: int = 1800):
+        self.nmap_path = nmap_path
+        self.host_timeout = host_timeout or getattr(settings, 'NMAP_BATCH_HOST_TIMEOUT', 30)
+        self.max_retries = max_retries
+        self.version_light = version_light
+        self.banner_script = banner_script
+        self.process_timeout = process_timeout
+
+    @staticmethod
+    def group_targets(targets: Iterable[Tuple[str, int]]) -> Dict[Tuple[int, ...], List[str]]:
+        """
+        Group hosts that need the same port list so each group is one nmap run
+
+        Args:
+            targets: (host, port) pairs
+
+        Returns:
+            Dictionary mapping a sorted port tuple to the hosts needing exactly those ports
+        """
+        ports_by_host: Dict[str, Set[int]] = defaultdict(set)
+        for host, port in targets:
+            ports_by_host[host].add(int(port))
+
+        groups: Dict[Tuple[int, ...], List[str]] = defaultdict(list)
+        for host, ports in ports_by_host.items():
+            groups[tuple(sorted(ports))].append(host)
+        return dict(groups)
+
+    def build_command(self, ports: Iterable[int], target_file: str) -> List[str]:
+        """Build the nmap command line for one host group"""
+        cmd = [
+            self.nmap_path,
+            '-Pn',
+            '-n',
+            '-sV',
+            '--host-timeout', f'{self.host_timeout}s',
+            '--max-retries', str(self.max_retries),
+            '-p', ','.join(str(p) for p in ports),
+            '-iL', target_file,
+            '-oX', '-',
+        ]
+        if self.version_light:
+            cmd.insert(4, '--version-light')
+        if self.banner_script:
+            cmd[-2:-2] = ['--script', 'banner']
+        return cmd
+
+    async def scan(self, targets: Iterable[Tuple[str, int]],
+                   on_result: ResultCallback = None) -> Dict[Tuple[str, int], Optional[str]]:
+        """
+        Detect services for many targets, dispatching each result as its host completes
+
+        Args:
+            targets: (host, port) pairs to fingerprint
+            on_result: Optional callback (sync or async) invoked with (host, port, banner)
+
+        Returns:
+            Dictionary mapping (host, port) to banner string or None
+        """
+        results: Dict[Tuple[str, int], Optional[str]] = {}
+        for ports, hosts in self.group_targets(targets).items():
+            await self._scan_group(hosts, ports, on_result, results)
+        return results
+
+    async def _scan_group(self, hosts: List[str], ports: Tuple[int, ...],
+                          on_result: Optional[ResultCallback],
+                          results: Dict[Tuple[str, int], Optional[str]]) -> None:
+        """Run nmap for one group of hosts sharing a port list"""
+        wanted = {(host, port) for host in hosts for port in ports}
+
+        fd, target_file = tempfile.mkstemp(prefix='nmap-targets-', suffix='.txt')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write('\n'.join(hosts))
+                f.write('\n')
+
+            cmd = self.build_command(ports, target_file)
+            logger.info(f"Running batched nmap for {len(hosts)} hosts x {len(ports)} ports")
+
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+            except FileNotFoundError:
+                logger.error(f"nmap not found at {self.nmap_path}")
+                process = None
+
+            if process is not None:
+                try:
+                    await asyncio.wait_for(
+                        self._consume_output(process.stdout, wanted, on_result, results),
+                        timeout=self.process_timeout,
+                    )
+                    await process.wait()
+                except asyncio.TimeoutError:
+                    logger.warning(f"Batched nmap timed out after {self.process_timeout}s")
+                    process.kill()
+                    await process.wait()
+        finally:
+            try:
+                os.unlink(target_file)
+            except OSError:
+                pass
+
+        # Anything nmap never reported (host timed out, run aborted) has no banner
+        for host, port in sorted(wanted - results.keys()):
+            await self._dispatch(on_result, results, host, port, None)
+
+    async def _consume_output(self, stream: asyncio.StreamReader, wanted: Set[Tuple[str, int]],
+                              on_result: Optional[ResultCallback],
+                              results: Dict[Tuple[str, int], Optional[str]]) -> None:
+        """Incrementally parse nmap's XML output and dispatch each finished <host>"""
+        parser = ET.XMLPullParser(events=('end',))
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                break
+            try:
+                parser.feed(chunk)
+                for _, elem in parser.read_events():
+                    if elem.tag != 'host':
+                        continue
+                    for host, port, banner in self._parse_host(elem):
+                        if (host, port) in wanted:
+                            await self._dispatch(on_result, results, host, port, banner)
+                    # Completed hosts are not needed again; keep memory flat
+                    elem.clear()
+            except ET.ParseError as parse_err:
+                logger.warning(f"nmap XML parse error: {parse_err}")
+                break
+
+    def _parse_host(self, host_elem: ET.Element) -> List[Tuple[str, int, Optional[str]]]:
+        """Extract (host, port, banner) tuples from a completed <host> element"""
+        address = None
+        for addr_elem in host_elem.findall('address'):
+            if addr_elem.get('addrtype') in ('ipv4', 'ipv6'):
+                address = addr_elem.get('addr')
+                break
+        if not address:
+            return []
+
+        parsed = []
+        for port_elem in host_elem.findall('ports/port'):
+            try:
+                port = int(port_elem.get('portid'))
+            except (TypeError, ValueError):
+                continue
+            state_elem = port_elem.find('state')
+            if state_elem is not None and state_elem.get('state') != 'open':
+                # Closed/filtered ports only carry a guessed service name
+                parsed.append((address, port, None))
+                continue
+            banner = banner_from_nmap_port(port_elem)
+            parsed.append((address, port, clean_banner_text(banner) if banner else None))
+        return parsed
+
+    @staticmethod
+    async def _dispatch(on_result: Optional[ResultCallback],
+                        results: Dict[Tuple[str, int], Optional[str]],
+                        host: str, port: int, banner: Optional[str]) -> None:
+        """Record a result and hand it to the callback"""
+        results[(host, port)] = banner
+        if on_result is None:
+            return
+        try:
+            outcome = on_result(host, port, banner)
+            if inspect.isawaitable(outcome):
+                await outcome
+        except Exception as e:
+            logger.error(f"nmap result handler failed for {host}:{port}: {e}")
@@ -0,0 +1,168 @@
+"""
+TTL-based freshness index of completed probes, used to skip re-queueing recently probed endpoints
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, QuerySet
+from django.utils import timezone
+
+from internet.models import ProbeFreshness
+
+logger = logging.getLogger(__name__)
+
+
+# Host-level probes are keyed on the IP alone (port 0, empty protocol)
+HOST_LEVEL_PROBE_TYPES = ['domain_enum', 'geolocation']
+
+
+class ProbeFreshnessIndex:
+    """Record when each probe type last completed per endpoint and answer freshness queries in bulk"""
+
+    def __init__(self, ttls: Dict[str, int] = None, batch_size: int = 1000):
+        """
+        Args:
+            ttls: Seconds a completed probe stays fresh, per probe type (default: PROBE_FRESHNESS_TTLS)
+            batch_size: Rows per multi-row upsert
+        """
+        self.ttls = ttls if ttls is not None else getattr(settings, 'PROBE_FRESHNESS_TTLS', {})
+        self.batch_size = batch_size
+
+    def cutoff(self, probe_type: str, now: datetime = None) -> Optional[datetime]:
+        """Oldest checked_at that still counts as fresh, or None if the type has no TTL"""
+        ttl = self.ttls.get(probe_type, 0)
+        if not ttl:
+            return None
+        return (now or timezone.now()) - timedelta(seconds=ttl)
+
+    @staticmethod
+    def key(probe_type: str, ip: str, port_number: Optional[int] = None,
+            proto: Optional[str] = None) -> Tuple[str, int, str]:
+        """Normalized (ip, port_number, proto) key for a probe target"""
+        if probe_type in HOST_LEVEL_PROBE_TYPES:
+            return ip, 0, ''
+        return ip, port_number or 0, proto or 'tcp'
+
+    def fresh_probe_types(self, ip: str, port_number: int, proto: str) -> Set[str]:
+        """
+        Probe types still fresh for a port, including host-level types for its IP
+
+        Args:
+            ip: IP address
+            port_number: Port number
+            proto: Protocol (tcp/udp)
+
+        Returns:
+            Set of probe types that should not be queued again yet
+        """
+        return self.fresh_probe_types_bulk([(ip, port_number, proto)])[(ip, port_number, proto)]
+
+    def fresh_probe_types_bulk(self, targets: Iterable[Tuple[str, int, str]]) -> Dict[Tuple[str, int, str], Set[str]]:
+        """
+        Fresh probe types for many ports with a single query
+
+        Args:
+            targets: (ip, port_number, proto) tuples
+
+        Returns:
+            Set of fresh probe types per target, including host-level types for its IP
+        """
+        targets = set(targets)
+        if not targets:
+            return {}
+        now = timezone.now()
+        rows = ProbeFreshness.objects.filter(
+            ip__in={ip for ip, _, _ in targets},
+            port_number__in={port_number for _, port_number, _ in targets} | {0},
+        ).values_list('ip', 'port_number', 'proto', 'probe_type', 'checked_at')
+
+        by_endpoint: Dict[Tuple[str, int, str], list] = {}
+        for ip, row_port, row_proto, probe_type, checked_at in rows:
+            cutoff = self.cutoff(probe_type, now)
+            if cutoff is not None and checked_at >= cutoff:
+                by_endpoint.setdefault((ip, row_port, row_proto), []).append(probe_type)
+
+        fresh = {}
+        for ip, port_number, proto in targets:
+            fresh[(ip, port_number, proto)] = {
+                probe_type
+                for endpoint in ((ip, port_number or 0, proto or 'tcp'), (ip, 0, ''))
+                for probe_type in by_endpoint.get(endpoint, ())
+                if self.key(probe_type, ip, port_number, proto) == endpoint
+            }
+        return fresh
+
+    def exclude_fresh_ports(self, probe_type: str, ports: QuerySet) -> QuerySet:
+        """Anti-join ports against fresh records of a port-level probe type"""
+        cutoff = self.cutoff(probe_type)
+        if cutoff is None:
+            return ports
+        fresh = ProbeFreshness.objects.filter(
+            ip=OuterRef('host__ip'),
+            port_number=OuterRef('port_number'),
+            proto=OuterRef('proto'),
+            probe_type=probe_type,
+            checked_at__gte=cutoff,
+        )
+        return ports.filter(~Exists(fresh))
+
+    def exclude_fresh_hosts(self, probe_type: str, hosts: QuerySet) -> QuerySet:
+        """Anti-join hosts against fresh records of a host-level probe type"""
+        cutoff = self.cutoff(probe_type)
+        if cutoff is None:
+            return hosts
+        fresh = ProbeFreshness.objects.filter(
+            ip=OuterRef('ip'),
+            port_number=0,
+            proto='',
+            probe_type=probe_type,
+            checked_at__gte=cutoff,
+        )
+        return hosts.filter(~Exists(fresh))
+
+    def mark_fresh(self, probe_type: str, targets: Iterable[Tuple[str, Optional[int], Optional[str]]],
+                   checked_at: datetime = None) -> int:
+        """
+        Upsert freshness records for completed probes
+
+        Args:
+            probe_type: Probe (job) type that completed
+            targets: (ip, port_number, proto) tuples; port/proto are ignored for host-level types
+            checked_at: Completion time (default: now)
+
+        Returns:
+            Number of records written
+        """
+        checked_at = checked_at or timezone.now()
+        keys = {self.key(probe_type, ip, port_number, proto) for ip, port_number, proto in targets}
+        if not keys:
+            return 0
+        ProbeFreshness.objects.bulk_create(
+            [
+                ProbeFreshness(ip=ip, port_number=port_number, proto=proto,
+                               probe_type=probe_type, checked_at=checked_at)
+                for ip, port_number, proto in keys
+            ],
+            batch_size=self.batch_size,
+            update_conflicts=True,
+            unique_fields=['ip', 'port_number', 'proto', 'probe_type'],
+            update_fields=['checked_at'],
+        )
+        return len(keys)
+
+    def mark_job(self, job) -> None:
+        """Record a completed AncillaryJob as fresh"""
+        self.mark_fresh(job.job_type, [(job.host_ip, job.port_number, job.protocol)], job.completed_at)
+
+
+# Global freshness index instance
+_probe_freshness_index = None
+
+def get_probe_freshness_index() -> ProbeFreshnessIndex:
+    """Get the global probe freshness index instance"""
+    global _probe_freshness_index
+    if _probe_freshness_index is None:
+        _probe_freshness_index = ProbeFreshnessIndex()
+    return _probe_freshness_index
@@ -0,0 +1,371 @@
+"""
+Asyncio proxy liveness checks (SOCKS4/4a, SOCKS5, HTTP CONNECT)
+"""
+import asyncio
+import base64
+import ipaddress
+import logging
+import ssl
+import struct
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Proxy.proxy_type codes in the order they are tried when the type is unknown.
+# HTTP goes first: SOCKS servers drop a CONNECT line at once, while HTTP
+# proxies sit waiting for the end of headers after a binary SOCKS greeting.
+DETECTION_ORDER = ['HP', 'S5', 'S4']
+
+SOCKS5_REPLY_ERRORS = {
+    1: 'general failure',
+    2: 'connection not allowed',
+    3: 'network unreachable',
+    4: 'host unreachable',
+    5: 'connection refused',
+    6: 'TTL expired',
+    7: 'command not supported',
+    8: 'address type not supported',
+}
+
+
+class ProxyError(Exception):
+    """The proxy answered but refused or garbled the tunnel request"""
+
+
+class TargetUnreachable(ProxyError):
+    """The proxy works but could not reach the requested target"""
+
+
+@dataclass
+class ProxyCheckResult:
+    """Outcome of one proxy check"""
+    host: str
+    port: int
+    proxy_type: str
+    alive: bool
+    latency_ms: Optional[float] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            'proxy_type': self.proxy_type,
+            'alive': self.alive,
+            'latency_ms': self.latency_ms,
+            'error': self.error,
+        }
+
+
+def parse_target(value: str) -> Tuple[str, int]:
+    """Parse 'host:port' (or '[v6]:port') into a (host, port) tuple"""
+    value = value.strip()
+    if value.startswith('['):
+        host, _, port = value[1:].partition(']:')
+        return host, int(port)
+    host, _, port = value.rpartition(':')
+    return host, int(port)
+
+
+async def open_tunnel(reader, writer, proxy_type: str, target_host: str, target_port: int,
+                      username: str = None, password: str = None) -> None:
+    """
+    Negotiate a tunnel to target_host:target_port over an open proxy connection
+
+    Args:
+        reader: Stream (or stream-like object) reading from the proxy
+        writer: Stream (or stream-like object) writing to the proxy
+        proxy_type: Proxy.proxy_type code (S4, S5, HP, HS)
+        target_host: Address or hostname the proxy should connect to
+        target_port: Target port
+        username: Optional proxy username
+        password: Optional proxy password
+
+    Raises:
+        ProxyError: The endpoint is not a working proxy of this type
+        TargetUnreachable: The proxy refused or failed to reach the target
+    """
+    if proxy_type == 'S5':
+        await socks5_handshake(reader, writer, target_host, target_port, username, password)
+    elif proxy_type == 'S4':
+        await socks4_handshake(reader, writer, target_host, target_port, username)
+    elif proxy_type in ('HP', 'HS'):
+        await http_connect_handshake(reader, writer, target_host, target_port, username, password)
+    else:
+        raise ProxyError(f'unsupported proxy type {proxy_type}')
+
+
+async def socks5_handshake(reader, writer, target_host: str, target_port: int,
+                           username: str = None, password: str = None) -> None:
+    """RFC 1928 greeting, optional RFC 1929 auth, then CONNECT"""
+    methods = b'\x00\x02' if username else b'\x00'
+    writer.write(b'\x05' + bytes([len(methods)]) + methods)
+    await writer.drain()
+    version, method = await reader.readexactly(2)
+    if version != 5:
+        raise ProxyError('not a SOCKS5 proxy')
+    if method == 0x02 and username:
+        user, pwd = username.encode(), (password or '').encode()
+        writer.write(b'\x01' + bytes([len(user)]) + user + bytes([len(pwd)]) + pwd)
+        await writer.drain()
+        _, status = await reader.readexactly(2)
+        if status != 0:
+            raise ProxyError('SOCKS5 authentication failed')
+    elif method != 0x00:
+        raise ProxyError('SOCKS5 proxy requires authentication')
+
+    writer.write(b'\x05\x01\x00' + _socks5_address(target_host) + struct.pack('>H', target_port))
+    await writer.drain()
+    version, reply, _, address_type = await reader.readexactly(4)
+    if version != 5:
+        raise ProxyError('malformed SOCKS5 reply')
+    if reply in (3, 4, 5, 6):
+        raise TargetUnreachable(f"SOCKS5 {SOCKS5_REPLY_ERRORS[reply]}")
+    if reply != 0:
+        raise ProxyError(f"SOCKS5 {SOCKS5_REPLY_ERRORS.get(reply, f'error {reply}')}")
+    # Discard the bound address
+    if address_type == 1:
+        await reader.readexactly(4 + 2)
+    elif address_type == 4:
+        await reader.readexactly(16 + 2)
+    elif address_type == 3:
+        length = (await reader.readexactly(1))[0]
+        await reader.readexactly(length + 2)
+    else:
+        raise ProxyError('malformed SOCKS5 reply')
+
+
+async def socks4_handshake(reader, writer, target_host: str, target_port: int,
+                           username: str = None) -> None:
+    """SOCKS4 CONNECT, using the 4a extension for hostname targets"""
+    user_id = (username or '').encode() + b'\x00'
+    try:
+        address = ipaddress.IPv4Address(target_host).packed
+        hostname = b''
+    except ValueError:
+        address = b'\x00\x00\x00\x01'
+        hostname = target_host.encode() + b'\x00'
+    writer.write(b'\x04\x01' + struct.pack('>H', target_port) + address + user_id + hostname)
+    await writer.drain()
+    reply = await reader.readexactly(8)
+    if reply[0] != 0:
+        raise ProxyError('not a SOCKS4 proxy')
+    if reply[1] == 0x5B:
+        # Rejected or failed; SOCKS4 does not say which
+        raise TargetUnreachable('SOCKS4 request rejected or failed')
+    if reply[1] != 0x5A:
+        raise ProxyError(f'SOCKS4 request rejected ({reply[1]:#x})')
+
+
+async def http_connect_handshake(reader, writer, target_host: str, target_port: int,
+                                 username: str = None, password: str = None) -> None:
+    """HTTP CONNECT tunnel request"""
+    authority = f"{target_host}:{target_port}"
+    if ':' in target_host:
+        authority = f"[{target_host}]:{target_port}"
+    request = f"CONNECT {authority} HTTP/1.1\r\nHost: {authority}\r\n"
+    if username:
+        credentials = base64.b64encode(f"{username}:{password or ''}".encode()).decode()
+        request += f"Proxy-Authorization: Basic {credentials}\r\n"
+    writer.write((request + "\r\n").encode())
+    await writer.drain()
+
+    head = await reader.readuntil(b'\r\n\r\n')
+    status_line = head.split(b'\r\n', 1)[0].decode('latin-1')
+    parts = status_line.split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+        raise ProxyError('not an HTTP proxy')
+    if parts[1] in ('502', '503', '504'):
+        raise TargetUnreachable(f'CONNECT failed: {status_line}')
+    if parts[1] != '200':
+        raise ProxyError(f'CONNECT refused: {status_line}')
+
+
+def _socks5_address(host: str) -> bytes:
+    """Encode a target as a SOCKS5 address"""
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        name = host.encode('idna')
+        return b'\x03' + bytes([len(name)]) + name
+    return (b'\x01' if ip.version == 4 else b'\x04') + ip.packed
+
+
+class ProxyChecker:
+    """Tunnel through many proxies concurrently to a known target and time the round trip"""
+
+    def __init__(self, target: str = None, payload: bytes = None, expect: bytes = None,
+                 timeout: float = None, max_concurrency: int = None):
+        self.target_host, self.target_port = parse_target(
+            target or getattr(settings, 'PROXY_CHECK_TARGET', 'example.com:80')
+        )
+        # Default payload is a HEAD request that any web server on the target answers
+        self.payload = payload if payload is not None else (
+            f"HEAD / HTTP/1.0\r\nHost: {self.target_host}\r\n\r\n".encode()
+        )
+        self.expect = expect if expect is not None else (
+            getattr(settings, 'PROXY_CHECK_EXPECT', 'HTTP/').encode()
+        )
+        self.timeout = timeout or getattr(settings, 'PROXY_CHECK_TIMEOUT', 5)
+        self.max_concurrency = max_concurrency or getattr(settings, 'PROXY_CHECK_CONCURRENCY', 1000)
+        # Semaphore is bound to the loop that created it; rebuilt per asyncio.run
+        self._semaphore = None
+        self._semaphore_loop = None
+        self._ssl_context = self._build_ssl_context()
+
+    async def check(self, host: str, port: int, proxy_type: str,
+                    username: str = None, password: str = None) -> ProxyCheckResult:
+        """
+        Open a tunnel through one proxy and exchange the check payload
+
+        Args:
+            host: Proxy address
+            port: Proxy port
+            proxy_type: Proxy.proxy_type code (S4, S5, HP, HS)
+            username: Optional proxy username
+            password: Optional proxy password
+
+        Returns:
+            ProxyCheckResult with latency for live proxies and the error otherwise
+        """
+        async with self._get_semaphore():
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(
+                    self._tunnel_exchange(host, port, proxy_type, username, password),
+                    timeout=self.timeout,
+                )
+            except asyncio.TimeoutError:
+                return ProxyCheckResult(host, port, proxy_type, False, error='timeout')
+            except (OSError, ProxyError, asyncio.IncompleteReadError, ssl.SSLError) as e:
+                return ProxyCheckResult(host, port, proxy_type, False, error=str(e) or type(e).__name__)
+
+            latency_ms = round((time.monotonic() - started) * 1000, 1)
+            return ProxyCheckResult(host, port, proxy_type, True, latency_ms=latency_ms)
+
+    async def detect(self, host: str, port: int) -> Optional[ProxyCheckResult]:
+        """
+        Find which proxy protocol an unclassified endpoint speaks
+
+        Args:
+            host: Candidate address
+            port: Candidate port
+
+        Returns:
+            Result for the first protocol that tunnels successfully, or None
+        """
+        for proxy_type in DETECTION_ORDER:
+            result = await self.check(host, port, proxy_type)
+            if result.alive:
+                return result
+            if (result.error or '').startswith('[Errno'):
+                # Nothing listening; other protocols won't fare better
+                return None
+        return None
+
+    async def check_batch(self, proxies: List[Tuple]) -> List[ProxyCheckResult]:
+        """
+        Check many proxies concurrently
+
+        Args:
+            proxies: List of (host, port, proxy_type, username, password) tuples
+
+        Returns:
+            List of ProxyCheckResult in input order
+        """
+        return await asyncio.gather(*(self.check(*proxy) for proxy in proxies))
+
+    async def detect_batch(self, candidates: List[Tuple[str, int]]) -> Dict[Tuple[str, int], ProxyCheckResult]:
+        """
+        Classify many candidate endpoints concurrently
+
+        Args:
+            candidates: List of (host, port) tuples
+
+        Returns:
+            Dictionary mapping (host, port) to the result for working proxies
+        """
+        results = await asyncio.gather(*(self.detect(host, port) for host, port in candidates))
+        return {candidate: result for candidate, result in zip(candidates, results) if result}
+
+    async def _tunnel_exchange(self, host: str, port: int, proxy_type: str,
+                               username: Optional[str], password: Optional[str]) -> None:
+        """Connect, negotiate the tunnel and verify the target answers through it"""
+        ssl_context = self._ssl_context if proxy_type == 'HS' else None
+        reader, writer = await asyncio.open_connection(
+            host, port, ssl=ssl_context, server_hostname='' if ssl_context else None,
+        )
+        try:
+            await open_tunnel(reader, writer, proxy_type, self.target_host, self.target_port, username, password)
+
+            writer.write(self.payload)
+            await writer.drain()
+            response = await reader.read(max(len(self.expect), 64))
+            if self.expect and not response.startswith(self.expect):
+                raise ProxyError('unexpected response from target')
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Semaphore bound to the currently running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    @staticmethod
+    def _build_ssl_context() -> ssl.SSLContext:
+        """TLS context for HTTPS proxies; certificates are not verified"""
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+
+
+def apply_check_result(proxy, result: ProxyCheckResult, checked_at, dead_after: int = None,
+                       disable_after: int = None):
+    """
+    Update a Proxy instance in place from a check result (the caller saves it)
+
+    Args:
+        proxy: Proxy model instance
+        result: Result of checking that proxy
+        checked_at: Timestamp of the check
+        dead_after: Consecutive failures before the proxy is marked dead
+        disable_after: Consecutive failures before the proxy is disabled
+    """
+    dead_after = dead_after or getattr(settings, 'PROXY_DEAD_AFTER_FAILURES', 3)
+    disable_after = disable_after or getattr(settings, 'PROXY_DISABLE_AFTER_FAILURES', 20)
+
+    proxy.last_checked = checked_at
+    if result.alive:
+        proxy.latency_ms = result.latency_ms
+        proxy.fail_count = 0
+        proxy.dead = False
+    else:
+        proxy.fail_count += 1
+        if proxy.fail_count >= dead_after:
+            proxy.dead = True
+        if proxy.fail_count >= disable_after:
+            # Long-dead proxies drop out of routine checks until re-enabled
+            proxy.enabled = False
+    return proxy
+
+
+# Global proxy checker instance
+_proxy_checker = None
+
+def get_proxy_checker() -> ProxyChecker:
+    """Get the global proxy checker instance"""
+    global _proxy_checker
+    if _proxy_checker is None:
+        _proxy_checker = ProxyChecker()
+    return _proxy_checker
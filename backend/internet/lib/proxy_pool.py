@@ -0,0 +1,335 @@
+"""
+Latency-scored proxy pool for outbound probe connections
+"""
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .circuit_breaker import CircuitBreaker
+from .proxy_checker import ProxyError, TargetUnreachable, open_tunnel
+
+logger = logging.getLogger(__name__)
+
+
+# TLS-wrapped (HS) proxies cannot hand back a raw socket, so the pool skips them
+POOLABLE_PROXY_TYPES = ['S4', 'S5', 'HP']
+
+# Assumed latency for proxies that have never been measured
+DEFAULT_LATENCY_MS = 500.0
+
+
+class ProxyPoolExhausted(ConnectionError):
+    """No healthy proxy became available in time"""
+
+
+class _SocketStream:
+    """Minimal StreamReader/StreamWriter look-alike over a non-blocking socket.
+
+    Lets the proxy handshakes run on a raw socket that is later handed to
+    asyncio.open_connection(sock=...), optionally with TLS on top.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._loop = asyncio.get_running_loop()
+        self._buffer = b''
+        self._pending = b''
+
+    def write(self, data: bytes) -> None:
+        self._pending += data
+
+    async def drain(self) -> None:
+        data, self._pending = self._pending, b''
+        await self._loop.sock_sendall(self.sock, data)
+
+    async def readexactly(self, n: int) -> bytes:
+        while len(self._buffer) < n:
+            await self._fill(n - len(self._buffer))
+        data, self._buffer = self._buffer[:n], self._buffer[n:]
+        return data
+
+    async def readuntil(self, separator: bytes, limit: int = 65536) -> bytes:
+        # Byte at a time so nothing past the proxy's reply is consumed
+        while not self._buffer.endswith(separator):
+            if len(self._buffer) > limit:
+                raise ProxyError('proxy reply too long')
+            await self._fill(1)
+        data, self._buffer = self._buffer, b''
+        return data
+
+    async def _fill(self, size: int) -> None:
+        chunk = await self._loop.sock_recv(self.sock, size)
+        if not chunk:
+            raise asyncio.IncompleteReadError(self._buffer, None)
+        self._buffer += chunk
+
+
+@dataclass
+class PooledProxy:
+    """A proxy plus the pool's live bookkeeping for it"""
+    id: int
+    host: str
+    port: int
+    proxy_type: str
+    username: Optional[str] = None
+    password: Optional[str] = None
+    latency_ms: float = DEFAULT_LATENCY_MS
+    inflight: int = 0
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+
+    @property
+    def score(self) -> float:
+        """Lower is better: measured latency, inflated by current load"""
+        return self.latency_ms * (1 + self.inflight)
+
+
+class ProxyPool:
+    """Spread outbound connections over healthy proxies from the Proxy table"""
+
+    def __init__(self, max_per_proxy: int = None, refresh_interval: float = None,
+                 failure_threshold: int = None, recovery_timeout: float = None,
+                 acquire_timeout: float = None, latency_alpha: float = 0.3):
+        self.max_per_proxy = max_per_proxy or getattr(settings, 'PROXY_POOL_MAX_PER_PROXY', 50)
+        self.refresh_interval = refresh_interval or getattr(settings, 'PROXY_POOL_REFRESH_INTERVAL', 300)
+        self.failure_threshold = failure_threshold or getattr(settings, 'PROXY_POOL_FAILURE_THRESHOLD', 5)
+        self.recovery_timeout = recovery_timeout or getattr(settings, 'PROXY_POOL_RECOVERY_TIMEOUT', 60)
+        self.acquire_timeout = acquire_timeout or getattr(settings, 'PROXY_POOL_ACQUIRE_TIMEOUT', 10)
+        self.latency_alpha = latency_alpha
+        self._proxies: Dict[int, PooledProxy] = {}
+        self._loaded_at = None
+        # Condition and in-flight counts belong to one event loop
+        self._loop = None
+        self._condition = None
+
+    def set_proxies(self, proxies: List[PooledProxy]) -> None:
+        """
+        Replace the pool contents, keeping breaker and latency state for known proxies
+
+        Args:
+            proxies: Proxies that should be in the pool
+        """
+        refreshed = {}
+        for proxy in proxies:
+            existing = self._proxies.get(proxy.id)
+            if existing is not None:
+                existing.host, existing.port = proxy.host, proxy.port
+                existing.proxy_type = proxy.proxy_type
+                existing.username, existing.password = proxy.username, proxy.password
+                refreshed[proxy.id] = existing
+            else:
+                proxy.breaker = CircuitBreaker(
+                    failure_threshold=self.failure_threshold,
+                    recovery_timeout=self.recovery_timeout,
+                    name=f"proxy {proxy.host}:{proxy.port}",
+                )
+                refreshed[proxy.id] = proxy
+        self._proxies = refreshed
+        self._loaded_at = time.monotonic()
+
+    def load(self) -> int:
+        """
+        Load enabled, live proxies from the database
+
+        Returns:
+            Number of proxies in the pool
+        """
+        from internet.models import Proxy
+
+        rows = (
+            Proxy.objects.filter(enabled=True, dead=False, proxy_type__in=POOLABLE_PROXY_TYPES)
+            .values_list('id', 'host_name', 'port_number', 'proxy_type', 'username', 'password', 'latency_ms')
+        )
+        self.set_proxies([
+            PooledProxy(
+                id=proxy_id, host=host, port=port, proxy_type=proxy_type,
+                username=username, password=password,
+                latency_ms=latency_ms if latency_ms is not None else DEFAULT_LATENCY_MS,
+            )
+            for proxy_id, host, port, proxy_type, username, password, latency_ms in rows
+        ])
+        logger.info(f"Proxy pool loaded {len(self._proxies)} proxies")
+        return len(self._proxies)
+
+    def __len__(self) -> int:
+        return len(self._proxies)
+
+    @asynccontextmanager
+    async def connect(self, host: str, port: int, timeout: float) -> AsyncIterator[socket.socket]:
+        """
+        Open a tunnelled socket to host:port through the best available proxy
+
+        The proxy's concurrency slot is held until the block exits, so callers
+        should finish using the socket inside it.
+
+        Args:
+            host: Target IP address
+            port: Target port
+            timeout: Seconds allowed for reaching the proxy and negotiating the tunnel
+
+        Yields:
+            Connected non-blocking socket, ready for asyncio.open_connection(sock=...)
+        """
+        await self._refresh_if_stale()
+        proxy = await self._acquire()
+        try:
+            started = time.monotonic()
+            try:
+                sock = await asyncio.wait_for(self._open_tunnel(proxy, host, port), timeout=timeout)
+            except TargetUnreachable as e:
+                # The proxy did its job; the target is what failed
+                self._record(proxy, success=True)
+                raise ConnectionRefusedError(str(e)) from e
+            except (ProxyError, asyncio.IncompleteReadError) as e:
+                self._record(proxy, success=False)
+                raise ConnectionError(f"proxy {proxy.host}:{proxy.port}: {e}") from e
+            except (OSError, asyncio.TimeoutError):
+                self._record(proxy, success=False)
+                raise
+            self._record(proxy, success=True, latency_ms=(time.monotonic() - started) * 1000)
+            yield sock
+        finally:
+            await self._release(proxy)
+
+    async def _open_tunnel(self, proxy: PooledProxy, host: str, port: int) -> socket.socket:
+        """Connect to the proxy and negotiate a tunnel on a raw socket"""
+        loop = asyncio.get_running_loop()
+        address = await _resolve(proxy.host, proxy.port)
+        sock = socket.socket(address[0], socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, address[1])
+            stream = _SocketStream(sock)
+            await open_tunnel(stream, stream, proxy.proxy_type, host, port, proxy.username, proxy.password)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    async def _acquire(self) -> PooledProxy:
+        """Wait for the lowest-scored proxy that has a free slot and a closed circuit"""
+        self._bind_loop()
+        async with self._condition:
+            deadline = time.monotonic() + self.acquire_timeout
+            while True:
+                proxy = self._select()
+                if proxy is not None:
+                    proxy.inflight += 1
+                    return proxy
+                remaining = deadline - time.monotonic()
+                if not self._proxies or remaining <= 0:
+                    raise ProxyPoolExhausted('no healthy proxy available')
+                try:
+                    # Also wake periodically so open circuits can move to half-open
+                    await asyncio.wait_for(self._condition.wait(), timeout=min(remaining, 1.0))
+                except asyncio.TimeoutError:
+                    pass
+
+    def _select(self) -> Optional[PooledProxy]:
+        """Lowest score among proxies below their cap whose breaker allows a call"""
+        candidates = sorted(
+            (p for p in self._proxies.values()
+             if p.inflight < self.max_per_proxy and p.breaker.state != CircuitBreaker.OPEN),
+            key=lambda p: p.score,
+        )
+        for proxy in candidates:
+            if proxy.breaker.allow():
+                return proxy
+        return None
+
+    def _record(self, proxy: PooledProxy, success: bool, latency_ms: float = None) -> None:
+        """Feed a tunnel outcome into the proxy's breaker and latency average"""
+        if success:
+            proxy.breaker.record_success()
+            if latency_ms is not None:
+                proxy.latency_ms += self.latency_alpha * (latency_ms - proxy.latency_ms)
+        else:
+            proxy.breaker.record_failure()
+
+    async def _release(self, proxy: PooledProxy) -> None:
+        """Free the proxy's slot and wake a waiter"""
+        async with self._condition:
+            proxy.inflight = max(0, proxy.inflight - 1)
+            self._condition.notify()
+
+    async def _refresh_if_stale(self) -> None:
+        """Reload the proxy list from the database every refresh_interval seconds"""
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+            return
+        from asgiref.sync import sync_to_async
+        await sync_to_async(self.load)()
+
+    def _bind_loop(self) -> None:
+        """Reset per-loop state when called from a new event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._condition = asyncio.Condition()
+        for proxy in self._proxies.values():
+            proxy.inflight = 0
+
+
+async def _resolve(host: str, port: int) -> Tuple[int, tuple]:
+    """Socket family and address for an IP literal or hostname"""
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        family, _, _, _, sockaddr = infos[0]
+        return family, sockaddr
+    if ip.version == 6:
+        return socket.AF_INET6, (host, port, 0, 0)
+    return socket.AF_INET, (host, port)
+
+
+@asynccontextmanager
+async def connect_socket(host: str, port: int, timeout: float,
+                         use_proxy_pool: bool = None) -> AsyncIterator[socket.socket]:
+    """
+    Open an outbound TCP socket for a probe, directly or through the proxy pool
+
+    Args:
+        host: Target address
+        port: Target port
+        timeout: Connect timeout in seconds
+        use_proxy_pool: Route through the proxy pool (default: PROBE_USE_PROXY_POOL)
+
+    Yields:
+        Connected non-blocking socket; wrap it with asyncio.open_connection(sock=...)
+    """
+    if use_proxy_pool is None:
+        use_proxy_pool = getattr(settings, 'PROBE_USE_PROXY_POOL', False)
+
+    if use_proxy_pool:
+        async with get_proxy_pool().connect(host, port, timeout) as sock:
+            yield sock
+        return
+
+    loop = asyncio.get_running_loop()
+    address = await _resolve(host, port)
+    sock = socket.socket(address[0], socket.SOCK_STREAM)
+    sock.setblocking(False)
+    try:
+        await asyncio.wait_for(loop.sock_connect(sock, address[1]), timeout=timeout)
+    except BaseException:
+        sock.close()
+        raise
+    yield sock
+
+
+# Global proxy pool instance
+_proxy_pool = None
+
+def get_proxy_pool() -> ProxyPool:
+    """Get the global proxy pool instance"""
+    global _proxy_pool
+    if _proxy_pool is None:
+        _proxy_pool = ProxyPool()
+    return _proxy_pool
@@ -11,13 +11,19 @@ from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
 
 from django.conf import settings
-from django.db import transaction, models
+from django.db import IntegrityError, transaction, models
 from django.utils import timezone
 from internet.models import ScannerJob, JobQueue, JobWorker, Scan, AncillaryJob
 
 logger = logging.getLogger(__name__)
 
 
+# Masscan discoveries are written, and checked against the freshness index, in chunks of this size
+DISCOVERY_CHUNK_SIZE = 500
+# Seconds a discovery may wait for its chunk to fill before it is written anyway
+DISCOVERY_FLUSH_INTERVAL = 2.0
+
+
 class QueueService:
     """Service for managing scanner job queues"""
     
@@ -37,6 +43,9 @@ class QueueService:
         # Register worker
         self.worker = await self._register_worker(supported_job_types, max_concurrent_jobs)
         
+        if 'banner_grab' in supported_job_types:
+            await self._preload_service_probes()
+        
         logger.info(f"Started queue worker: {self.worker_id}")
         
         # Start heartbeat and job processing
@@ -50,6 +59,16 @@ class QueueService:
         finally:
             await self._cleanup_worker()
     
+    async def _preload_service_probes(self):
+        """Parse nmap-service-probes before the first banner job needs it"""
+        from .service_probes import get_service_probe_db
+        from asgiref.sync import sync_to_async
+        
+        try:
+            await sync_to_async(get_service_probe_db, thread_sensitive=False)()
+        except Exception as e:
+            logger.warning(f"Failed to load service probes: {e}")
+    
     async def _register_worker(self, supported_job_types: List[str], max_concurrent_jobs: int) -> JobWorker:
         """Register this worker in the database"""
         from asgiref.sync import sync_to_async
@@ -305,12 +324,16 @@ class QueueService:
         from asgiref.sync import sync_to_async
         import re
         from .banner_grabber import get_banner_grabber
+        from .probe_freshness import get_probe_freshness_index
         
         # Store discovered ports for banner grabbing
         discovered_ports = []
         
-        def process_discovery(host_ip, port_number, proto, current_time, scan):
-            """Process a discovered port and queue ancillary jobs"""
+        freshness = get_probe_freshness_index()
+        force_refresh = (job.scan_options or {}).get('force_refresh', False)
+        
+        def process_discovery(host_ip, port_number, proto, current_time, scan, fresh):
+            """Process a discovered port and queue ancillary jobs not covered by its fresh probe types"""
             from internet.models import Host, Port, AncillaryJob
             
             # Get or create host
@@ -340,25 +363,30 @@ class QueueService:
                     status='open'
                 )
             
+            # A new host has nothing fresh, whatever the index still holds for its IP
+            if host_created:
+                fresh = set()
+            
             # Queue banner grab job for this port
-            banner_job = AncillaryJob.objects.create(
-                job_type='banner_grab',
-                host_ip=host_ip,
-                port_number=port_number,
-                protocol=proto,
-                port=port_obj,
-                host=host_obj,
-                scanner_job=job,
-                status='pending',
-                priority=0
-            )
+            if 'banner_grab' not in fresh:
+                banner_job = AncillaryJob.objects.create(
+                    job_type='banner_grab',
+                    host_ip=host_ip,
+                    port_number=port_number,
+                    protocol=proto,
+                    port=port_obj,
+                    host=host_obj,
+                    scanner_job=job,
+                    status='pending',
+                    priority=0
+                )
             
             # Queue domain enumeration job for this host (only once per host)
-            if host_created or not AncillaryJob.objects.filter(
+            if 'domain_enum' not in fresh and (host_created or not AncillaryJob.objects.filter(
                 host=host_obj, 
                 job_type='domain_enum', 
                 status__in=['pending', 'running', 'completed']
-            ).exists():
+            ).exists()):
                 domain_job = AncillaryJob.objects.create(
                     job_type='domain_enum',
                     host_ip=host_ip,
@@ -375,7 +403,7 @@ class QueueService:
             elif host_obj.needs_geolocation_update():
                 should_queue_geo = True
             
-            if should_queue_geo and not AncillaryJob.objects.filter(
+            if should_queue_geo and 'geolocation' not in fresh and not AncillaryJob.objects.filter(
                 host=host_obj,
                 job_type='geolocation',
                 status__in=['pending', 'running', 'completed']
@@ -389,8 +417,22 @@ class QueueService:
                     priority=2  # Lower priority than banner/domain jobs
                 )
             
+            # Queue open relay check for DNS ports
+            if port_number == 53 and 'dns_relay' not in fresh:
+                relay_job = AncillaryJob.objects.create(
+                    job_type='dns_relay',
+                    host_ip=host_ip,
+                    port_number=port_number,
+                    protocol=proto,
+                    port=port_obj,
+                    host=host_obj,
+                    scanner_job=job,
+                    status='pending',
+                    priority=2
+                )
+            
             # Queue SSL certificate job for HTTPS ports
-            if port_number in [443, 8443, 9443, 10443]:
+            if port_number in [443, 8443, 9443, 10443] and 'ssl_cert' not in fresh:
                 ssl_job = AncillaryJob.objects.create(
                     job_type='ssl_cert',
                     host_ip=host_ip,
@@ -405,6 +447,47 @@ class QueueService:
             
             return f'Queued ancillary jobs for {host_ip}:{port_number}/{proto}', host_created, port_obj
         
+        def process_discoveries(discoveries, scan):
+            """Process a chunk of discovered ports with one freshness lookup for all of them"""
+            # Probe types completed recently enough that a rescan need not repeat them
+            fresh_by_target = {} if force_refresh else freshness.fresh_probe_types_bulk(
+                (host_ip, port_number, proto) for host_ip, port_number, proto, _ in discoveries
+            )
+            return [
+                process_discovery(host_ip, port_number, proto, current_time, scan,
+                                  fresh_by_target.get((host_ip, port_number, proto), set()))
+                for host_ip, port_number, proto, current_time in discoveries
+            ]
+        
+        # Discoveries waiting to be written, flushed in chunks or when the oldest has waited long enough
+        pending_discoveries = []
+        pending_since = None
+        
+        async def flush_discoveries():
+            nonlocal pending_since
+            if not pending_discoveries:
+                return
+            chunk = list(pending_discoveries)
+            pending_discoveries.clear()
+            pending_since = None
+            results = await sync_to_async(process_discoveries)(chunk, job.scan)
+            for (host_ip, _, _, _), (result, host_created, _) in zip(chunk, results):
+                if host_created:
+                    logger.info(f'New host discovered: {host_ip}')
+                logger.info(result)
+        
+        async def flush_when_due():
+            """Flush waiting discoveries on time even when masscan goes quiet"""
+            while True:
+                if pending_since is None:
+                    await asyncio.sleep(DISCOVERY_FLUSH_INTERVAL / 4)
+                    continue
+                remaining = pending_since + DISCOVERY_FLUSH_INTERVAL - time.monotonic()
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+                else:
+                    await flush_discoveries()
+        
         async def parse_stdout(stdout_line):
             """Parse masscan output"""
             port_pattern = r'Discovered open port (\d+)/(\w+) on ([0-9\.]+)'
@@ -415,13 +498,12 @@ class QueueService:
                 host_ip = match.group(3)
                 current_time = timezone.now()
                 
-                result, host_created, port_obj = await sync_to_async(process_discovery)(
-                    host_ip, port_number, proto, current_time, job.scan
-                )
-                
-                if host_created:
-                    logger.info(f'New host discovered: {host_ip}')
-                logger.info(result)
+                nonlocal pending_since
+                pending_discoveries.append((host_ip, port_number, proto, current_time))
+                if pending_since is None:
+                    pending_since = time.monotonic()
+                if len(pending_discoveries) >= DISCOVERY_CHUNK_SIZE:
+                    await flush_discoveries()
         
         async def read_stream(stream, callback):
             """Read from stream and call callback for each line"""
@@ -447,6 +529,7 @@ class QueueService:
         # Process output concurrently
         stdout_task = asyncio.create_task(read_stream(process.stdout, parse_stdout))
         stderr_task = asyncio.create_task(read_stream(process.stderr, None))
+        flush_task = asyncio.create_task(flush_when_due())
         
         try:
             # Wait for both streams and process to complete with timeout
@@ -455,6 +538,11 @@ class QueueService:
                 timeout=timeout
             )
             
+            await flush_discoveries()
+            if flush_task.done():
+                # The periodic flush only stops early on an error
+                raise flush_task.exception()
+            
             if process.returncode != 0:
                 raise Exception(f"Masscan failed with return code {process.returncode}")
             
@@ -478,10 +566,14 @@ class QueueService:
             stderr_task.cancel()
             
             raise Exception(f"Masscan scan timed out after {timeout} seconds")
+        finally:
+            flush_task.cancel()
+            await asyncio.gather(flush_task, return_exceptions=True)
+            # Ports found before a timeout or read error still get their follow-up jobs
+            await flush_discoveries()
     
     async def _process_post_discovery_analysis_job(self, job: 'AncillaryJob'):
         """Process a single post-discovery analysis job (banner grab, domain enum, SSL cert, etc.)"""
-        from asgiref.sync import sync_to_async
         
         job_id = f"ancillary_{job.job_uuid}"
         self.current_jobs[job_id] = job
@@ -498,65 +590,216 @@ class QueueService:
                 result_data = await self._process_ssl_cert(job)
             elif job.job_type == 'geolocation':
                 result_data = await self._process_geolocation(job)
+            elif job.job_type == 'dns_relay':
+                result_data = await self._process_dns_relay(job)
             else:
                 logger.warning(f'Unknown job type: {job.job_type}')
                 result_data = {'error': f'Unknown job type: {job.job_type}'}
             
             # Mark job as completed
-            def _mark_completed():
-                from django.db import transaction
-                with transaction.atomic():
-                    job.status = 'completed'
-                    job.completed_at = timezone.now()
-                    if result_data:
-                        job.result_data = result_data
-                    job.save(update_fields=['status', 'completed_at', 'result_data'])
-            
-            await sync_to_async(_mark_completed)()
+            await self._mark_ancillary_completed(job, result_data)
             logger.info(f"Completed ancillary job {job_id}")
             
         except Exception as e:
             logger.error(f"Ancillary job {job_id} failed: {e}")
-            
-            def _mark_failed():
-                from django.db import transaction
-                with transaction.atomic():
-                    job.status = 'failed'
-                    job.completed_at = timezone.now()
-                    job.error_message = str(e)
-                    job.save(update_fields=['status', 'completed_at', 'error_message'])
-            
-            await sync_to_async(_mark_failed)()
+            await self._mark_ancillary_failed(job, str(e))
         finally:
             # Clean up
             if job_id in self.current_jobs:
                 del self.current_jobs[job_id]
     
+    async def _mark_ancillary_completed(self, job: 'AncillaryJob', result_data: dict):
+        """Mark an ancillary job as completed with its result data"""
+        from .probe_freshness import get_probe_freshness_index
+        from asgiref.sync import sync_to_async
+        
+        def _mark_completed():
+            from django.db import transaction
+            with transaction.atomic():
+                job.status = 'completed'
+                job.completed_at = timezone.now()
+                if result_data:
+                    job.result_data = result_data
+                job.save(update_fields=['status', 'completed_at', 'result_data'])
+            
+            # Let rescans skip this endpoint until the probe type's TTL runs out
+            try:
+                get_probe_freshness_index().mark_job(job)
+            except Exception as e:
+                logger.warning(f"Failed to record probe freshness for {job.host_ip}: {e}")
+        
+        await sync_to_async(_mark_completed)()
+    
+    async def _mark_ancillary_failed(self, job: 'AncillaryJob', error_message: str):
+        """Mark an ancillary job as failed"""
+        from asgiref.sync import sync_to_async
+        
+        def _mark_failed():
+            from django.db import transaction
+            with transaction.atomic():
+                job.status = 'failed'
+                job.completed_at = timezone.now()
+                job.error_message = error_message
+                job.save(update_fields=['status', 'completed_at', 'error_message'])
+        
+        await sync_to_async(_mark_failed)()
+    
     async def _process_banner_grab(self, job: 'AncillaryJob') -> dict:
         """Process banner grab job with intelligent analysis and follow-up queuing"""
-        from .banner_grabber import get_banner_grabber
-        from .banner_analyzer import BannerAnalyzer
+        from .banner_grabber import BannerResult, HTTP_PORTS, HTTPS_PORTS, get_banner_grabber
+        from .domain_enumerator import get_domain_enumerator
+        from .probe_freshness import get_probe_freshness_index
+        from .tls_endpoint import get_tls_endpoint_prober
         from asgiref.sync import sync_to_async
         
         banner_grabber = get_banner_grabber()
-        banner_analyzer = BannerAnalyzer()
         
-        # Grab banner
-        banner = await banner_grabber.grab_banner(
-            job.host_ip, 
-            job.port_number, 
-            job.protocol
+        # HTTPS ports get one TLS handshake that yields the certificate, session
+        # parameters and HTTP fingerprint, replacing separate ssl_cert/domain_enum connections
+        tls_endpoint = None
+        fingerprint = None
+        if job.protocol == 'tcp' and job.port_number in HTTPS_PORTS and getattr(settings, 'TLS_ENDPOINT_PROBE', True):
+            tls_endpoint = await get_tls_endpoint_prober().probe(job.host_ip, job.port_number)
+            if tls_endpoint:
+                fingerprint = tls_endpoint.http
+        # Other web ports get a full HTTP fingerprint; the same result feeds domain enumeration
+        elif job.protocol == 'tcp' and job.port_number in HTTP_PORTS | HTTPS_PORTS:
+            fingerprint = await get_domain_enumerator().http_fingerprinter.fingerprint(
+                job.host_ip, job.port_number
+            )
+        
+        if fingerprint:
+            grab_result = BannerResult(
+                host=job.host_ip,
+                port=job.port_number,
+                protocol='tcp',
+                probe='GetRequest',
+                raw=fingerprint.raw_head,
+                banner=fingerprint.banner,
+                tls=fingerprint.tls,
+            )
+        elif tls_endpoint:
+            # TLS service that does not speak HTTP; summarize the session instead
+            grab_result = BannerResult(
+                host=job.host_ip,
+                port=job.port_number,
+                protocol='tcp',
+                probe='NULL',
+                raw=b'',
+                banner=tls_endpoint.banner,
+                tls=True,
+            )
+        else:
+            # Grab banner, keeping the raw response for service probe matching
+            grab_result = await banner_grabber.grab(
+                job.host_ip, 
+                job.port_number, 
+                job.protocol
+            )
+        banner = grab_result.banner if grab_result else None
+        
+        cert_data = tls_endpoint.certificate if tls_endpoint else None
+        result_data = await self._apply_banner_result(
+            job, banner, cert_captured=bool(cert_data), raw=grab_result.raw if grab_result else None
         )
         
+        if tls_endpoint:
+            result_data['tls'] = tls_endpoint.tls_dict()
+            result_data['certificate'] = cert_data
+            if cert_data and job.host_id and job.port_id:
+                await sync_to_async(self._save_certificate)(job.host_id, job.port_id, cert_data)
+                await sync_to_async(self._complete_ssl_cert_jobs)(job, cert_data)
+                await sync_to_async(get_probe_freshness_index().mark_fresh)(
+                    'ssl_cert', [(job.host_ip, job.port_number, job.protocol)]
+                )
+        
+        if fingerprint:
+            # Redirect and cookie hosts are only candidates; domain enumeration validates them
+            result_data['http'] = fingerprint.to_dict()
+        
+        if grab_result and grab_result.raw and grab_result.probe != 'nmap':
+            # Regex matching is CPU-bound; keep it off the loop serving the other probes
+            service_match = await sync_to_async(self._match_service_probes, thread_sensitive=False)(grab_result)
+            if service_match:
+                result_data['service_match'] = service_match.to_dict()
+        
+        return result_data
+    
+    def _match_service_probes(self, grab_result) -> Optional[Any]:
+        """Classify a raw probe response with the nmap-service-probes rules"""
+        from .service_probes import get_service_probe_db
+        
+        try:
+            return get_service_probe_db().match(
+                grab_result.raw,
+                probe=grab_result.probe,
+                port=grab_result.port,
+                protocol=grab_result.protocol,
+            )
+        except Exception as e:
+            logger.warning(f"Service probe matching failed for {grab_result.host}:{grab_result.port}: {e}")
+            return None
+    
+    async def process_banner_grab_batch_nmap(self, jobs: List['AncillaryJob'], scanner=None) -> int:
+        """
+        Fingerprint many banner grab jobs with batched nmap runs
+        
+        Args:
+            jobs: Claimed (running) banner_grab jobs
+            scanner: Optional NmapBatchScanner (default settings if omitted)
+            
+        Returns:
+            Number of jobs completed
+        """
+        from .nmap_batch import NmapBatchScanner
+        
+        scanner = scanner or NmapBatchScanner()
+        jobs_by_target: Dict[tuple, List[AncillaryJob]] = {}
+        for job in jobs:
+            jobs_by_target.setdefault((job.host_ip, job.port_number), []).append(job)
+        
+        completed = 0
+        
+        async def on_result(host: str, port: int, banner: Optional[str]):
+            nonlocal completed
+            for job in jobs_by_target.get((host, port), []):
+                try:
+                    result_data = await self._apply_banner_result(job, banner)
+                    result_data['source'] = 'nmap_batch'
+                    await self._mark_ancillary_completed(job, result_data)
+                    completed += 1
+                except Exception as e:
+                    logger.error(f"Banner grab job {job.job_uuid} failed: {e}")
+                    await self._mark_ancillary_failed(job, str(e))
+        
+        await scanner.scan(jobs_by_target.keys(), on_result)
+        return completed
+    
+    async def _apply_banner_result(self, job: 'AncillaryJob', banner: Optional[str],
+                                   cert_captured: bool = False, raw: Optional[bytes] = None) -> dict:
+        """Persist a grabbed banner, analyze it and queue follow-up jobs
+
+        cert_captured skips the ssl_cert follow-up when the certificate was
+        already read during the banner grab. raw is the untruncated response,
+        kept compressed alongside the banner text the first time it is seen.
+        """
+        from .banner_analyzer import get_banner_analyzer
+        from asgiref.sync import sync_to_async
+        
+        # A due signature reload stats the file and may recompile every pattern
+        banner_analyzer = await sync_to_async(get_banner_analyzer, thread_sensitive=False)()
+        
         result_data = {'banner': banner or ''}
         
         if banner and job.port_id:
-            # Update port with banner
+            # Point the port at the shared banner row
             def update_port_banner():
                 try:
                     from internet.models import Port
+                    from .banner_store import get_banner_store
+                    banner_id = get_banner_store().intern(banner, raw)
                     # Avoid relation access in async context by using the FK id
-                    Port.objects.filter(id=job.port_id).update(banner=banner)
+                    Port.objects.filter(id=job.port_id).update(banner_ref_id=banner_id, banner=None)
                 except Exception as e:
                     logger.warning(f"Failed to update port banner: {e}")
             
@@ -566,7 +809,7 @@ class QueueService:
             detections = banner_analyzer.analyze_banner(banner, job.port_number)
             
             # Queue SSL certificate grab if appropriate
-            if banner_analyzer.should_queue_ssl_cert(detections):
+            if not cert_captured and banner_analyzer.should_queue_ssl_cert(detections):
                 await self._queue_ssl_cert_job(job, detections)
             
             # Queue domain enumeration if appropriate
@@ -574,18 +817,39 @@ class QueueService:
                 await self._queue_domain_enum_job(job, detections)
             
             # Add detection results to the banner grab result
-            result_data['detections'] = [
-                {
-                    'service_type': detection.service_type.value,
-                    'confidence': detection.confidence,
-                    'version': detection.version,
-                    'additional_info': detection.additional_info
-                }
-                for detection in detections
-            ]
+            result_data['detections'] = [detection.to_dict() for detection in detections]
+            result_data['signature_version'] = banner_analyzer.signature_version
+            
+            # Keep the indexed detection table in step with the job result
+            def save_detections():
+                try:
+                    from .service_detections import replace_service_detections
+                    replace_service_detections(
+                        {job.port_id: result_data['detections']},
+                        signature_version=banner_analyzer.signature_version,
+                    )
+                except Exception as e:
+                    logger.warning(f"Failed to save service detections: {e}")
+            
+            await sync_to_async(save_detections)()
         
         return result_data
     
+    def _complete_ssl_cert_jobs(self, banner_job: 'AncillaryJob', cert_data: Dict) -> int:
+        """Close pending ssl_cert jobs for a port whose certificate the banner grab already read"""
+        from internet.models import AncillaryJob
+        
+        return AncillaryJob.objects.filter(
+            job_type='ssl_cert',
+            host_ip=banner_job.host_ip,
+            port_number=banner_job.port_number,
+            status__in=['pending', 'queued'],
+        ).update(
+            status='completed',
+            completed_at=timezone.now(),
+            result_data={'certificate': cert_data, 'source': 'tls_endpoint'},
+        )
+    
     async def _queue_ssl_cert_job(self, banner_job: 'AncillaryJob', detections: List) -> None:
         """Queue SSL certificate grab job based on banner analysis"""
         from asgiref.sync import sync_to_async
@@ -685,36 +949,82 @@ class QueueService:
         """Process domain enumeration job"""
         from .domain_enumerator import get_domain_enumerator
         from asgiref.sync import sync_to_async
-        from internet.models import Domain
         
         domain_enumerator = get_domain_enumerator()
         
+        # Probe only ports the scans saw open and reuse certificates/fingerprints already collected
+        scan_data = {}
+        if job.host_id:
+            scan_data = await sync_to_async(self._load_host_scan_data)(job.host_id)
+        
         # Enumerate domains
-        domains = await domain_enumerator.enumerate_domains(job.host_ip)
+        domains = await domain_enumerator.enumerate_domains(job.host_ip, **scan_data)
         
         result_data = {'domains': domains}
         
         if domains and job.host_id:
             # Save domains to database using sync_to_async
-            def save_domains():
-                for domain_name in domains:
-                    domain, created = Domain.objects.get_or_create(
-                        name=domain_name,
-                        defaults={'host_id': job.host_id}
-                    )
-                    if not created and domain.host_id != job.host_id:
-                        domain.host_id = job.host_id
-                        domain.save()
-            
-            await sync_to_async(save_domains)()
+            await sync_to_async(self._save_domains)(job.host_id, domains)
         
         return result_data
     
+    def _save_domains(self, host_id: int, domains: List[str]) -> None:
+        """Create or re-point Domain rows for a host"""
+        from internet.models import Domain
+        
+        for domain_name in domains:
+            domain, created = Domain.objects.get_or_create(
+                name=domain_name,
+                defaults={'host_id': host_id}
+            )
+            if not created and domain.host_id != host_id:
+                domain.host_id = host_id
+                domain.save()
+    
+    def _load_host_scan_data(self, host_id: int) -> dict:
+        """Open ports, stored certificates and HTTP fingerprints already collected for a host"""
+        from .ssl_cert_grabber import get_ssl_cert_grabber
+        from internet.models import Port, SSLCertificate
+        
+        open_ports = list(
+            Port.objects.filter(host_id=host_id, proto='tcp', status='open')
+            .values_list('port_number', flat=True)
+        )
+        
+        cert_parser = get_ssl_cert_grabber()
+        cert_ports = []
+        known_domains = set()
+        stored = SSLCertificate.objects.filter(host_id=host_id).values_list(
+            'port__port_number', 'subject_cn', 'pem_data'
+        )
+        for port_number, subject_cn, pem_data in stored:
+            cert_ports.append(port_number)
+            if subject_cn:
+                known_domains.add(subject_cn)
+            known_domains.update(cert_parser.extract_domains_from_stored(pem_data))
+        
+        fingerprinted_ports = []
+        fingerprints = AncillaryJob.objects.filter(
+            host_id=host_id,
+            job_type='banner_grab',
+            status='completed',
+            result_data__has_key='http',
+        ).values_list('port_number', 'result_data')
+        for port_number, result_data in fingerprints:
+            fingerprinted_ports.append(port_number)
+            known_domains.update(result_data['http'].get('domains') or [])
+        
+        return {
+            'open_ports': open_ports,
+            'known_domains': list(known_domains),
+            'cert_ports': cert_ports,
+            'fingerprinted_ports': fingerprinted_ports,
+        }
+    
     async def _process_ssl_cert(self, job: 'AncillaryJob') -> dict:
         """Process SSL certificate grab job"""
         from .ssl_cert_grabber import get_ssl_cert_grabber
         from asgiref.sync import sync_to_async
-        from internet.models import SSLCertificate
 
         ssl_cert_grabber = get_ssl_cert_grabber()
 
@@ -724,43 +1034,69 @@ class QueueService:
 
         result_data = {'certificate': cert_data} if cert_data else {'certificate': None}
 
-        # Map grabber data -> model fields
         if cert_data and job.host_id and job.port_id:
-            def save_ssl_cert():
-                # The model uses unique fingerprint; prefer sha256 if available else sha1
-                fingerprint = cert_data.get('fingerprint_sha256') or cert_data.get('fingerprint_sha1') or ''
-                pem_hex = cert_data.get('raw_certificate', '')
+            await sync_to_async(self._save_certificate)(job.host_id, job.port_id, cert_data)
+
+        return result_data
+    
+    def _save_certificate(self, host_id: int, port_id: int, cert_data: Dict) -> None:
+        """Map grabber certificate data onto an SSLCertificate row for host/port"""
+        from internet.models import SSLCertificate
 
-                ssl_cert, created = SSLCertificate.objects.get_or_create(
+        # The model uses unique fingerprint; prefer sha256 if available else sha1
+        fingerprint = cert_data.get('fingerprint_sha256') or cert_data.get('fingerprint_sha1') or ''
+
+        # A fingerprint always identifies the same certificate content, so a
+        # known certificate only needs its latest host/port observation recorded
+        observed = SSLCertificate.objects.filter(fingerprint=fingerprint).update(
+            host_id=host_id,
+            port_id=port_id,
+            updated_at=timezone.now(),
+        )
+        if observed:
+            return
+
+        subject = cert_data.get('subject') or {}
+        issuer = cert_data.get('issuer') or {}
+        try:
+            with transaction.atomic():
+                SSLCertificate.objects.create(
                     fingerprint=fingerprint,
-                    defaults={
-                        'pem_data': pem_hex,
-                        'subject_cn': (cert_data.get('subject') or {}).get('commonName') or (cert_data.get('subject') or {}).get('CN') or None,
-                        'issuer_cn': (cert_data.get('issuer') or {}).get('commonName') or (cert_data.get('issuer') or {}).get('CN') or None,
-                        'valid_from': cert_data.get('not_before') or '',
-                        'valid_until': cert_data.get('not_after') or '',
-                        'host_id': job.host_id,
-                        'port_id': job.port_id,
-                    }
+                    pem_data=cert_data.get('raw_certificate') or '',
+                    subject_cn=subject.get('commonName') or subject.get('CN') or None,
+                    issuer_cn=issuer.get('commonName') or issuer.get('CN') or None,
+                    valid_from=cert_data.get('not_before') or '',
+                    valid_until=cert_data.get('not_after') or '',
+                    host_id=host_id,
+                    port_id=port_id,
                 )
+        except IntegrityError:
+            # Another worker inserted the same certificate first
+            SSLCertificate.objects.filter(fingerprint=fingerprint).update(
+                host_id=host_id,
+                port_id=port_id,
+                updated_at=timezone.now(),
+            )
+    
+    async def _process_dns_relay(self, job: 'AncillaryJob') -> dict:
+        """Check whether a DNS server recursively resolves for anyone"""
+        from .dns_relay import get_dns_relay_checker
+        from asgiref.sync import sync_to_async
+        from internet.models import DNSRelay
 
-                if not created:
-                    # Update fields if anything changed
-                    ssl_cert.pem_data = pem_hex or ssl_cert.pem_data
-                    ssl_cert.subject_cn = (cert_data.get('subject') or {}).get('commonName') or ssl_cert.subject_cn
-                    ssl_cert.issuer_cn = (cert_data.get('issuer') or {}).get('commonName') or ssl_cert.issuer_cn
-                    ssl_cert.valid_from = cert_data.get('not_before') or ssl_cert.valid_from
-                    ssl_cert.valid_until = cert_data.get('not_after') or ssl_cert.valid_until
-                    # Ensure FK associations are intact
-                    if ssl_cert.host_id != job.host_id:
-                        ssl_cert.host_id = job.host_id
-                    if ssl_cert.port_id != job.port_id:
-                        ssl_cert.port_id = job.port_id
-                    ssl_cert.save()
+        result = await get_dns_relay_checker().check(job.host_ip, job.port_number or 53)
 
-            await sync_to_async(save_ssl_cert)()
+        if result and job.port_id:
+            def save_relay():
+                if result['open_relay']:
+                    DNSRelay.objects.get_or_create(port_id=job.port_id)
+                else:
+                    # The server stopped relaying since it was last recorded
+                    DNSRelay.objects.filter(port_id=job.port_id).delete()
 
-        return result_data
+            await sync_to_async(save_relay)()
+
+        return {'dns_relay': result}
     
     async def _process_geolocation(self, job: 'AncillaryJob') -> dict:
         """Process geolocation job for a host"""
@@ -909,6 +1245,10 @@ class QueueService:
                 self.worker.save()
         
         await sync_to_async(_cleanup)()
+        
+        # Geolocation jobs share a pooled HTTP session bound to this loop
+        from internet.lib.geolocation import close_geolocation_http
+        await close_geolocation_http()
         logger.info(f"Worker {self.worker_id} cleaned up")
 
 
@@ -927,14 +1267,7 @@ class QueueManager:
         scheduled_for: datetime = None
     ) -> ScannerJob:
         """Create a new scanner job"""
-        queue, created = JobQueue.objects.get_or_create(
-            name=queue_name,
-            defaults={
-                'description': f'Default queue for {queue_name}',
-                'max_concurrent_jobs': 5,
-                'priority': 0
-            }
-        )
+        queue = QueueManager._get_or_create_queue(queue_name)
         
         job = ScannerJob.objects.create(
             job_type=job_type,
@@ -950,6 +1283,52 @@ class QueueManager:
         logger.info(f"Created job {job.job_uuid}: {job_type} - {target}")
         return job
     
+    @staticmethod
+    def create_jobs(
+        job_type: str,
+        targets: List[str],
+        queue_name: str = 'default',
+        ports: List[int] = None,
+        scan_options: Dict[str, Any] = None,
+        priority: int = 0,
+        user=None,
+        scheduled_for: datetime = None,
+        batch_size: int = 1000
+    ) -> List[ScannerJob]:
+        """Create scanner jobs for many targets with one queue lookup and multi-row INSERTs"""
+        queue = QueueManager._get_or_create_queue(queue_name)
+        
+        jobs = [
+            ScannerJob(
+                job_type=job_type,
+                target=target,
+                queue=queue,
+                ports=list(ports or []),
+                scan_options=dict(scan_options or {}),
+                priority=priority,
+                user=user,
+                scheduled_for=scheduled_for
+            )
+            for target in targets
+        ]
+        jobs = ScannerJob.objects.bulk_create(jobs, batch_size=batch_size)
+        
+        logger.info(f"Created {len(jobs)} {job_type} jobs in queue {queue_name}")
+        return jobs
+    
+    @staticmethod
+    def _get_or_create_queue(queue_name: str) -> JobQueue:
+        """Get a queue by name, creating it with default settings if missing"""
+        queue, created = JobQueue.objects.get_or_create(
+            name=queue_name,
+            defaults={
+                'description': f'Default queue for {queue_name}',
+                'max_concurrent_jobs': 5,
+                'priority': 0
+            }
+        )
+        return queue
+    
     @staticmethod
     def get_job_status(job_uuid: str) -> Optional[Dict[str, Any]]:
         """Get job status and details"""
@@ -0,0 +1,126 @@
+"""
+Token bucket rate limiter for outbound API calls, adjustable from server-reported quotas
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Continuously refilling token bucket that can be re-synced to an upstream's quota window.
+
+    Callers reserve tokens up front and sleep for the returned delay, so
+    concurrent callers queue up behind each other instead of all retrying
+    at once. Thread-safe; usable from threads and event loops alike.
+    """
+
+    def __init__(self, rate: float, capacity: float = None, name: str = '',
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum burst (default: one second's worth, at least 1)
+            name: Label used in log messages
+            clock: Monotonic time source (injectable for tests)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.name = name
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        # Set while the upstream has told us when its current quota window resets
+        self._reset_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> float:
+        """Tokens available now (negative while reservations are outstanding)"""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def reserve(self, tokens: float = 1, max_wait: float = None) -> Optional[float]:
+        """
+        Take tokens, going into debt if necessary
+
+        Args:
+            tokens: Tokens needed for the call
+            max_wait: Give up instead of reserving if the wait would be longer
+
+        Returns:
+            Seconds the caller must wait before making the call, or None if that exceeds max_wait
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            deficit = -self._tokens
+            if self._reset_at is not None:
+                # The next window brings a full bucket; only debt beyond that refills gradually
+                delay = self._reset_at - self._clock() + max(0.0, deficit - self.capacity) / self.rate
+            else:
+                delay = deficit / self.rate
+            if max_wait is not None and delay > max_wait:
+                self._tokens += tokens
+                return None
+            return delay
+
+    async def acquire(self, tokens: float = 1, max_wait: float = None) -> bool:
+        """Wait on the event loop until the tokens are ours; False if that would exceed max_wait"""
+        delay = self.reserve(tokens, max_wait)
+        if delay is None:
+            return False
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return True
+
+    def acquire_blocking(self, tokens: float = 1, max_wait: float = None) -> bool:
+        """Block the calling thread until the tokens are ours; False if that would exceed max_wait"""
+        delay = self.reserve(tokens, max_wait)
+        if delay is None:
+            return False
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    def update(self, remaining: float, reset_after: float) -> None:
+        """
+        Re-sync to the upstream's own accounting
+
+        Args:
+            remaining: Calls the upstream says are left in its current window
+            reset_after: Seconds until that window resets
+        """
+        with self._lock:
+            self._refill()
+            # Callers still sleeping on a reservation will spend from what the upstream reports
+            self._tokens = min(float(remaining), self.capacity) + min(self._tokens, 0.0)
+            self._reset_at = self._clock() + max(0.0, reset_after)
+
+    def penalize(self, retry_after: float) -> None:
+        """Empty the bucket after a throttling response until retry_after has passed"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0)
+            self._reset_at = self._clock() + max(0.0, retry_after)
+        logger.warning(f"Rate limited by {self.name or 'upstream'}, backing off {retry_after:.1f}s")
+
+    def _refill(self) -> None:
+        """Add tokens for elapsed time, or a full window once a reported reset has passed (lock held)"""
+        now = self._clock()
+        if self._reset_at is not None:
+            if now < self._reset_at:
+                self._updated = now
+                return
+            # New window: full quota minus reservations still waiting on it
+            self._tokens = self.capacity + min(self._tokens, 0.0)
+            self._updated = self._reset_at
+            self._reset_at = None
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
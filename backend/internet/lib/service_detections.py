@@ -0,0 +1,77 @@
+"""
+Bulk persistence of banner analysis results into the ServiceDetection table
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from internet.models import Port, ServiceDetection
+
+logger = logging.getLogger(__name__)
+
+
+# Column limits of the ServiceDetection model
+_PRODUCT_MAX_LENGTH = 100
+_VERSION_MAX_LENGTH = 255
+
+
+def _rows_for_port(port_id: int, detections: List[Dict[str, Any]],
+                   detected_at: datetime) -> List[ServiceDetection]:
+    """One row per distinct (service_type, product, version), keeping the highest confidence"""
+    best: Dict[tuple, Dict[str, Any]] = {}
+    for detection in detections:
+        if detection.get('service_type') in (None, 'unknown'):
+            continue
+        key = (
+            detection['service_type'],
+            (detection.get('product') or '')[:_PRODUCT_MAX_LENGTH] or None,
+            (detection.get('version') or '')[:_VERSION_MAX_LENGTH] or None,
+        )
+        if key not in best or detection['confidence'] > best[key]['confidence']:
+            best[key] = detection
+    return [
+        ServiceDetection(
+            port_id=port_id,
+            service_type=service_type,
+            product=product,
+            version=version,
+            confidence=detection['confidence'],
+            signature_version=detection.get('signature_version'),
+            detected_at=detected_at,
+        )
+        for (service_type, product, version), detection in best.items()
+    ]
+
+
+def replace_service_detections(detections_by_port: Dict[int, List[Dict[str, Any]]],
+                               batch_size: int = 1000, signature_version: Optional[int] = None) -> int:
+    """
+    Replace the stored detections of each port with a fresh analysis
+
+    Args:
+        detections_by_port: Serialized detections (ServiceDetection.to_dict() from the
+            banner analyzer) keyed by port id; an empty list clears the port
+        batch_size: Rows per multi-row insert
+        signature_version: Signature version the analysis ran with, stamped on the ports
+            so re-analysis can skip them even when nothing was detected
+
+    Returns:
+        Number of detection rows written
+    """
+    if not detections_by_port:
+        return 0
+    detected_at = timezone.now()
+    rows = [
+        row
+        for port_id, detections in detections_by_port.items()
+        for row in _rows_for_port(port_id, detections, detected_at)
+    ]
+    with transaction.atomic():
+        ServiceDetection.objects.filter(port_id__in=list(detections_by_port)).delete()
+        ServiceDetection.objects.bulk_create(rows, batch_size=batch_size)
+        if signature_version is not None:
+            Port.objects.filter(id__in=list(detections_by_port)).update(signature_version=signature_version)
+    return len(rows)
@@ -0,0 +1,384 @@
+"""
+In-process matcher for nmap-service-probes match/softmatch directives
+"""
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_SERVICE_PROBES_PATH = '/usr/share/nmap/nmap-service-probes'
+
+# Version-info template fields of a match line (p/vsftpd/ v/$1/ ...)
+TEMPLATE_FIELDS = {
+    'p': 'product',
+    'v': 'version',
+    'i': 'info',
+    'h': 'hostname',
+    'o': 'ostype',
+    'd': 'devicetype',
+}
+
+_C_ESCAPES = {
+    '\\': '\\', '0': '\0', 'a': '\a', 'b': '\b', 'f': '\f',
+    'n': '\n', 'r': '\r', 't': '\t', 'v': '\v',
+}
+
+_TEMPLATE_TOKEN = re.compile(
+    r'\$(\d)'
+    r'|\$P\((\d)\)'
+    r'|\$SUBST\((\d),"((?:[^"\\]|\\.)*)","((?:[^"\\]|\\.)*)"\)'
+    r'|\$I\((\d),"([<>])"\)'
+)
+
+
+@dataclass
+class ServiceMatch:
+    """Service and version information produced by a match rule"""
+    service: str
+    probe: str
+    soft: bool = False
+    product: Optional[str] = None
+    version: Optional[str] = None
+    info: Optional[str] = None
+    hostname: Optional[str] = None
+    ostype: Optional[str] = None
+    devicetype: Optional[str] = None
+    cpe: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        """Serialize for storage in job result data"""
+        data = {'service': self.service, 'probe': self.probe, 'soft': self.soft}
+        for name in TEMPLATE_FIELDS.values():
+            value = getattr(self, name)
+            if value:
+                data[name] = value
+        if self.cpe:
+            data['cpe'] = self.cpe
+        return data
+
+
+class MatchRule:
+    """A single match or softmatch line, compiled on first use"""
+
+    __slots__ = ('service', 'source', 'flags', 'templates', 'cpe', 'soft', '_regex')
+
+    def __init__(self, service: str, source: bytes, flags: int,
+                 templates: Dict[str, str], cpe: List[str], soft: bool):
+        self.service = service
+        self.source = source
+        self.flags = flags
+        self.templates = templates
+        self.cpe = cpe
+        self.soft = soft
+        self._regex = None
+
+    @property
+    def regex(self) -> Optional['re.Pattern']:
+        """Compiled pattern, or None when PCRE syntax is not supported by re"""
+        if self._regex is None:
+            try:
+                self._regex = re.compile(self.source, self.flags)
+            except (re.error, OverflowError) as e:
+                logger.debug(f"Skipping unsupported {self.service} pattern: {e}")
+                self._regex = False
+        return self._regex or None
+
+    def apply(self, raw: bytes, probe: str) -> Optional[ServiceMatch]:
+        """Return a ServiceMatch if the pattern matches the response"""
+        regex = self.regex
+        if regex is None:
+            return None
+        found = regex.search(raw)
+        if not found:
+            return None
+
+        result = ServiceMatch(service=self.service, probe=probe, soft=self.soft)
+        for key, name in TEMPLATE_FIELDS.items():
+            if key in self.templates:
+                value = _expand_template(self.templates[key], found)
+                if value:
+                    setattr(result, name, value)
+        result.cpe = [value for value in (_expand_template(c, found) for c in self.cpe) if value]
+        return result
+
+
+@dataclass
+class ServiceProbe:
+    """A Probe directive with its port hints and match rules"""
+    protocol: str
+    name: str
+    payload: bytes = b''
+    ports: Set[int] = field(default_factory=set)
+    sslports: Set[int] = field(default_factory=set)
+    rarity: Optional[int] = None
+    fallback: List[str] = field(default_factory=list)
+    matches: List[MatchRule] = field(default_factory=list)
+
+
+class ServiceProbeDB:
+    """Parsed nmap-service-probes file for classifying raw probe responses"""
+
+    def __init__(self, path: str = None):
+        self.path = path or getattr(settings, 'NMAP_SERVICE_PROBES_PATH', DEFAULT_SERVICE_PROBES_PATH)
+        # Keyed by (protocol, probe name)
+        self.probes: Dict[tuple, ServiceProbe] = {}
+        # Probes hinted for each port, in file order
+        self.port_index: Dict[tuple, List[ServiceProbe]] = {}
+        self.loaded = False
+
+    @property
+    def available(self) -> bool:
+        """Whether any probes were loaded"""
+        return bool(self.probes)
+
+    def load(self) -> 'ServiceProbeDB':
+        """Read and parse the probes file (missing files leave the database empty)"""
+        self.loaded = True
+        if not os.path.exists(self.path):
+            logger.warning(f"nmap-service-probes not found at {self.path}; in-process matching disabled")
+            return self
+
+        with open(self.path, 'rb') as f:
+            # latin-1 round-trips every byte so patterns keep their exact values
+            self.parse(f.read().decode('latin-1'))
+
+        rule_count = sum(len(probe.matches) for probe in self.probes.values())
+        logger.info(f"Loaded {len(self.probes)} service probes with {rule_count} match rules")
+        return self
+
+    def parse(self, text: str) -> None:
+        """Parse the directives of an nmap-service-probes file"""
+        current: Optional[ServiceProbe] = None
+
+        for lineno, line in enumerate(text.splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            directive, _, rest = line.partition(' ')
+            rest = rest.strip()
+            try:
+                if directive == 'Probe':
+                    current = self._parse_probe(rest)
+                    self.probes[(current.protocol, current.name)] = current
+                elif current is None:
+                    continue
+                elif directive in ('match', 'softmatch'):
+                    current.matches.append(self._parse_match(rest, soft=directive == 'softmatch'))
+                elif directive == 'ports':
+                    current.ports.update(self._parse_ports(rest))
+                elif directive == 'sslports':
+                    current.sslports.update(self._parse_ports(rest))
+                elif directive == 'rarity':
+                    current.rarity = int(rest)
+                elif directive == 'fallback':
+                    current.fallback = [name.strip() for name in rest.split(',') if name.strip()]
+            except ValueError as e:
+                logger.debug(f"Ignoring malformed line {lineno} of {self.path}: {e}")
+
+        self.port_index = {}
+        for probe in self.probes.values():
+            for port in probe.ports | probe.sslports:
+                self.port_index.setdefault((probe.protocol, port), []).append(probe)
+
+    def match(self, raw: bytes, probe: str = None, port: int = None,
+              protocol: str = 'tcp') -> Optional[ServiceMatch]:
+        """
+        Classify a raw response the way nmap's service scan would
+
+        Args:
+            raw: Response bytes as received from the service
+            probe: Name of the probe that produced the response (None if unknown)
+            port: Port number, used to pick candidate probes when probe is unknown
+            protocol: Protocol (tcp/udp)
+
+        Returns:
+            The first hard match, else the first soft match, else None
+        """
+        if not self.loaded:
+            self.load()
+        if not raw or not self.probes:
+            return None
+
+        soft_match = None
+        for candidate in self._candidate_probes(probe, port, protocol.upper()):
+            for rule in candidate.matches:
+                # Once a softmatch names the service, only that service can refine it
+                if soft_match and rule.service != soft_match.service:
+                    continue
+                result = rule.apply(raw, candidate.name)
+                if result is None:
+                    continue
+                if not result.soft:
+                    return result
+                if soft_match is None:
+                    soft_match = result
+
+        return soft_match
+
+    def _candidate_probes(self, probe: Optional[str], port: Optional[int],
+                          protocol: str) -> List[ServiceProbe]:
+        """Probes whose rules apply to a response: the probe, its fallbacks, then NULL"""
+        names: List[str] = []
+        if probe:
+            names.append(probe)
+            sent = self.probes.get((protocol, probe))
+            if sent:
+                names.extend(sent.fallback)
+        elif port is not None:
+            names.extend(p.name for p in self.port_index.get((protocol, port), []))
+        names.append('NULL')
+
+        candidates = []
+        seen = set()
+        for name in names:
+            candidate = self.probes.get((protocol, name))
+            if candidate and name not in seen:
+                seen.add(name)
+                candidates.append(candidate)
+        return candidates
+
+    @staticmethod
+    def _parse_probe(rest: str) -> ServiceProbe:
+        """Parse 'TCP GetRequest q|GET / HTTP/1.0\\r\\n\\r\\n|'"""
+        protocol, name, payload_spec = rest.split(' ', 2)
+        if not payload_spec.startswith('q') or len(payload_spec) < 3:
+            raise ValueError(f"bad probe string for {name}")
+        delim = payload_spec[1]
+        end = payload_spec.find(delim, 2)
+        if end == -1:
+            raise ValueError(f"unterminated probe string for {name}")
+        payload = _unescape_c(payload_spec[2:end]).encode('latin-1')
+        return ServiceProbe(protocol=protocol.upper(), name=name, payload=payload)
+
+    @staticmethod
+    def _parse_match(rest: str, soft: bool) -> MatchRule:
+        """Parse '<service> m|pattern|flags p/product/ v/$1/ cpe:/a:.../'"""
+        service, _, spec = rest.partition(' ')
+        if not spec.startswith('m') or len(spec) < 3:
+            raise ValueError(f"bad match pattern for {service}")
+
+        delim = spec[1]
+        end = spec.find(delim, 2)
+        if end == -1:
+            raise ValueError(f"unterminated match pattern for {service}")
+        source = spec[2:end]
+
+        pos = end + 1
+        flags = 0
+        while pos < len(spec) and spec[pos] in 'si':
+            flags |= re.DOTALL if spec[pos] == 's' else re.IGNORECASE
+            pos += 1
+
+        templates: Dict[str, str] = {}
+        cpe: List[str] = []
+        while pos < len(spec):
+            if spec[pos].isspace():
+                pos += 1
+                continue
+            if spec.startswith('cpe:', pos):
+                key, pos = 'cpe', pos + 4
+            else:
+                key, pos = spec[pos], pos + 1
+            if pos >= len(spec):
+                break
+            field_delim = spec[pos]
+            field_end = spec.find(field_delim, pos + 1)
+            if field_end == -1:
+                raise ValueError(f"unterminated {key} field for {service}")
+            value = spec[pos + 1:field_end]
+            pos = field_end + 1
+            if key == 'cpe':
+                # Trailing 'a' only marks the CPE as auto-generated
+                if pos < len(spec) and spec[pos] == 'a':
+                    pos += 1
+                cpe.append(f"cpe:/{value}")
+            elif key in TEMPLATE_FIELDS:
+                templates[key] = value
+
+        return MatchRule(service, source.encode('latin-1'), flags, templates, cpe, soft)
+
+    @staticmethod
+    def _parse_ports(rest: str) -> Set[int]:
+        """Parse '80,443,8000-8010'"""
+        ports: Set[int] = set()
+        for part in rest.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if '-' in part:
+                low, high = part.split('-', 1)
+                ports.update(range(int(low), int(high) + 1))
+            else:
+                ports.add(int(part))
+        return ports
+
+
+def _unescape_c(value: str) -> str:
+    """Decode the C-style escapes used in probe strings"""
+    out = []
+    i = 0
+    while i < len(value):
+        char = value[i]
+        if char == '\\' and i + 1 < len(value):
+            nxt = value[i + 1]
+            if nxt == 'x' and i + 4 <= len(value):
+                try:
+                    out.append(chr(int(value[i + 2:i + 4], 16)))
+                    i += 4
+                    continue
+                except ValueError:
+                    pass
+            if nxt in _C_ESCAPES:
+                out.append(_C_ESCAPES[nxt])
+                i += 2
+                continue
+            out.append(nxt)
+            i += 2
+            continue
+        out.append(char)
+        i += 1
+    return ''.join(out)
+
+
+def _expand_template(template: str, found: 're.Match') -> Optional[str]:
+    """Substitute $1, $P(n), $SUBST(n,"a","b") and $I(n,">") in a template"""
+    def group(index: str) -> bytes:
+        try:
+            return found.group(int(index)) or b''
+        except IndexError:
+            return b''
+
+    def replace(token: 're.Match') -> str:
+        plain, printable, subst_group, subst_from, subst_to, int_group, endian = token.groups()
+        if plain:
+            return group(plain).decode('latin-1')
+        if printable:
+            return ''.join(chr(b) for b in group(printable) if 0x20 <= b < 0x7f)
+        if subst_group:
+            return group(subst_group).decode('latin-1').replace(subst_from, subst_to)
+        return str(int.from_bytes(group(int_group), 'big' if endian == '>' else 'little'))
+
+    value = _TEMPLATE_TOKEN.sub(replace, template).strip()
+    return value or None
+
+
+# Global service probe database instance
+_service_probe_db = None
+_service_probe_db_lock = threading.Lock()
+
+def get_service_probe_db() -> ServiceProbeDB:
+    """Get the global service probe database, loading it on first use"""
+    global _service_probe_db
+    if _service_probe_db is None:
+        with _service_probe_db_lock:
+            if _service_probe_db is None:
+                _service_probe_db = ServiceProbeDB().load()
+    return _service_probe_db
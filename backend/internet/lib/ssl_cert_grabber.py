@@ -1,13 +1,16 @@
-import socket
 import asyncio
 import logging
 import ssl
 import json
 from typing import Optional, Dict, List, Tuple
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import hashlib
 
+from django.conf import settings
+
+from .cert_cache import CertificateCache, get_cert_cache
+from .proxy_pool import connect_socket
+
 try:
     from cryptography import x509
     from cryptography.hazmat.backends import default_backend
@@ -21,10 +24,15 @@ logger = logging.getLogger(__name__)
 class SSLCertGrabber:
     """Utility class for grabbing SSL certificates from hosts"""
     
-    def __init__(self, timeout: int = 5, max_workers: int = 20):
-        self.timeout = timeout
-        self.max_workers = max_workers
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+    def __init__(self, connect_timeout: float = None, handshake_timeout: float = None,
+                 max_concurrency: int = None, cert_cache: CertificateCache = None):
+        self.connect_timeout = connect_timeout or getattr(settings, 'SSL_CERT_CONNECT_TIMEOUT', 3)
+        self.handshake_timeout = handshake_timeout or getattr(settings, 'SSL_CERT_HANDSHAKE_TIMEOUT', 5)
+        self.max_concurrency = max_concurrency or getattr(settings, 'SSL_CERT_CONCURRENCY', 500)
+        self._semaphore = None
+        self._semaphore_loop = None
+        self._ssl_context = self._build_ssl_context()
+        self.cert_cache = cert_cache if cert_cache is not None else get_cert_cache()
     
     async def grab_certificate(self, host_ip: str, port: int = 443) -> Optional[Dict]:
         """
@@ -38,45 +46,141 @@ class SSLCertGrabber:
             Certificate data dictionary or None if no certificate found
         """
         try:
-            # Run certificate grabbing in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            cert_data = await loop.run_in_executor(
-                self.executor, 
-                self._grab_certificate_sync, 
-                host_ip, 
-                port
-            )
-            return cert_data
+            async with self._get_semaphore():
+                cert_der = await self._fetch_certificate_der(host_ip, port)
         except Exception as e:
             logger.debug(f"Failed to grab SSL certificate from {host_ip}:{port}: {e}")
             return None
+        
+        if not cert_der:
+            return None
+        return await self.certificate_from_der(cert_der, host_ip, port)
     
-    def _grab_certificate_sync(self, host_ip: str, port: int) -> Optional[Dict]:
-        """Synchronous certificate grabbing function"""
-        try:
-            # Create SSL context
-            context = ssl.create_default_context()
-            context.check_hostname = False
-            context.verify_mode = ssl.CERT_NONE
-            
-            # Connect and get certificate
-            with socket.create_connection((host_ip, port), timeout=self.timeout) as sock:
-                with context.wrap_socket(sock, server_hostname=None) as ssock:
-                    cert = ssock.getpeercert()
-                    cert_der = ssock.getpeercert(binary_form=True)
-                    
-                    # If we have DER data but no parsed cert (common with IP addresses),
-                    # try to parse the DER data directly
-                    if cert_der and not cert:
-                        cert = self._parse_der_certificate(cert_der)
-                    
-                    if cert and cert_der:
-                        return self._process_certificate(cert, cert_der, host_ip, port)
+    async def certificate_from_der(self, cert_der: bytes, host_ip: str, port: int) -> Optional[Dict]:
+        """
+        Build the certificate dictionary for a DER certificate seen on host_ip:port
+        
+        Args:
+            cert_der: Peer certificate in DER form
+            host_ip: IP address it was served from
+            port: Port it was served from
             
+        Returns:
+            Certificate data dictionary or None if it cannot be parsed
+        """
+        # Shared certificates (CDNs, hosting) are parsed once per worker
+        digest = hashlib.sha256(cert_der).hexdigest().upper()
+        cached = await self.cert_cache.get(digest)
+        if cached is not None:
+            return dict(cached, host_ip=host_ip, port=port, created_at=datetime.utcnow().isoformat())
+        
+        # getpeercert() is empty when verification is disabled, so parse the DER directly
+        cert = self._parse_der_certificate(cert_der)
+        if not cert:
             return None
+        cert_data = self._process_certificate(cert, cert_der, host_ip, port)
+        if cert_data:
+            await self.cert_cache.put(digest, cert_data)
+        return cert_data
+    
+    def describe_chain(self, chain_der: List[bytes]) -> List[Dict]:
+        """
+        Summarize the certificates a server presented, leaf first
+        
+        Args:
+            chain_der: Presented certificates in DER form
             
-        except Exception as e:
-            logger.debug(f"SSL certificate grab failed for {host_ip}:{port}: {e}")
+        Returns:
+            Subject, issuer and SHA-256 fingerprint for each parseable certificate
+        """
+        chain = []
+        for cert_der in chain_der:
+            cert = self._parse_der_certificate(cert_der)
+            if not cert:
+                continue
+            chain.append({
+                'subject': self._extract_subject(cert.get('subject', [])),
+                'issuer': self._extract_subject(cert.get('issuer', [])),
+                'fingerprint_sha256': self._get_certificate_fingerprint(cert_der, 'sha256'),
+            })
+        return chain
+    
+    async def _fetch_certificate_der(self, host_ip: str, port: int) -> Optional[bytes]:
+        """Connect and complete a TLS handshake, returning the peer certificate in DER form"""
+        async with connect_socket(host_ip, port, timeout=self.connect_timeout) as sock:
+            # The socket is owned by the transport from here on
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    sock=sock,
+                    ssl=self._ssl_context,
+                    server_hostname='',
+                    ssl_handshake_timeout=self.handshake_timeout,
+                ),
+                # Backstop in case the handshake timeout is not honoured
+                timeout=self.handshake_timeout + 1,
+            )
+            try:
+                ssl_object = writer.get_extra_info('ssl_object')
+                return ssl_object.getpeercert(binary_form=True) if ssl_object else None
+            finally:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except Exception:
+                    pass
+    
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Concurrency limit bound to the currently running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+    
+    @staticmethod
+    def _build_ssl_context() -> ssl.SSLContext:
+        """TLS context that accepts any certificate (we only want to read it)"""
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+    
+    def extract_domains_from_der(self, cert_der: bytes) -> List[str]:
+        """
+        Extract CN and DNS SAN entries from a DER certificate
+        
+        Args:
+            cert_der: Certificate bytes in DER form
+            
+        Returns:
+            List of domain names (may include wildcards)
+        """
+        cert = self._parse_der_certificate(cert_der) if cert_der else None
+        return self._extract_domains(cert) if cert else []
+    
+    def extract_domains_from_stored(self, pem_data: str) -> List[str]:
+        """
+        Extract domains from a stored SSLCertificate.pem_data value
+        
+        Args:
+            pem_data: Hex-encoded DER (grabber jobs) or PEM text (enumerate_domains command)
+            
+        Returns:
+            List of domain names (may include wildcards)
+        """
+        return self.extract_domains_from_der(self._decode_stored_certificate(pem_data))
+    
+    @staticmethod
+    def _decode_stored_certificate(pem_data: str) -> Optional[bytes]:
+        """Turn stored hex or PEM certificate text back into DER bytes"""
+        if not pem_data:
+            return None
+        pem_data = pem_data.strip()
+        try:
+            if pem_data.startswith('-----BEGIN'):
+                return ssl.PEM_cert_to_DER_cert(pem_data)
+            return bytes.fromhex(pem_data)
+        except ValueError:
             return None
     
     def _parse_der_certificate(self, cert_der: bytes) -> Optional[Dict]:
@@ -250,26 +354,25 @@ class SSLCertGrabber:
         Returns:
             Dictionary mapping (host_ip, port) to certificate data
         """
-        tasks = []
-        for host_ip, port in host_port_pairs:
-            task = self.grab_certificate(host_ip, port)
-            tasks.append(((host_ip, port), task))
+        certs = await asyncio.gather(
+            *(self.grab_certificate(host_ip, port) for host_ip, port in host_port_pairs),
+            return_exceptions=True,
+        )
         
         results = {}
-        for (host_ip, port), task in tasks:
-            try:
-                cert_data = await task
-                if cert_data:
-                    results[(host_ip, port)] = cert_data
-            except Exception as e:
-                logger.debug(f"Batch SSL cert grab failed for {host_ip}:{port}: {e}")
+        for (host_ip, port), cert_data in zip(host_port_pairs, certs):
+            if isinstance(cert_data, Exception):
+                logger.debug(f"Batch SSL cert grab failed for {host_ip}:{port}: {cert_data}")
+            elif cert_data:
+                results[(host_ip, port)] = cert_data
         
         return results
     
     def cleanup(self):
         """Clean up resources"""
-        if self.executor:
-            self.executor.shutdown(wait=True)
+        # Connections are closed per grab; nothing is pooled between calls
+        self._semaphore = None
+        self._semaphore_loop = None
 
 
 # Global SSL cert grabber instance
@@ -0,0 +1,205 @@
+"""
+Single-handshake TLS endpoint probe: certificate chain, session parameters and HTTP fingerprint
+"""
+import asyncio
+import logging
+import ssl
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .http_fingerprint import HTTPFingerprint, HTTPFingerprinter, get_http_fingerprinter
+from .proxy_pool import connect_socket
+from .ssl_cert_grabber import SSLCertGrabber, get_ssl_cert_grabber
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TLSEndpointResult:
+    """Everything learned from one TLS handshake and the HTTP exchange over it"""
+    host: str
+    port: int
+    tls_version: Optional[str] = None
+    cipher: Optional[str] = None
+    alpn: Optional[str] = None
+    certificate: Optional[Dict] = None
+    chain: List[Dict] = field(default_factory=list)
+    http: Optional[HTTPFingerprint] = None
+
+    @property
+    def banner(self) -> str:
+        """HTTP banner when the endpoint spoke HTTP, otherwise a TLS session summary"""
+        if self.http:
+            return self.http.banner
+        parts = [part for part in (self.tls_version, self.cipher) if part]
+        subject = (self.certificate or {}).get('subject') or {}
+        if subject.get('commonName'):
+            parts.append(f"CN={subject['commonName']}")
+        return ' '.join(parts)
+
+    @property
+    def domains(self) -> List[str]:
+        """Names from the certificate plus those disclosed by the HTTP response"""
+        found = set((self.certificate or {}).get('domains') or [])
+        if self.http:
+            found.update(self.http.domains)
+        return sorted(found)
+
+    def tls_dict(self) -> Dict:
+        """Session parameters and chain summary for job result data"""
+        return {
+            'version': self.tls_version,
+            'cipher': self.cipher,
+            'alpn': self.alpn,
+            'chain': self.chain,
+        }
+
+
+class TLSEndpointProber:
+    """Collect certificate, TLS session and HTTP data from one connection per port"""
+
+    def __init__(self, connect_timeout: float = None, handshake_timeout: float = None,
+                 max_concurrency: int = None, cert_grabber: SSLCertGrabber = None,
+                 http_fingerprinter: HTTPFingerprinter = None):
+        self.connect_timeout = connect_timeout or getattr(settings, 'SSL_CERT_CONNECT_TIMEOUT', 3)
+        self.handshake_timeout = handshake_timeout or getattr(settings, 'SSL_CERT_HANDSHAKE_TIMEOUT', 5)
+        self.max_concurrency = max_concurrency or getattr(settings, 'TLS_ENDPOINT_CONCURRENCY', 500)
+        self.cert_grabber = cert_grabber or get_ssl_cert_grabber()
+        self.http_fingerprinter = http_fingerprinter or get_http_fingerprinter()
+        self._semaphore = None
+        self._semaphore_loop = None
+        self._ssl_context = self._build_ssl_context()
+
+    async def probe(self, host: str, port: int = 443, hostname: str = None) -> Optional[TLSEndpointResult]:
+        """
+        Handshake once, then read the certificate chain and fingerprint HTTP on the same session
+
+        Args:
+            host: IP address
+            port: Port number (default: 443)
+            hostname: SNI / Host header name (default: no SNI, IP in Host header)
+
+        Returns:
+            TLSEndpointResult, or None if no TLS session could be established
+        """
+        try:
+            async with self._get_semaphore():
+                return await asyncio.wait_for(
+                    self._probe(host, port, hostname),
+                    # Connect, handshake and both HTTP requests
+                    timeout=self.connect_timeout + self.handshake_timeout + self.http_fingerprinter.timeout * 3,
+                )
+        except Exception as e:
+            logger.debug(f"TLS endpoint probe failed for {host}:{port}: {e!r}")
+            return None
+
+    async def probe_batch(self, targets: List[Tuple[str, int]]) -> Dict[Tuple[str, int], TLSEndpointResult]:
+        """
+        Probe many endpoints concurrently
+
+        Args:
+            targets: (host, port) pairs
+
+        Returns:
+            Results keyed by (host, port) for endpoints that completed a handshake
+        """
+        results = await asyncio.gather(*(self.probe(host, port) for host, port in targets))
+        return {
+            (result.host, result.port): result
+            for result in results
+            if result is not None
+        }
+
+    async def _probe(self, host: str, port: int, hostname: Optional[str]) -> Optional[TLSEndpointResult]:
+        async with connect_socket(host, port, timeout=self.connect_timeout) as sock:
+            # The socket is owned by the transport from here on
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    sock=sock,
+                    ssl=self._ssl_context,
+                    server_hostname=hostname or '',
+                    ssl_handshake_timeout=self.handshake_timeout,
+                ),
+                # Backstop in case the handshake timeout is not honoured
+                timeout=self.handshake_timeout + 1,
+            )
+            try:
+                ssl_object = writer.get_extra_info('ssl_object')
+                if ssl_object is None:
+                    return None
+                cipher = ssl_object.cipher()
+                result = TLSEndpointResult(
+                    host=host,
+                    port=port,
+                    tls_version=ssl_object.version(),
+                    cipher=cipher[0] if cipher else None,
+                    alpn=ssl_object.selected_alpn_protocol(),
+                )
+
+                leaf_der = ssl_object.getpeercert(binary_form=True)
+                if leaf_der:
+                    result.certificate = await self.cert_grabber.certificate_from_der(leaf_der, host, port)
+                    result.chain = self.cert_grabber.describe_chain(self._peer_chain(ssl_object) or [leaf_der])
+
+                try:
+                    result.http = await self.http_fingerprinter.fingerprint_stream(
+                        reader, writer, host, port, tls=True, hostname=hostname,
+                    )
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                    # Not every TLS service speaks HTTP; the handshake data still stands
+                    logger.debug(f"No HTTP response from {host}:{port}: {e!r}")
+                return result
+            finally:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except Exception:
+                    pass
+
+    @staticmethod
+    def _peer_chain(ssl_object: ssl.SSLObject) -> List[bytes]:
+        """DER certificates as presented by the peer, leaf first (empty if unsupported)"""
+        # Public from Python 3.13; earlier versions only expose it on the internal object
+        get_chain = getattr(ssl_object, 'get_unverified_chain', None)
+        if get_chain is None:
+            get_chain = getattr(getattr(ssl_object, '_sslobj', None), 'get_unverified_chain', None)
+        if get_chain is None:
+            return []
+        try:
+            chain = get_chain() or []
+        except Exception:
+            return []
+        return [
+            cert if isinstance(cert, bytes) else cert.public_bytes(ssl._ssl.ENCODING_DER)
+            for cert in chain
+        ]
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Concurrency limit bound to the currently running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    @staticmethod
+    def _build_ssl_context() -> ssl.SSLContext:
+        """TLS context that accepts any certificate and offers HTTP/1.1 via ALPN"""
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        context.set_alpn_protocols(['http/1.1'])
+        return context
+
+
+# Global TLS endpoint prober instance
+_tls_endpoint_prober = None
+
+def get_tls_endpoint_prober() -> TLSEndpointProber:
+    """Get the global TLS endpoint prober instance"""
+    global _tls_endpoint_prober
+    if _tls_endpoint_prober is None:
+        _tls_endpoint_prober = TLSEndpointProber()
+    return _tls_endpoint_prober
@@ -0,0 +1,322 @@
+"""
+Asyncio UDP service probing with shared sockets and retransmission
+"""
+import asyncio
+import itertools
+import logging
+import re
+import socket
+import struct
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .banner_grabber import BannerResult, clean_banner_text
+
+try:
+    import dns.message
+    DNS_AVAILABLE = True
+except ImportError:
+    DNS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class UDPProbe:
+    """A datagram payload and how to recognise its reply.
+
+    echo_bytes is the length of the payload prefix (transaction ID, cookie)
+    that a genuine reply repeats; 0 accepts any datagram from the target.
+    """
+    name: str
+    payload: bytes
+    echo_bytes: int = 0
+
+
+def _ike_main_mode_payload() -> bytes:
+    """ISAKMP main mode SA proposal (3DES/SHA1/PSK/group 2)"""
+    attributes = struct.pack(
+        '>HHHHHHHHHHHHI',
+        0x8001, 5,      # encryption: 3DES-CBC
+        0x8002, 2,      # hash: SHA1
+        0x8003, 1,      # authentication: pre-shared key
+        0x8004, 2,      # group: MODP 1024
+        0x800b, 1,      # life type: seconds
+        0x000c, 4, 28800,
+    )
+    transform = struct.pack('>BBHBBH', 0, 0, 8 + len(attributes), 1, 1, 0) + attributes
+    proposal = struct.pack('>BBHBBBB', 0, 0, 8 + len(transform), 1, 1, 0, 1) + transform
+    sa = struct.pack('>BBHII', 0, 0, 12 + len(proposal), 1, 1) + proposal
+    header = struct.pack('>8s8sBBBBII', b'FAUXDAN!', b'\x00' * 8, 1, 0x10, 2, 0, 0, 28 + len(sa))
+    return header + sa
+
+
+DNS_VERSION_BIND_UDP = UDPProbe(
+    'DNSVersionBindReq',
+    b'\x00\x06\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00'
+    b'\x07version\x04bind\x00\x00\x10\x00\x03',
+    echo_bytes=2,
+)
+SNMP_V1_PUBLIC = UDPProbe(
+    'SNMPv1public',
+    # GetRequest sysDescr.0 with community "public"
+    b'\x30\x29\x02\x01\x00\x04\x06public\xa0\x1c\x02\x04\x46\x58\x44\x4e'
+    b'\x02\x01\x00\x02\x01\x00\x30\x0e\x30\x0c\x06\x08\x2b\x06\x01\x02'
+    b'\x01\x01\x01\x00\x05\x00',
+)
+NTP_REQUEST = UDPProbe('NTPRequest', b'\xe3' + b'\x00' * 47)
+IKE_MAIN_MODE = UDPProbe('IKE_MAIN_MODE', _ike_main_mode_payload(), echo_bytes=8)
+MEMCACHED_STATS_UDP = UDPProbe(
+    'memcached',
+    # UDP frame header: request id, sequence 0, 1 datagram, reserved
+    b'\x46\x58\x00\x00\x00\x01\x00\x00stats\r\n',
+    echo_bytes=2,
+)
+NBTSTAT = UDPProbe(
+    'NBTStat',
+    b'\x80\xf0\x00\x10\x00\x01\x00\x00\x00\x00\x00\x00'
+    b'\x20CKAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA\x00\x00\x21\x00\x01',
+    echo_bytes=2,
+)
+SSDP_MSEARCH = UDPProbe(
+    'SSDP',
+    b'M-SEARCH * HTTP/1.1\r\nHOST: 239.255.255.250:1900\r\n'
+    b'MAN: "ssdp:discover"\r\nMX: 1\r\nST: ssdp:all\r\n\r\n',
+)
+
+UDP_PORT_PROBES: Dict[int, UDPProbe] = {
+    53: DNS_VERSION_BIND_UDP,
+    123: NTP_REQUEST,
+    137: NBTSTAT,
+    161: SNMP_V1_PUBLIC,
+    500: IKE_MAIN_MODE,
+    1900: SSDP_MSEARCH,
+    11211: MEMCACHED_STATS_UDP,
+}
+
+PRINTABLE_RUN = re.compile(rb'[\x20-\x7e]{4,}')
+
+
+class _UDPProbeProtocol(asyncio.DatagramProtocol):
+    """One UDP socket; replies are routed to the waiting probe by source address"""
+
+    def __init__(self):
+        self.transport = None
+        self.pending: Dict[Tuple[str, int], Tuple[UDPProbe, asyncio.Future]] = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        waiter = self.pending.get((addr[0], addr[1]))
+        if waiter is None:
+            return
+        probe, future = waiter
+        if future.done():
+            return
+        if probe.echo_bytes and data[:probe.echo_bytes] != probe.payload[:probe.echo_bytes]:
+            return
+        future.set_result(data)
+
+    def error_received(self, exc):
+        logger.debug(f"UDP probe socket error: {exc}")
+
+    def connection_lost(self, exc):
+        for _, future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc or ConnectionError('UDP probe socket closed'))
+
+
+class UDPProber:
+    """Probe UDP services over a handful of shared sockets"""
+
+    def __init__(self, timeout: float = None, retries: int = None, sockets: int = None,
+                 max_concurrency: int = None, max_bytes: int = 4096):
+        self.timeout = timeout or getattr(settings, 'UDP_PROBE_TIMEOUT', 1.5)
+        self.retries = retries if retries is not None else getattr(settings, 'UDP_PROBE_RETRIES', 2)
+        self.socket_count = sockets or getattr(settings, 'UDP_PROBE_SOCKETS', 4)
+        self.max_concurrency = max_concurrency or getattr(settings, 'UDP_PROBE_CONCURRENCY', 2000)
+        self.max_bytes = max_bytes
+        # Sockets and semaphore belong to one event loop
+        self._loop = None
+        self._endpoints: Dict[int, List[_UDPProbeProtocol]] = {}
+        self._endpoint_cycle: Dict[int, itertools.cycle] = {}
+        self._semaphore = None
+        self._endpoint_lock = None
+
+    async def probe(self, host: str, port: int, probe: UDPProbe = None) -> Optional[BannerResult]:
+        """
+        Send the port's probe, retransmitting until a reply or timeout
+
+        Args:
+            host: IP address
+            port: UDP port number
+            probe: Probe to send instead of the port's default
+
+        Returns:
+            BannerResult or None if there is no probe for the port or nothing answered
+        """
+        probe = probe or UDP_PORT_PROBES.get(port)
+        if probe is None:
+            return None
+
+        self._bind_loop()
+        try:
+            async with self._semaphore:
+                raw = await self._exchange(host, port, probe)
+        except Exception as e:
+            logger.debug(f"UDP probe failed for {host}:{port}: {e!r}")
+            return None
+
+        if not raw:
+            return None
+        raw = raw[:self.max_bytes]
+        return BannerResult(
+            host=host,
+            port=port,
+            protocol='udp',
+            probe=probe.name,
+            raw=raw,
+            banner=self._describe(probe, raw),
+        )
+
+    async def probe_batch(self, targets: List[Tuple[str, int]]) -> Dict[Tuple[str, int], BannerResult]:
+        """
+        Probe many UDP targets concurrently
+
+        Args:
+            targets: List of (host, port) tuples
+
+        Returns:
+            Dictionary mapping (host, port) to BannerResult for targets that answered
+        """
+        results = await asyncio.gather(*(self.probe(host, port) for host, port in targets))
+        return {target: result for target, result in zip(targets, results) if result}
+
+    async def _exchange(self, host: str, port: int, probe: UDPProbe) -> Optional[bytes]:
+        """Send and retransmit the probe until a matching reply arrives"""
+        target = (host, port)
+        protocol = await self._claim_endpoint(target)
+        future = asyncio.get_running_loop().create_future()
+        protocol.pending[target] = (probe, future)
+        try:
+            for attempt in range(self.retries + 1):
+                protocol.transport.sendto(probe.payload, target)
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+                except asyncio.TimeoutError:
+                    logger.debug(f"No UDP reply from {host}:{port} (attempt {attempt + 1})")
+            return None
+        finally:
+            protocol.pending.pop(target, None)
+            if not future.done():
+                future.cancel()
+
+    async def _claim_endpoint(self, target: Tuple[str, int]) -> _UDPProbeProtocol:
+        """Pick a socket with no outstanding probe to the same target"""
+        family = socket.AF_INET6 if ':' in target[0] else socket.AF_INET
+        endpoints = await self._get_endpoints(family)
+        while True:
+            for _ in range(len(endpoints)):
+                protocol = next(self._endpoint_cycle[family])
+                if target not in protocol.pending:
+                    return protocol
+            # Every socket already waits on this exact target; let one finish
+            await asyncio.sleep(self.timeout / 10)
+
+    async def _get_endpoints(self, family: int) -> List[_UDPProbeProtocol]:
+        """Create this address family's sockets on first use"""
+        if family not in self._endpoints:
+            async with self._endpoint_lock:
+                if family not in self._endpoints:
+                    loop = asyncio.get_running_loop()
+                    local = ('::', 0) if family == socket.AF_INET6 else ('0.0.0.0', 0)
+                    endpoints = []
+                    for _ in range(self.socket_count):
+                        _, protocol = await loop.create_datagram_endpoint(
+                            _UDPProbeProtocol, local_addr=local, family=family,
+                        )
+                        endpoints.append(protocol)
+                    self._endpoints[family] = endpoints
+                    self._endpoint_cycle[family] = itertools.cycle(endpoints)
+        return self._endpoints[family]
+
+    def _bind_loop(self) -> None:
+        """Reset per-loop state when called from a new event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self.close()
+        self._loop = loop
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._endpoint_lock = asyncio.Lock()
+
+    def _describe(self, probe: UDPProbe, raw: bytes) -> str:
+        """Turn a binary reply into banner text"""
+        if probe is NTP_REQUEST and len(raw) >= 48:
+            return self._describe_ntp(raw)
+        if probe is DNS_VERSION_BIND_UDP and DNS_AVAILABLE:
+            described = self._describe_dns(raw)
+            if described:
+                return described
+
+        runs = [run.decode('ascii') for run in PRINTABLE_RUN.findall(raw)]
+        if probe is SNMP_V1_PUBLIC:
+            runs = [run for run in runs if run != 'public']
+        if runs:
+            return clean_banner_text(f"{probe.name}: {' '.join(runs)}")
+        return f"{probe.name}: {len(raw)} bytes {raw[:32].hex()}"
+
+    @staticmethod
+    def _describe_ntp(raw: bytes) -> str:
+        """Summarise an NTP server reply"""
+        version = (raw[0] >> 3) & 0x7
+        mode = raw[0] & 0x7
+        stratum = raw[1]
+        refid = raw[12:16]
+        if stratum <= 1:
+            refid_text = refid.rstrip(b'\x00').decode('ascii', errors='ignore')
+        else:
+            refid_text = socket.inet_ntoa(refid)
+        return f"NTP v{version} mode {mode} stratum {stratum} refid {refid_text}"
+
+    @staticmethod
+    def _describe_dns(raw: bytes) -> Optional[str]:
+        """Extract the version.bind TXT answer"""
+        try:
+            response = dns.message.from_wire(raw)
+        except Exception:
+            return None
+        texts = []
+        for rrset in response.answer:
+            for rdata in rrset:
+                texts.append(rdata.to_text().strip('"'))
+        if texts:
+            return f"DNS version.bind: {' '.join(texts)}"
+        return f"DNS rcode {response.rcode()}"
+
+    def close(self) -> None:
+        """Close the UDP sockets"""
+        for endpoints in self._endpoints.values():
+            for protocol in endpoints:
+                try:
+                    protocol.transport.abort()
+                except Exception:
+                    # The owning loop may already be closed
+                    pass
+        self._endpoints = {}
+        self._endpoint_cycle = {}
+        self._loop = None
+
+
+# Global UDP prober instance
+_udp_prober = None
+
+def get_udp_prober() -> UDPProber:
+    """Get the global UDP prober instance"""
+    global _udp_prober
+    if _udp_prober is None:
+        _udp_prober = UDPProber()
+    return _udp_prober
@@ -1,47 +1,97 @@
-import subprocess
-from django.core.management.base import BaseCommand
+"""
+Management command for concurrent open DNS relay detection
+"""
+import asyncio
+import time
+from collections import defaultdict
+from django.core.management.base import BaseCommand, CommandError
+from internet.lib.dns_relay import DNSRelayChecker
 from internet.models import Host, Port, DNSRelay
 
+
 class Command(BaseCommand):
-    help = 'Import words from a file into the database'
+    help = 'Check port 53 targets for open DNS relays with concurrent recursive queries'
 
     def add_arguments(self, parser):
-        parser.add_argument('ip', type=str, help='IP to check, otherwise check all entries')
-        # parser.add_argument('proxychains', type=str, help='Use proxychains')
+        parser.add_argument('ip', type=str, help='IP to check, or "all" for every port 53 target')
+        parser.add_argument(
+            '--recheck',
+            action='store_true',
+            help='Also check ports already recorded as open relays'
+        )
+        parser.add_argument(
+            '--domain',
+            type=str,
+            help='Domain queried recursively (default: DNS_RELAY_TEST_DOMAIN)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Maximum queries in flight (default: DNS_RELAY_CONCURRENCY)'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            help='Seconds to wait for each reply (default: DNS_RELAY_TIMEOUT)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Targets checked per round (default: 10000)'
+        )
 
-    def handle(self, *args, **kwargs):
-        ip = kwargs['ip']
+    def handle(self, *args, **options):
+        ip = options['ip']
 
         if ip.lower() == 'all':
-            targets = list(Port.objects.filter(port_number=53))
+            targets = Port.objects.filter(port_number=53)
         else:
-            try:
-                host = Host.objects.get(ip=ip)
-            except:
-                self.stdout.write(self.style.ERROR('Host does not exist in database.'))
-                exit(1)
-
-            try:
-                targets = host.ports.filter(port_number=53)
-            except:
-                self.stdout.write(self.style.ERROR('Port does not exist on host.'))
-                exit(1)
-        
-        existing_relays = DNSRelay.objects.all()
-        for relay in existing_relays:
-            if relay.port in targets:
-                self.stdout.write(self.style.ERROR(f'Popping {relay.port.host}'))
-                targets.remove(relay.port)
-        
-        self.stdout.write(self.style.SUCCESS(f'Found {len(targets)} DNS targets.'))
-
-        for target in targets:
-            nslookup_cmd = f'nslookup -timeout=1 google.com {target.host}'
-            try:
-                output = subprocess.run(nslookup_cmd, shell=True, capture_output=True, text=True)
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Error: {e}'))
-
-            if 'google.com' in output.stdout:
-                DNSRelay.objects.get_or_create(port=target)
-                self.stdout.write(self.style.SUCCESS(f'Found open relay {target.host}'))
\ No newline at end of file
+            if not Host.objects.filter(ip=ip).exists():
+                raise CommandError('Host does not exist in database.')
+            targets = Port.objects.filter(host__ip=ip, port_number=53)
+
+        if not options['recheck']:
+            # Anti-join instead of loading every existing relay
+            targets = targets.filter(dnsrelay__isnull=True)
+
+        checker = DNSRelayChecker(
+            test_domain=options['domain'],
+            timeout=options['timeout'],
+            max_inflight=options['concurrency'],
+        )
+
+        started = time.monotonic()
+        checked = 0
+        found = 0
+        chunk = defaultdict(list)
+        rows = targets.order_by().values_list('id', 'host__ip').iterator(chunk_size=options['chunk_size'])
+
+        for port_id, host_ip in rows:
+            chunk[host_ip].append(port_id)
+            if len(chunk) >= options['chunk_size']:
+                found += self._check_chunk(checker, chunk)
+                checked += len(chunk)
+                chunk = defaultdict(list)
+
+        if chunk:
+            found += self._check_chunk(checker, chunk)
+            checked += len(chunk)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(f'Checked {checked} DNS targets, found {found} open relays in {elapsed:.2f}s')
+        )
+
+    def _check_chunk(self, checker, chunk):
+        """Check one chunk of hosts and record the open relays"""
+        results = asyncio.run(checker.check_batch([(host_ip, 53) for host_ip in chunk]))
+
+        relays = []
+        for (host_ip, _), result in results.items():
+            if result['open_relay']:
+                self.stdout.write(self.style.SUCCESS(f'Found open relay {host_ip}'))
+                relays.extend(DNSRelay(port_id=port_id) for port_id in chunk[host_ip])
+
+        DNSRelay.objects.bulk_create(relays, ignore_conflicts=True)
+        return len(relays)
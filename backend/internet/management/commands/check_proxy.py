@@ -1,64 +1,147 @@
-import subprocess
+"""
+Management command for concurrent proxy liveness checks and discovery
+"""
+import asyncio
+import time
 from django.core.management.base import BaseCommand
-from django.db.models import Q
-from internet.models import Host, Port, Domain
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from internet.lib.banner_analyzer import ServiceType, get_banner_analyzer
+from internet.lib.banner_store import ports_with_banners
+from internet.lib.proxy_checker import ProxyChecker, apply_check_result
+from internet.models import Port, Proxy
+
 
 class Command(BaseCommand):
-    help = 'Import words from a file into the database'
+    help = 'Check proxies through SOCKS4/SOCKS5/HTTP CONNECT tunnels and update their liveness'
 
     def add_arguments(self, parser):
-        parser.add_argument('ip', type=str, help='IP to check, otherwise check all entries')
-        # parser.add_argument('proxychains', type=str, help='Use proxychains')
+        parser.add_argument(
+            'target',
+            nargs='?',
+            default='all',
+            help='Proxy host to check, or "all" (default)'
+        )
+        parser.add_argument(
+            '--include-disabled',
+            action='store_true',
+            help='Also check proxies that are disabled'
+        )
+        parser.add_argument(
+            '--discover',
+            action='store_true',
+            help='Also test ports whose banners look like proxies and add the working ones'
+        )
+        parser.add_argument(
+            '--check-target',
+            type=str,
+            help='host:port reached through each proxy (default: PROXY_CHECK_TARGET)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Maximum proxies checked at once (default: PROXY_CHECK_CONCURRENCY)'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            help='Seconds allowed per check (default: PROXY_CHECK_TIMEOUT)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Proxies checked per round (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        checker = ProxyChecker(
+            target=options['check_target'],
+            timeout=options['timeout'],
+            max_concurrency=options['concurrency'],
+        )
+        started = time.monotonic()
+
+        proxies = Proxy.objects.all()
+        if options['target'].lower() != 'all':
+            proxies = proxies.filter(host_name=options['target'])
+        if not options['include_disabled']:
+            proxies = proxies.filter(enabled=True)
+
+        checked = 0
+        alive = 0
+        chunk = []
+        for proxy in proxies.order_by('id').iterator(chunk_size=options['chunk_size']):
+            chunk.append(proxy)
+            if len(chunk) >= options['chunk_size']:
+                alive += self._check_chunk(checker, chunk)
+                checked += len(chunk)
+                chunk = []
+        if chunk:
+            alive += self._check_chunk(checker, chunk)
+            checked += len(chunk)
 
-    def handle(self, *args, **kwargs):
-        ip = kwargs['ip']
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} proxies, {alive} alive'))
 
-        if ip.lower() == 'all':
-            targets = Port.objects.filter(Q(port_number=80) | Q(port_number=443))
-        else:
-            try:
-                host = Host.objects.get(ip=ip)
-            except:
-                self.stdout.write(self.style.ERROR('Host does not exist in database.'))
-                exit(1)
+        if options['discover']:
+            discovered = self._discover(checker, options)
+            self.stdout.write(self.style.SUCCESS(f'Discovered {discovered} new proxies'))
 
-            try:
-                targets = host.ports.filter(Q(port_number=80) | Q(port_number=443))
-            except:
-                self.stdout.write(self.style.ERROR('Port does not exist on host.'))
-                exit(1)
-        
-        self.stdout.write(self.style.SUCCESS(f'Found {len(targets)} web targets.'))
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Finished in {elapsed:.2f}s'))
 
-        for target in targets:
-            # lookup_cmd = ['/usr/bin/nslookup', '-timeout=2', str(target.host), '8.8.8.8']
-            lookup_cmd = ['/usr/bin/dig', '-x', str(target.host), '@8.8.8.8', '+time=2']
-            process = subprocess.Popen(lookup_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    def _check_chunk(self, checker, chunk):
+        """Check one chunk of proxies and write the results back in bulk"""
+        results = asyncio.run(checker.check_batch([
+            (proxy.host_name, proxy.port_number, proxy.proxy_type, proxy.username, proxy.password)
+            for proxy in chunk
+        ]))
 
-            output_by_line = []
-            while True:
-                output = process.stdout.readline()
+        checked_at = timezone.now()
+        for proxy, result in zip(chunk, results):
+            apply_check_result(proxy, result, checked_at)
 
-                if output == '' and process.poll() is not None:
-                    break
+        Proxy.objects.bulk_update(chunk, ['latency_ms', 'last_checked', 'fail_count', 'dead', 'enabled'])
+        return sum(1 for result in results if result.alive)
 
-                output_by_line.append(output)
+    def _discover(self, checker, options):
+        """Test ports the banner analyzer classifies as proxies and record the working ones"""
+        analyzer = get_banner_analyzer()
+        known = Proxy.objects.filter(host_name=OuterRef('host__ip'), port_number=OuterRef('port_number'))
+        ports = (
+            ports_with_banners(Port.objects.filter(proto='tcp'))
+            .filter(~Exists(known))
+        )
+        if options['target'].lower() != 'all':
+            ports = ports.filter(host__ip=options['target'])
 
-            begin_index = 0
-            for index, line in enumerate(output_by_line):
-                # print(line.strip())
-                if 'ANSWER SECTION' in line:
-                    begin_index = index
-            
-            if not begin_index:
-                self.stdout.write(self.style.ERROR(f'No answer for host {str(target.host)}'))
+        discovered = 0
+        candidates = []
+        for host_ip, port_number, banner in ports.values_list('host__ip', 'port_number', 'banner_value').iterator(
+            chunk_size=options['chunk_size']
+        ):
+            detections = analyzer.analyze_banner(banner, port_number)
+            if any(d.service_type == ServiceType.PROXY for d in detections):
+                candidates.append((host_ip, port_number))
+            if len(candidates) >= options['chunk_size']:
+                discovered += self._detect_chunk(checker, candidates)
+                candidates = []
+        if candidates:
+            discovered += self._detect_chunk(checker, candidates)
+        return discovered
 
-            else:
-                for line in output_by_line[begin_index:]:
-                    if not ';;' in line:
-                        if 'PTR' in line:
-                            domain_name = line.split('PTR')[-1].strip()
-                            Domain.objects.get_or_create(name=domain_name, host=target.host)
-                            self.stdout.write(self.style.SUCCESS(f'Found {domain_name} for host {str(target.host)}'))
-                        else:
-                            pass
+    def _detect_chunk(self, checker, candidates):
+        """Classify one chunk of candidates and insert the working proxies"""
+        results = asyncio.run(checker.detect_batch(candidates))
+        checked_at = timezone.now()
+        Proxy.objects.bulk_create([
+            Proxy(
+                host_name=host_ip,
+                port_number=port_number,
+                proxy_type=result.proxy_type,
+                latency_ms=result.latency_ms,
+                last_checked=checked_at,
+            )
+            for (host_ip, port_number), result in results.items()
+        ])
+        return len(results)
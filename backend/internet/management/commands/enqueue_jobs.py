@@ -0,0 +1,122 @@
+"""
+Management command for high-volume ancillary job enqueueing
+"""
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+from django.utils import timezone
+from internet.lib.bulk_enqueue import BulkEnqueueService, HOST_JOB_TYPES, PORT_JOB_TYPES
+from internet.models import Host, Port
+
+
+class Command(BaseCommand):
+    help = 'Bulk enqueue ancillary jobs for all matching hosts or ports that do not already have an active job or a fresh result'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--job-type',
+            required=True,
+            choices=HOST_JOB_TYPES + PORT_JOB_TYPES,
+            help='Ancillary job type to enqueue'
+        )
+        parser.add_argument(
+            '--ports',
+            type=lambda x: [int(p.strip()) for p in x.split(',')],
+            default=[],
+            help='Only enqueue port-level jobs for these port numbers (e.g. "443,8443")'
+        )
+        parser.add_argument(
+            '--proto',
+            choices=['tcp', 'udp'],
+            help='Only enqueue port-level jobs for this protocol'
+        )
+        parser.add_argument(
+            '--max-age-days',
+            type=int,
+            help='Geolocation only: only hosts not geolocated within this many days'
+        )
+        parser.add_argument(
+            '--priority',
+            type=int,
+            help='Job priority (default: per job type)'
+        )
+        parser.add_argument(
+            '--include-private',
+            action='store_true',
+            help='Also enqueue host-level jobs for private IP addresses'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Rows streamed per database round trip (default: 5000)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per multi-row INSERT (default: 1000)'
+        )
+        parser.add_argument(
+            '--force-refresh',
+            action='store_true',
+            help='Also enqueue targets probed within the PROBE_FRESHNESS_TTLS window'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count jobs that would be queued without creating them'
+        )
+
+    def handle(self, *args, **options):
+        job_type = options['job_type']
+
+        if options['chunk_size'] <= 0 or options['batch_size'] <= 0:
+            raise CommandError('--chunk-size and --batch-size must be positive')
+
+        service = BulkEnqueueService(
+            chunk_size=options['chunk_size'],
+            batch_size=options['batch_size'],
+        )
+
+        started = time.monotonic()
+
+        if job_type in HOST_JOB_TYPES:
+            hosts = Host.objects.all()
+            if options['max_age_days'] is not None:
+                cutoff_date = timezone.now() - timedelta(days=options['max_age_days'])
+                hosts = hosts.filter(
+                    models.Q(geolocation_updated__isnull=True) |
+                    models.Q(geolocation_updated__lt=cutoff_date)
+                )
+            result = service.enqueue_host_jobs(
+                job_type,
+                hosts=hosts,
+                priority=options['priority'],
+                skip_private=not options['include_private'],
+                dry_run=options['dry_run'],
+                force_refresh=options['force_refresh'],
+            )
+        else:
+            ports = Port.objects.all()
+            if options['ports']:
+                ports = ports.filter(port_number__in=options['ports'])
+            if options['proto']:
+                ports = ports.filter(proto=options['proto'])
+            result = service.enqueue_port_jobs(
+                job_type,
+                ports=ports,
+                priority=options['priority'],
+                dry_run=options['dry_run'],
+                force_refresh=options['force_refresh'],
+            )
+
+        elapsed = time.monotonic() - started
+        verb = 'Would queue' if options['dry_run'] else 'Queued'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {result['queued']} {job_type} jobs "
+                f"(skipped: {result['skipped']}) in {elapsed:.2f}s"
+            )
+        )
@@ -1,8 +1,10 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.db import models
-from internet.models import Host, AncillaryJob
-from internet.lib.geolocation import get_ip_geolocation_async, get_ip_geolocations_batch_async
+from internet.models import Host
+from internet.lib.geolocation import (
+    close_geolocation_http, geolocation_service, get_ip_geolocation, get_ip_geolocation_async, get_ip_geolocations_batch_async
+)
 import asyncio
 import time
 from datetime import timedelta
@@ -21,8 +23,8 @@ class Command(BaseCommand):
         parser.add_argument(
             '--delay',
             type=float,
-            default=0.1,
-            help='Delay between requests in seconds (for rate limiting)'
+            default=0.0,
+            help='Extra delay between requests in seconds (provider quotas are already enforced per provider)'
         )
         parser.add_argument(
             '--force',
@@ -62,7 +64,7 @@ class Command(BaseCommand):
 
         if specific_ip:
             if async_batch:
-                asyncio.run(self.geolocate_single_ip_async(specific_ip))
+                asyncio.run(self.run_async(self.geolocate_single_ip_async(specific_ip)))
             else:
                 self.geolocate_single_ip(specific_ip)
             return
@@ -89,7 +91,7 @@ class Command(BaseCommand):
             self.queue_geolocation_jobs(hosts)
         elif async_batch:
             # Use async batch processing
-            asyncio.run(self.process_hosts_async_batch(hosts, batch_size))
+            asyncio.run(self.run_async(self.process_hosts_async_batch(hosts, batch_size)))
         else:
             # Use original sequential processing
             self.process_hosts_sequential(hosts, batch_size, delay)
@@ -160,48 +162,23 @@ class Command(BaseCommand):
 
     def queue_geolocation_jobs(self, hosts):
         """Queue geolocation jobs for hosts"""
-        total_queued = 0
-        total_skipped = 0
-        
-        for host in hosts:
-            try:
-                # Check if job already exists
-                existing_job = AncillaryJob.objects.filter(
-                    host=host,
-                    job_type='geolocation',
-                    status__in=['pending', 'running', 'queued']
-                ).exists()
-                
-                if existing_job:
-                    total_skipped += 1
-                    continue
-                
-                # Skip private IPs
-                if self.is_private_ip(host.ip):
-                    total_skipped += 1
-                    continue
-                
-                # Create geolocation job
-                AncillaryJob.objects.create(
-                    job_type='geolocation',
-                    host_ip=host.ip,
-                    host=host,
-                    status='pending',
-                    priority=2
-                )
-                total_queued += 1
-                
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f"Error queuing job for {host.ip}: {e}")
-                )
+        from internet.lib.bulk_enqueue import BulkEnqueueService
+
+        result = BulkEnqueueService().enqueue_host_jobs('geolocation', hosts=hosts)
         
         self.stdout.write(
             self.style.SUCCESS(
-                f"Job queuing complete! Queued: {total_queued}, Skipped: {total_skipped}"
+                f"Job queuing complete! Queued: {result['queued']}, Skipped: {result['skipped']}"
             )
         )
 
+    async def run_async(self, coroutine):
+        """Run a geolocation coroutine, closing the pooled HTTP connections before the loop ends"""
+        try:
+            return await coroutine
+        finally:
+            await close_geolocation_http()
+
     async def geolocate_single_ip_async(self, ip_address):
         """Async version of single IP geolocation"""
         self.stdout.write(f"Geolocating {ip_address} (async)...")
@@ -300,6 +277,15 @@ class Command(BaseCommand):
                 f"(Success: {total_success}, Failed: {total_failed})"
             )
         
+        # Provider health as the lookups saw it, in the order they are currently tried
+        for health in geolocation_service.provider_health():
+            success_rate = f"{health['success_rate']:.0%}" if health['success_rate'] is not None else 'n/a'
+            p50 = f"{health['p50_latency'] * 1000:.0f}ms" if health['p50_latency'] is not None else 'n/a'
+            self.stdout.write(
+                f"  {health['provider']}: circuit {health['state']}, "
+                f"success {success_rate} of {health['calls']} recent calls, p50 {p50}"
+            )
+        
         self.stdout.write(
             self.style.SUCCESS(
                 f"Async batch processing complete! "
@@ -0,0 +1,71 @@
+"""
+Management command for moving inline port banners into the content-addressed Banner table
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from internet.lib.banner_store import get_banner_store
+from internet.models import Port
+
+
+class Command(BaseCommand):
+    help = 'Intern legacy Port.banner texts into the Banner table and point ports at the shared rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Ports interned per transaction (default: 5000)'
+        )
+        parser.add_argument(
+            '--keep-text',
+            action='store_true',
+            help='Leave the inline banner column populated instead of clearing it'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size must be positive')
+
+        store = get_banner_store()
+        ports = Port.objects.filter(banner_ref__isnull=True, banner__isnull=False).exclude(banner='')
+        started = time.monotonic()
+        cursor = 0
+        interned = 0
+        distinct = set()
+
+        while True:
+            # Keyset pagination on the primary key; processed rows leave the filter anyway
+            rows = list(
+                ports.filter(id__gt=cursor)
+                .order_by('id')
+                .values_list('id', 'banner')[:options['chunk_size']]
+            )
+            if not rows:
+                break
+
+            with transaction.atomic():
+                banner_ids = store.intern_many((banner, None) for _, banner in rows)
+                updates = [Port(id=port_id, banner_ref_id=banner_ids[banner], banner=banner)
+                           for port_id, banner in rows]
+                fields = ['banner_ref']
+                if not options['keep_text']:
+                    for port in updates:
+                        port.banner = None
+                    fields.append('banner')
+                Port.objects.bulk_update(updates, fields, batch_size=1000)
+
+            interned += len(rows)
+            distinct.update(banner_ids.values())
+            cursor = rows[-1][0]
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'Interned {interned} ports ({interned / max(elapsed, 1e-9):.0f}/s) '
+                f'into {len(distinct)} banners, cursor {cursor}'
+            )
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Interned {interned} port banners into {len(distinct)} distinct banners in {elapsed:.2f}s'
+        ))
@@ -17,7 +17,9 @@ class Command(BaseCommand):
         # Create job command
         create_parser = subparsers.add_parser('create', help='Create a new scanner job')
         create_parser.add_argument('--type', required=True, choices=['masscan', 'nmap', 'custom'], help='Job type')
-        create_parser.add_argument('--target', required=True, help='Target IP, range, or hostname')
+        target_group = create_parser.add_mutually_exclusive_group(required=True)
+        target_group.add_argument('--target', help='Target IP, range, or hostname')
+        target_group.add_argument('--targets-file', help='File with one target per line (creates one job per target)')
         create_parser.add_argument('--ports', nargs='+', type=int, help='Ports to scan')
         create_parser.add_argument('--queue', default='default', help='Queue name')
         create_parser.add_argument('--priority', type=int, default=0, help='Job priority')
@@ -29,6 +31,7 @@ class Command(BaseCommand):
         create_parser.add_argument('--rate', type=int, help='Scan rate')
         create_parser.add_argument('--proxychains', action='store_true', help='Use proxychains')
         create_parser.add_argument('--timeout', type=int, default=3600, help='Maximum scan duration in seconds (default: 3600)')
+        create_parser.add_argument('--force-refresh', action='store_true', help='Re-probe endpoints even if their results are still fresh')
         
         # List jobs command
         list_parser = subparsers.add_parser('list', help='List jobs')
@@ -92,6 +95,8 @@ class Command(BaseCommand):
             scan_options['use_proxychains'] = True
         if options.get('timeout'):
             scan_options['timeout'] = options['timeout']
+        if options.get('force_refresh'):
+            scan_options['force_refresh'] = True
         
         # Parse scheduled time
         scheduled_for = None
@@ -112,6 +117,10 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.ERROR(f'User with ID {options["user"]} not found'))
                 return
         
+        if options.get('targets_file'):
+            self._create_jobs_from_file(options, scan_options, scheduled_for, user)
+            return
+        
         # Create job
         job = QueueManager.create_job(
             job_type=options['type'],
@@ -134,6 +143,32 @@ class Command(BaseCommand):
             )
         )
     
+    def _create_jobs_from_file(self, options, scan_options, scheduled_for, user):
+        """Create one job per target listed in a file"""
+        try:
+            with open(options['targets_file']) as f:
+                targets = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        except OSError as e:
+            self.stdout.write(self.style.ERROR(f'Could not read targets file: {e}'))
+            return
+        
+        jobs = QueueManager.create_jobs(
+            job_type=options['type'],
+            targets=targets,
+            queue_name=options['queue'],
+            ports=options.get('ports'),
+            scan_options=scan_options,
+            priority=options['priority'],
+            user=user,
+            scheduled_for=scheduled_for
+        )
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Created {len(jobs)} {options["type"]} jobs in queue {options["queue"]}'
+            )
+        )
+    
     def _list_jobs(self, options):
         """List jobs with optional filtering"""
         queryset = ScannerJob.objects.all()
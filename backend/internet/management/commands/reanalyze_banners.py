@@ -0,0 +1,177 @@
+"""
+Management command for re-running banner analysis over stored banners
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from internet.lib.banner_analyzer import BannerAnalyzer, load_signatures
+from internet.lib.banner_store import ports_with_banners
+from internet.lib.service_detections import replace_service_detections
+from internet.models import AncillaryJob
+
+
+# Analyzer owned by each pool worker, compiled once from the signatures passed to the initializer
+_worker_analyzer = None
+
+
+def _init_worker(signatures):
+    global _worker_analyzer
+    _worker_analyzer = BannerAnalyzer(signatures)
+
+
+def _analyze(items):
+    """Analyze (banner, port_number) pairs, returning serialized detections per pair"""
+    return [
+        [detection.to_dict() for detection in detections]
+        for detections in _worker_analyzer.analyze_banners(items)
+    ]
+
+
+class Command(BaseCommand):
+    help = ('Re-run banner analysis over stored port banners and write the detections back to '
+            'banner_grab results and the service detection table')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only-older-version',
+            action='store_true',
+            help='Only ports last analyzed by an older signature version, or never analyzed'
+        )
+        parser.add_argument(
+            '--after-id',
+            type=int,
+            help='Resume after this port id (default: value in --cursor-file, else start)'
+        )
+        parser.add_argument(
+            '--cursor-file',
+            type=str,
+            help='File holding the last processed port id, updated after every chunk'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Analysis processes (default: CPU count; 1 analyzes in-process)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=20000,
+            help='Ports read and written per round (default: 20000)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Banners per worker task (default: 2000)'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0 or options['batch_size'] <= 0 or options['workers'] <= 0:
+            raise CommandError('--chunk-size, --batch-size and --workers must be positive')
+
+        signatures = load_signatures()
+        version = signatures['version']
+        cursor = self._initial_cursor(options)
+
+        ports = ports_with_banners()
+        if options['only_older_version']:
+            # Stamped on the port by every analysis, so it survives job cleanup and banner interning
+            ports = ports.filter(Q(signature_version__isnull=True) | Q(signature_version__lt=version))
+
+        started = time.monotonic()
+        processed = 0
+        updated = 0
+
+        if options['workers'] > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=options['workers'], initializer=_init_worker, initargs=(signatures,)
+            )
+        else:
+            executor = None
+            _init_worker(signatures)
+
+        try:
+            while True:
+                # Keyset pagination: each round is an index range scan on the primary key
+                rows = list(
+                    ports.filter(id__gt=cursor)
+                    .order_by('id')
+                    .values_list('id', 'port_number', 'banner_value')[:options['chunk_size']]
+                )
+                if not rows:
+                    break
+
+                detections = self._analyze(executor, [(banner, port) for _, port, banner in rows],
+                                           options['batch_size'])
+                updated += self._write_back(rows, detections, version)
+                processed += len(rows)
+                cursor = rows[-1][0]
+                self._save_cursor(options['cursor_file'], cursor)
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Analyzed {processed} ports ({processed / max(elapsed, 1e-9):.0f}/s), '
+                    f'updated {updated} results, cursor {cursor}'
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Re-analyzed {processed} banners with signature version {version}, '
+            f'updated {updated} results in {elapsed:.2f}s'
+        ))
+
+    def _analyze(self, executor, items, batch_size):
+        """Fan a chunk out to the worker pool in batches and flatten the results in order"""
+        batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+        results = executor.map(_analyze, batches) if executor is not None else map(_analyze, batches)
+        return [detections for batch in results for detections in batch]
+
+    def _write_back(self, rows, detections, version):
+        """Store fresh detections on the latest completed banner_grab job of each port and in the detection table"""
+        by_port = {port_id: port_detections for (port_id, _, _), port_detections in zip(rows, detections)}
+        replace_service_detections(by_port, signature_version=version)
+
+        jobs = (
+            AncillaryJob.objects.filter(port_id__in=by_port, job_type='banner_grab', status='completed')
+            .order_by('port_id', '-completed_at', '-id')
+            .only('id', 'port_id', 'result_data')
+        )
+        latest = {}
+        for job in jobs:
+            latest.setdefault(job.port_id, job)
+
+        for port_id, job in latest.items():
+            job.result_data = dict(job.result_data or {}, detections=by_port[port_id], signature_version=version)
+
+        AncillaryJob.objects.bulk_update(list(latest.values()), ['result_data'], batch_size=1000)
+        return len(latest)
+
+    @staticmethod
+    def _initial_cursor(options):
+        """Port id to resume after, from --after-id or the cursor file"""
+        if options['after_id'] is not None:
+            return options['after_id']
+        path = options['cursor_file']
+        if path and os.path.exists(path):
+            with open(path) as f:
+                content = f.read().strip()
+            if not content.isdigit():
+                raise CommandError(f'Cursor file {path} does not hold a port id')
+            return int(content)
+        return 0
+
+    @staticmethod
+    def _save_cursor(path, cursor):
+        """Atomically record the last processed port id"""
+        if not path:
+            return
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(cursor))
+        os.replace(tmp_path, path)
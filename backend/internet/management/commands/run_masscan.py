@@ -74,6 +74,11 @@ class Command(BaseCommand):
             action='store_true', 
             help='Resume paused scan'
         )
+        parser.add_argument(
+            '--force-refresh',
+            action='store_true',
+            help='Queue ancillary jobs even for endpoints probed within PROBE_FRESHNESS_TTLS (queue mode)'
+        )
         
         # Performance options
         parser.add_argument(
@@ -136,11 +141,12 @@ class Command(BaseCommand):
         priority = kwargs['priority']
         schedule = kwargs['schedule']
         user_id = kwargs['user']
+        force_refresh = kwargs['force_refresh']
 
         if queue_mode:
             self._handle_queued_mode(
                 target, ports, all_ports, syn, tcp, udp, tcp_udp, use_proxychains, resume, rate, timeout,
-                queue_name, priority, schedule, user_id
+                queue_name, priority, schedule, user_id, force_refresh=force_refresh
             )
         else:
             self._handle_direct_mode(
@@ -148,7 +154,7 @@ class Command(BaseCommand):
             )
 
     def _handle_queued_mode(self, target, ports, all_ports, syn, tcp, udp, tcp_udp, use_proxychains, resume, rate, timeout,
-                           queue_name, priority, schedule, user_id):
+                           queue_name, priority, schedule, user_id, force_refresh=False):
         """Handle queued execution mode"""
         # Build scan options
         scan_options = {}
@@ -168,6 +174,8 @@ class Command(BaseCommand):
             scan_options['rate'] = rate
         if resume:
             scan_options['resume'] = True
+        if force_refresh:
+            scan_options['force_refresh'] = True
         scan_options['timeout'] = timeout
 
         # Parse scheduled time
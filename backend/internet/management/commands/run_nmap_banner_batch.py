@@ -0,0 +1,118 @@
+"""
+Management command for batched nmap banner grabbing
+"""
+import asyncio
+import logging
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from internet.lib.nmap_batch import NmapBatchScanner
+from internet.lib.queue_service import QueueService
+from internet.models import AncillaryJob
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Claim pending banner_grab jobs in batches and fingerprint each batch with a single nmap -sV run'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'NMAP_BATCH_SIZE', 500),
+            help='Maximum number of jobs per nmap invocation (default: NMAP_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--ports',
+            type=lambda x: [int(p.strip()) for p in x.split(',')],
+            default=[],
+            help='Only claim jobs for these port numbers (e.g. "21,22,25")'
+        )
+        parser.add_argument(
+            '--host-timeout',
+            type=int,
+            default=None,
+            help='nmap --host-timeout in seconds (default: NMAP_BATCH_HOST_TIMEOUT)'
+        )
+        parser.add_argument(
+            '--nmap-path',
+            type=str,
+            default='nmap',
+            help='Path to the nmap binary (default: nmap)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=10,
+            help='Seconds to wait when no jobs are pending (default: 10)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process a single batch and exit'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('--batch-size must be positive')
+
+        scanner = NmapBatchScanner(
+            nmap_path=options['nmap_path'],
+            host_timeout=options['host_timeout'],
+        )
+        queue_service = QueueService()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Starting batched nmap banner grabbing (batch size: {batch_size})')
+        )
+
+        try:
+            while True:
+                jobs = self.claim_jobs(batch_size, options['ports'])
+                if jobs:
+                    started = time.monotonic()
+                    completed = asyncio.run(
+                        queue_service.process_banner_grab_batch_nmap(jobs, scanner)
+                    )
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f'Completed {completed}/{len(jobs)} banner grab jobs in {elapsed:.2f}s'
+                        )
+                    )
+
+                if options['once']:
+                    break
+                if not jobs:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Stopped by user'))
+
+    def claim_jobs(self, batch_size, ports):
+        """Atomically move a batch of pending banner_grab jobs to running"""
+        with transaction.atomic():
+            queryset = AncillaryJob.objects.select_for_update(skip_locked=True).filter(
+                job_type='banner_grab',
+                status='pending',
+                # Results are keyed by (host, port) from TCP -sV scans
+                protocol='tcp',
+            )
+            if ports:
+                queryset = queryset.filter(port_number__in=ports)
+
+            jobs = list(queryset.order_by('-priority', 'created_at')[:batch_size])
+            if not jobs:
+                return []
+
+            now = timezone.now()
+            for job in jobs:
+                job.status = 'running'
+                job.started_at = now
+            AncillaryJob.objects.bulk_update(jobs, ['status', 'started_at'])
+
+        logger.info(f'Claimed {len(jobs)} banner grab jobs for batched nmap')
+        return jobs
@@ -27,17 +27,25 @@ class Command(BaseCommand):
             )
 
             if target.lower() == 'all':
-                # Process all hosts
-                hosts = Host.objects.all()
+                # Stream all hosts and push them in multi-value RPUSH chunks
+                batch_size = int(settings.REDIS_BATCH_SIZE)
+                hosts = Host.objects.order_by().values_list('id', 'ip').iterator(chunk_size=batch_size)
                 enqueued_count = 0
+                payloads = []
 
-                for host in hosts:
-                    data = {
-                        'ip': host.ip,
-                        'id': host.id
-                    }
-                    r.rpush(settings.REDIS_QUEUE_SSL_SCANNER, json.dumps(data))
-                    enqueued_count += 1
+                for host_id, host_ip in hosts:
+                    payloads.append(json.dumps({
+                        'ip': host_ip,
+                        'id': host_id
+                    }))
+                    if len(payloads) >= batch_size:
+                        r.rpush(settings.REDIS_QUEUE_SSL_SCANNER, *payloads)
+                        enqueued_count += len(payloads)
+                        payloads = []
+
+                if payloads:
+                    r.rpush(settings.REDIS_QUEUE_SSL_SCANNER, *payloads)
+                    enqueued_count += len(payloads)
 
                 self.stdout.write(
                     self.style.SUCCESS(
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2025-10-19 00:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('internet', '0006_host_asn_host_city_host_country_host_country_code_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ancillaryjob',
+            name='job_type',
+            field=models.CharField(choices=[('banner_grab', 'Banner Grab'), ('domain_enum', 'Domain Enumeration'), ('ssl_cert', 'SSL Certificate'), ('geolocation', 'Geolocation'), ('dns_relay', 'DNS Relay'), ('service_detection', 'Service Detection'), ('vulnerability_scan', 'Vulnerability Scan')], default='banner_grab', max_length=20),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.1 on 2025-10-19 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('internet', '0007_add_dns_relay_job_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='proxy',
+            name='fail_count',
+            field=models.PositiveIntegerField(default=0, help_text='Consecutive failed liveness checks'),
+        ),
+        migrations.AddField(
+            model_name='proxy',
+            name='last_checked',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='proxy',
+            name='latency_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.1 on 2025-10-19 01:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('internet', '0008_proxy_liveness_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProbeFreshness',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip', models.CharField(max_length=255)),
+                ('port_number', models.PositiveIntegerField(default=0)),
+                ('proto', models.CharField(blank=True, default='', max_length=3)),
+                ('probe_type', models.CharField(max_length=20)),
+                ('checked_at', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('ip', 'port_number', 'proto', 'probe_type'), name='unique_probe_freshness')],
+            },
+        ),
+    ]
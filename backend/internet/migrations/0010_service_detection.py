@@ -0,0 +1,31 @@
+# Generated by Django 5.1.1 on 2025-10-19 01:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('internet', '0009_probe_freshness'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceDetection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_type', models.CharField(max_length=20)),
+                ('product', models.CharField(blank=True, max_length=100, null=True)),
+                ('version', models.CharField(blank=True, max_length=255, null=True)),
+                ('confidence', models.FloatField()),
+                ('signature_version', models.PositiveIntegerField(blank=True, null=True)),
+                ('detected_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('port', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='service_detections', to='internet.port')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['service_type', 'product', 'version'], name='internet_se_service_edebf4_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2025-10-19 02:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('internet', '0010_service_detection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Banner',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('text', models.TextField()),
+                ('raw', models.BinaryField(blank=True, null=True)),
+                ('raw_size', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='port',
+            name='internet_po_banner_634ca1_idx',
+        ),
+        migrations.AddField(
+            model_name='port',
+            name='banner_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ports', to='internet.banner'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2025-10-19 02:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('internet', '0011_banner_interning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='port',
+            name='signature_version',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -77,18 +77,41 @@ class Host(models.Model):
         ]
 
 
+class Banner(models.Model):
+    """Distinct banner text, stored once and shared by every port that returned it"""
+    sha256 = models.CharField(max_length=64, unique=True)  # Digest of text
+    text = models.TextField()
+    raw = models.BinaryField(blank=True, null=True)  # zstd-compressed response bytes of the first grab
+    raw_size = models.PositiveIntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} {self.text[:50]}"
+
+
 class Port(models.Model):
     port_number = models.IntegerField()
     proto = models.CharField(max_length=3)
     status = models.CharField(max_length=25)
     last_seen = models.DateTimeField(blank=True, null=True)
+    # Legacy inline banner; new banners go to banner_ref and intern_banners moves old ones over
     banner = models.TextField(blank=True, null=True)
+    banner_ref = models.ForeignKey('Banner', related_name='ports', null=True, blank=True, on_delete=models.SET_NULL)
+    # Signature version of the analysis behind the port's service detections (None: never analyzed)
+    signature_version = models.PositiveIntegerField(blank=True, null=True)
     scan = models.ForeignKey('Scan', related_name='ports', on_delete=models.CASCADE)
     host = models.ForeignKey('Host', related_name='ports', on_delete=models.CASCADE)
 
     def __str__(self):
         return str(self.port_number)
     
+    @property
+    def banner_text(self):
+        """The port's banner, whether interned or still inline"""
+        if self.banner_ref_id:
+            return self.banner_ref.text
+        return self.banner
+    
     def update_last_seen(self):
         """Update the last_seen timestamp to current time"""
         from django.utils import timezone
@@ -101,7 +124,6 @@ class Port(models.Model):
             models.Index(fields=['host']),  # For prefetch performance
             models.Index(fields=['port_number']),  # For port number searches
             models.Index(fields=['proto']),  # For protocol searches
-            models.Index(fields=['banner']),  # For banner searches
         ]
 
 
@@ -115,6 +137,9 @@ class Proxy(models.Model):
     password = models.CharField(max_length=255, blank=True, null=True)
     enabled = models.BooleanField(default=True)
     dead = models.BooleanField(default=False)
+    latency_ms = models.FloatField(null=True, blank=True)
+    last_checked = models.DateTimeField(null=True, blank=True)
+    fail_count = models.PositiveIntegerField(default=0, help_text="Consecutive failed liveness checks")
 
     def __str__(self):
         return f'{self.proxy_type}:{self.host_name}:{self.port_number}'
@@ -163,6 +188,48 @@ class SSLCertificate(models.Model):
         ]
 
 
+class ServiceDetection(models.Model):
+    """A service identified on a port by banner analysis, replaced whenever the port is re-analyzed"""
+    port = models.ForeignKey('Port', related_name='service_detections', on_delete=models.CASCADE)
+    service_type = models.CharField(max_length=20)
+    product = models.CharField(max_length=100, blank=True, null=True)
+    version = models.CharField(max_length=255, blank=True, null=True)
+    confidence = models.FloatField()
+    signature_version = models.PositiveIntegerField(blank=True, null=True)
+    detected_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        product = f" {self.product}" if self.product else ""
+        version = f" {self.version}" if self.version else ""
+        return f"{self.service_type}{product}{version} ({self.confidence:.2f})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['service_type', 'product', 'version']),  # For service/product/version lookups
+        ]
+
+
+class ProbeFreshness(models.Model):
+    """When a probe type last completed against an endpoint (port 0 for host-level probes)"""
+    ip = models.CharField(max_length=255)
+    port_number = models.PositiveIntegerField(default=0)
+    proto = models.CharField(max_length=3, blank=True, default='')
+    probe_type = models.CharField(max_length=20)
+    checked_at = models.DateTimeField()
+
+    def __str__(self):
+        port_str = f":{self.port_number}/{self.proto}" if self.port_number else ""
+        return f"{self.probe_type} {self.ip}{port_str} @ {self.checked_at}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['ip', 'port_number', 'proto', 'probe_type'],
+                name='unique_probe_freshness',
+            ),
+        ]
+
+
 class JobQueue(models.Model):
     """Represents a queue for scanner jobs"""
     name = models.CharField(max_length=100, unique=True)
@@ -360,6 +427,8 @@ class AncillaryJob(models.Model):
         ('banner_grab', 'Banner Grab'),
         ('domain_enum', 'Domain Enumeration'),
         ('ssl_cert', 'SSL Certificate'),
+        ('geolocation', 'Geolocation'),
+        ('dns_relay', 'DNS Relay'),
         ('service_detection', 'Service Detection'),
         ('vulnerability_scan', 'Vulnerability Scan'),
     ]
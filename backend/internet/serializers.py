@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from internet.models import Scan, Host, Domain, Port, Proxy, DNSRelay, SSLCertificate
+from internet.models import Scan, Host, Domain, Port, Proxy, DNSRelay, SSLCertificate, ServiceDetection
 
 
 class ScanSerializer(serializers.ModelSerializer):
@@ -14,8 +14,18 @@ class SSLCertificateSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ServiceDetectionSerializer(serializers.ModelSerializer):
+    host = serializers.CharField(source='port.host.ip', read_only=True)
+    port_number = serializers.IntegerField(source='port.port_number', read_only=True)
+
+    class Meta:
+        model = ServiceDetection
+        fields = '__all__'
+
+
 class PortSerializer(serializers.ModelSerializer):
     host = serializers.StringRelatedField()
+    banner = serializers.CharField(source='banner_text', read_only=True)
 
     class Meta:
         model = Port
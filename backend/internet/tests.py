@@ -1,3 +1,1719 @@
-from django.test import TestCase
+"""
+Tests for the internet application
 
-# Create your tests here.
+Covers the scanner job pipeline helpers in internet.lib
+"""
+
+import asyncio
+import datetime
+import io
+import ipaddress
+import json
+import os
+import ssl
+import stat
+import struct
+import tempfile
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from internet.lib.banner_analyzer import BannerAnalyzer, ServiceType
+from internet.lib.banner_grabber import BannerGrabber
+from internet.lib.banner_store import ZSTD_AVAILABLE, BannerStore, banner_digest, ports_with_banners
+from internet.lib.circuit_breaker import CircuitBreaker
+from internet.lib.async_dns import AsyncDNSResolver
+from internet.lib.bulk_enqueue import BulkEnqueueService
+from internet.lib.cert_cache import CertificateCache
+from internet.lib.dns_relay import DNSRelayChecker
+from internet.lib.domain_enumerator import DomainEnumerator
+from internet.lib.geo_cache import PrefixRangeCache
+from internet.lib.geo_http import AIOHTTP_AVAILABLE, GeoHTTPClient
+from internet.lib.geo_mmdb import MMDBGeolocationProvider
+from internet.lib.geo_providers import GeoProvider, IPAPIProvider, ProviderRequest
+from internet.lib.geo_health import ProviderHealth
+from internet.lib.geolocation import GeolocationService, ProviderHTTPError
+from internet.lib.http_fingerprint import HTTPFingerprinter, favicon_hash, murmur3_32
+from internet.lib.nmap_batch import NmapBatchScanner
+from internet.lib.proxy_checker import ProxyChecker, ProxyCheckResult, apply_check_result
+from internet.lib.probe_freshness import ProbeFreshnessIndex
+from internet.lib.proxy_pool import PooledProxy, ProxyPool, ProxyPoolExhausted
+from internet.lib.queue_service import QueueService
+from internet.lib.rate_limiter import TokenBucket
+from internet.lib.service_probes import ServiceProbeDB
+from internet.lib.ssl_cert_grabber import SSLCertGrabber
+from internet.lib.tls_endpoint import TLSEndpointProber
+from internet.lib.udp_prober import DNS_VERSION_BIND_UDP, NTP_REQUEST, UDPProber
+from internet.models import (
+    AncillaryJob, Banner, Host, Port, ProbeFreshness, Proxy, Scan, ServiceDetection, SSLCertificate,
+)
+
+
+class BulkEnqueueServiceTestCase(TestCase):
+    """Test case for bulk ancillary job creation"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.scan = Scan.objects.create(scan_command='test', scan_type='masscan')
+        self.public_hosts = [
+            Host.objects.create(ip=f'8.8.8.{i}') for i in range(1, 6)
+        ]
+        self.private_host = Host.objects.create(ip='10.0.0.1')
+        for host in self.public_hosts:
+            Port.objects.create(host=host, scan=self.scan, port_number=443, proto='tcp', status='open')
+            Port.objects.create(host=host, scan=self.scan, port_number=22, proto='tcp', status='open')
+
+        self.service = BulkEnqueueService(chunk_size=2, batch_size=2)
+
+    def test_enqueue_host_jobs_skips_private_and_active(self):
+        """Hosts with an active job of the same type are not queued again"""
+        AncillaryJob.objects.create(
+            job_type='geolocation', host_ip=self.public_hosts[0].ip,
+            host=self.public_hosts[0], status='pending'
+        )
+
+        result = self.service.enqueue_host_jobs('geolocation')
+
+        self.assertEqual(result['queued'], 4)
+        self.assertEqual(result['skipped'], 1)
+        self.assertEqual(AncillaryJob.objects.filter(job_type='geolocation').count(), 5)
+        self.assertFalse(AncillaryJob.objects.filter(host=self.private_host).exists())
+
+    def test_enqueue_host_jobs_requeues_completed(self):
+        """Completed jobs do not block a new job"""
+        AncillaryJob.objects.create(
+            job_type='domain_enum', host_ip=self.public_hosts[0].ip,
+            host=self.public_hosts[0], status='completed'
+        )
+
+        result = self.service.enqueue_host_jobs('domain_enum')
+
+        self.assertEqual(result['queued'], 5)
+
+    def test_enqueue_port_jobs_filters_ports(self):
+        """Port jobs carry the port, host and protocol of each candidate"""
+        ports = Port.objects.filter(port_number=443)
+
+        result = self.service.enqueue_port_jobs('ssl_cert', ports=ports)
+
+        self.assertEqual(result['queued'], 5)
+        job = AncillaryJob.objects.filter(job_type='ssl_cert').first()
+        self.assertEqual(job.port_number, 443)
+        self.assertEqual(job.protocol, 'tcp')
+        self.assertEqual(job.host_ip, job.host.ip)
+
+        # Second run finds nothing new
+        result = self.service.enqueue_port_jobs('ssl_cert', ports=ports)
+        self.assertEqual(result['queued'], 0)
+
+    def test_fresh_targets_skipped_unless_forced(self):
+        """Recently probed ports and hosts are not queued again until their TTL runs out"""
+        freshness = ProbeFreshnessIndex(ttls={'banner_grab': 3600, 'domain_enum': 3600})
+        service = BulkEnqueueService(chunk_size=2, batch_size=2, freshness=freshness)
+        stale = timezone.now() - datetime.timedelta(hours=2)
+        freshness.mark_fresh('banner_grab', [(self.public_hosts[0].ip, 443, 'tcp'),
+                                             (self.public_hosts[0].ip, 22, 'udp')])
+        freshness.mark_fresh('banner_grab', [(self.public_hosts[1].ip, 443, 'tcp')], checked_at=stale)
+        freshness.mark_fresh('domain_enum', [(self.public_hosts[0].ip, 443, 'tcp')])
+
+        self.assertEqual(service.enqueue_port_jobs('banner_grab', dry_run=True)['queued'], 9)
+        self.assertEqual(service.enqueue_port_jobs('banner_grab', dry_run=True, force_refresh=True)['queued'], 10)
+        self.assertEqual(service.enqueue_host_jobs('domain_enum', dry_run=True)['queued'], 4)
+        self.assertEqual(
+            freshness.fresh_probe_types(self.public_hosts[0].ip, 443, 'tcp'), {'banner_grab', 'domain_enum'}
+        )
+        self.assertEqual(freshness.fresh_probe_types(self.public_hosts[1].ip, 443, 'tcp'), set())
+        targets = [(self.public_hosts[0].ip, 443, 'tcp'), (self.public_hosts[0].ip, 22, 'tcp'),
+                   (self.public_hosts[1].ip, 443, 'tcp')]
+        with self.assertNumQueries(1):
+            fresh = freshness.fresh_probe_types_bulk(targets)
+        self.assertEqual(fresh, {targets[0]: {'banner_grab', 'domain_enum'}, targets[1]: {'domain_enum'},
+                                 targets[2]: set()})
+
+        # Upserting refreshes the existing row instead of adding another
+        freshness.mark_fresh('banner_grab', [(self.public_hosts[1].ip, 443, 'tcp')])
+        self.assertEqual(ProbeFreshness.objects.filter(ip=self.public_hosts[1].ip).count(), 1)
+        self.assertEqual(service.enqueue_port_jobs('banner_grab', dry_run=True)['queued'], 8)
+
+    def test_dry_run_creates_nothing(self):
+        """Dry runs only count candidates"""
+        result = self.service.enqueue_port_jobs('banner_grab', dry_run=True)
+
+        self.assertEqual(result['queued'], 10)
+        self.assertFalse(AncillaryJob.objects.exists())
+
+    def test_rejects_wrong_job_level(self):
+        """Port-level job types cannot be queued per host"""
+        with self.assertRaises(ValueError):
+            self.service.enqueue_host_jobs('banner_grab')
+
+
+class MasscanDiscoveryTestCase(TransactionTestCase):
+    """Test case for writing masscan discoveries while the scan runs
+
+    Discoveries are written from a sync_to_async thread, which only sees committed rows.
+    """
+
+    def test_sparse_output_is_flushed_on_time(self):
+        """A lone discovery is written before masscan prints anything else or exits"""
+        from asgiref.sync import sync_to_async
+        from internet.models import JobQueue, ScannerJob
+
+        queue = JobQueue.objects.create(name='test')
+        scan = Scan.objects.create(scan_command='test', scan_type='masscan')
+        job = ScannerJob.objects.create(queue=queue, target='192.0.2.5', scan=scan)
+        port_seen = sync_to_async(Port.objects.filter(host__ip='192.0.2.5', port_number=22).exists)
+
+        async def run():
+            scan_task = asyncio.create_task(QueueService()._run_masscan_scan(
+                job, "printf 'Discovered open port 22/tcp on 192.0.2.5\\n'; sleep 1.5", timeout=10
+            ))
+            await asyncio.sleep(0.8)
+            seen_while_running = await port_seen()
+            await scan_task
+            return seen_while_running
+
+        with mock.patch('internet.lib.queue_service.DISCOVERY_FLUSH_INTERVAL', 0.2):
+            self.assertTrue(asyncio.run(run()))
+        self.assertTrue(AncillaryJob.objects.filter(host_ip='192.0.2.5', job_type='banner_grab').exists())
+
+
+class ReanalyzeBannersCommandTestCase(TestCase):
+    """Test case for the banner re-analysis backfill command"""
+
+    def setUp(self):
+        scan = Scan.objects.create(scan_command='test', scan_type='masscan')
+        host = Host.objects.create(ip='198.51.100.7')
+        self.ssh = Port.objects.create(host=host, scan=scan, port_number=22, proto='tcp',
+                                       banner='SSH-2.0-OpenSSH_8.9p1', signature_version=0)
+        self.web = Port.objects.create(host=host, scan=scan, port_number=80, proto='tcp',
+                                       banner='HTTP/1.1 200 OK Server: nginx/1.18.0')
+        self.jobs = {}
+        for port, signature_version in ((self.ssh, 0), (self.web, None)):
+            result_data = {'banner': port.banner, 'detections': []}
+            if signature_version is not None:
+                result_data['signature_version'] = signature_version
+            self.jobs[port.id] = AncillaryJob.objects.create(
+                job_type='banner_grab', host_ip=host.ip, port_number=port.port_number,
+                port=port, host=host, status='completed', completed_at=timezone.now(),
+                result_data=result_data,
+            )
+
+    def test_backfill_updates_stale_results_and_resumes(self):
+        """Stale results are rewritten once; the cursor file lets a rerun skip processed ports"""
+        from django.core.management import call_command
+        from internet.lib.banner_analyzer import load_signatures
+
+        version = load_signatures()['version']
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cursor_file = os.path.join(tmpdir, 'cursor')
+            call_command('reanalyze_banners', only_older_version=True, workers=2, chunk_size=1,
+                         cursor_file=cursor_file, stdout=io.StringIO())
+
+            with open(cursor_file) as f:
+                self.assertEqual(int(f.read()), self.web.id)
+
+            ssh_result = AncillaryJob.objects.get(id=self.jobs[self.ssh.id].id).result_data
+            self.assertEqual(ssh_result['signature_version'], version)
+            self.assertEqual(ssh_result['detections'][0]['service_type'], 'ssh')
+            self.assertEqual(ssh_result['banner'], self.ssh.banner)
+            web_result = AncillaryJob.objects.get(id=self.jobs[self.web.id].id).result_data
+            self.assertEqual(web_result['detections'][0]['service_type'], 'http')
+
+            # Everything is current now, and the cursor is past the last port anyway
+            out = io.StringIO()
+            call_command('reanalyze_banners', only_older_version=True, workers=1, after_id=0, stdout=out)
+            self.assertIn('Re-analyzed 0 banners', out.getvalue())
+
+    def test_older_version_converges_without_jobs(self):
+        """Ports without a banner_grab job, or with nothing detected, are stamped and skipped next time"""
+        from django.core.management import call_command
+
+        AncillaryJob.objects.all().delete()
+        Port.objects.create(host=self.ssh.host, scan=self.ssh.scan, port_number=9999, proto='tcp',
+                            banner='\x00\x01 nothing to see')
+
+        out = io.StringIO()
+        call_command('reanalyze_banners', only_older_version=True, workers=1, stdout=out)
+        self.assertIn('Re-analyzed 3 banners', out.getvalue())
+
+        out = io.StringIO()
+        call_command('reanalyze_banners', only_older_version=True, workers=1, stdout=out)
+        self.assertIn('Re-analyzed 0 banners', out.getvalue())
+
+    def test_backfill_fills_detection_table(self):
+        """Detections land in the indexed table, are replaced on rerun and are filterable through the API"""
+        from django.core.management import call_command
+
+        for _ in range(2):
+            call_command('reanalyze_banners', workers=1, stdout=io.StringIO())
+
+        nginx = ServiceDetection.objects.get(port=self.web, product='nginx')
+        self.assertEqual((nginx.service_type, nginx.version), ('http', '1.18.0'))
+        self.assertEqual(ServiceDetection.objects.filter(port=self.web, product='nginx').count(), 1)
+        self.assertFalse(ServiceDetection.objects.filter(service_type='unknown').exists())
+
+        response = self.client.get('/api/service-detections/', {'product': 'nginx', 'version': '1.18.0'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['port'] for row in response.json()['results']], [self.web.id])
+        self.assertEqual(response.json()['results'][0]['host'], '198.51.100.7')
+
+
+class BannerStoreTestCase(TestCase):
+    """Test case for content-addressed banner storage"""
+
+    def setUp(self):
+        scan = Scan.objects.create(scan_command='test', scan_type='masscan')
+        self.ports = [
+            Port.objects.create(host=Host.objects.create(ip=f'198.51.100.{i}'), scan=scan,
+                                port_number=22, proto='tcp', banner='SSH-2.0-OpenSSH_8.9p1')
+            for i in range(3)
+        ]
+
+    def test_intern_deduplicates_and_keeps_raw(self):
+        """Identical texts share one row; raw bytes survive a compression round trip"""
+        store = BannerStore(store_raw=True)
+        raw = b'SSH-2.0-OpenSSH_8.9p1 Ubuntu-3\r\n' * 20
+        first = store.intern('SSH-2.0-OpenSSH_8.9p1', raw)
+        ids = store.intern_many([('SSH-2.0-OpenSSH_8.9p1', None), ('220 ProFTPD Server', None)])
+
+        self.assertEqual(ids['SSH-2.0-OpenSSH_8.9p1'], first)
+        self.assertEqual(Banner.objects.count(), 2)
+        banner = Banner.objects.get(id=first)
+        self.assertEqual(banner.sha256, banner_digest('SSH-2.0-OpenSSH_8.9p1'))
+        if ZSTD_AVAILABLE:
+            self.assertLess(len(banner.raw), len(raw))
+            self.assertEqual(store.decompress(banner), raw)
+
+    def test_intern_banners_command_moves_inline_banners(self):
+        """Inline banners collapse onto one shared row and the API still shows the text"""
+        from django.core.management import call_command
+
+        call_command('intern_banners', chunk_size=2, stdout=io.StringIO())
+
+        self.assertEqual(Banner.objects.count(), 1)
+        for port in Port.objects.filter(id__in=[p.id for p in self.ports]):
+            self.assertIsNone(port.banner)
+            self.assertEqual(port.banner_text, 'SSH-2.0-OpenSSH_8.9p1')
+        self.assertEqual(Banner.objects.get().ports.count(), 3)
+        self.assertEqual(ports_with_banners().count(), 3)
+
+        response = self.client.get(f'/api/ports/{self.ports[0].id}/')
+        self.assertEqual(response.json()['banner'], 'SSH-2.0-OpenSSH_8.9p1')
+
+
+class BannerGrabberTestCase(SimpleTestCase):
+    """Test case for the asyncio banner grabbing engine"""
+
+    async def _serve(self, handler):
+        """Start a local TCP server and return it with its port"""
+        server = await asyncio.start_server(handler, '127.0.0.1', 0)
+        return server, server.sockets[0].getsockname()[1]
+
+    def test_greeting_banner(self):
+        """Servers that speak first are captured by the NULL probe"""
+        async def handler(reader, writer):
+            writer.write(b'SSH-2.0-OpenSSH_8.9p1 Ubuntu-3\r\n')
+            await writer.drain()
+            await reader.read(100)
+            writer.close()
+
+        async def run():
+            server, port = await self._serve(handler)
+            async with server:
+                grabber = BannerGrabber(timeout=1, use_nmap_fallback=False)
+                return await grabber.grab('127.0.0.1', port)
+
+        result = asyncio.run(run())
+        self.assertEqual(result.probe, 'NULL')
+        self.assertEqual(result.banner, 'SSH-2.0-OpenSSH_8.9p1 Ubuntu-3')
+
+    def test_http_fallback_probe(self):
+        """Silent unknown services get an HTTP request"""
+        async def handler(reader, writer):
+            try:
+                request = await reader.readuntil(b'\r\n\r\n')
+            except asyncio.IncompleteReadError:
+                # The NULL probe disconnects without sending anything
+                request = b''
+            if request.startswith(b'GET / '):
+                writer.write(b'HTTP/1.0 200 OK\r\nServer: nginx/1.18.0\r\n\r\n')
+            writer.close()
+
+        async def run():
+            server, port = await self._serve(handler)
+            async with server:
+                grabber = BannerGrabber(timeout=0.5, use_nmap_fallback=False)
+                return await grabber.grab_banners_batch([('127.0.0.1', port, 'tcp')]), port
+
+        results, port = asyncio.run(run())
+        self.assertEqual(results[('127.0.0.1', port)], 'HTTP/1.0 200 OK Server: nginx/1.18.0')
+
+    def test_closed_port_and_udp(self):
+        """Closed ports and non-TCP protocols return None"""
+        async def run():
+            server, port = await self._serve(lambda r, w: w.close())
+            server.close()
+            await server.wait_closed()
+            grabber = BannerGrabber(timeout=0.5, use_nmap_fallback=False)
+            return (
+                await grabber.grab_banner('127.0.0.1', port),
+                await grabber.grab_banner('127.0.0.1', port, 'udp'),
+            )
+
+        self.assertEqual(asyncio.run(run()), (None, None))
+
+
+NMAP_XML = """<?xml version="1.0"?>
+<nmaprun scanner="nmap">
+<host><address addr="192.0.2.1" addrtype="ipv4"/><ports>
+<port protocol="tcp" portid="22"><state state="open"/>
+<service name="ssh" product="OpenSSH" version="8.9p1"/></port>
+<port protocol="tcp" portid="80"><state state="open"/>
+<script id="banner" output="HTTP/1.1 400 Bad Request"/></port>
+</ports></host>
+<host><address addr="192.0.2.2" addrtype="ipv4"/><ports>
+<port protocol="tcp" portid="22"><state state="filtered"/></port>
+</ports></host>
+</nmaprun>
+"""
+
+
+class NmapBatchScannerTestCase(SimpleTestCase):
+    """Test case for batched nmap service detection"""
+
+    def test_group_targets_by_port_set(self):
+        """Hosts needing identical port lists share one nmap run"""
+        groups = NmapBatchScanner.group_targets([
+            ('192.0.2.1', 22), ('192.0.2.1', 80), ('192.0.2.2', 80),
+            ('192.0.2.2', 22), ('192.0.2.3', 443),
+        ])
+
+        self.assertEqual(groups, {
+            (22, 80): ['192.0.2.1', '192.0.2.2'],
+            (443,): ['192.0.2.3'],
+        })
+
+    def test_scan_streams_results_to_callback(self):
+        """Every requested target is dispatched exactly once"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fake_nmap = os.path.join(tmpdir, 'nmap')
+            with open(fake_nmap, 'w') as f:
+                f.write('#!/bin/sh\ncat <<\'EOF\'\n' + NMAP_XML + 'EOF\n')
+            os.chmod(fake_nmap, os.stat(fake_nmap).st_mode | stat.S_IEXEC)
+
+            dispatched = []
+
+            async def on_result(host, port, banner):
+                dispatched.append((host, port, banner))
+
+            scanner = NmapBatchScanner(nmap_path=fake_nmap)
+            results = asyncio.run(scanner.scan(
+                [('192.0.2.1', 22), ('192.0.2.1', 80), ('192.0.2.2', 22), ('192.0.2.2', 80)],
+                on_result,
+            ))
+
+        self.assertEqual(len(dispatched), 4)
+        self.assertEqual(results[('192.0.2.1', 22)], 'ssh OpenSSH 8.9p1')
+        self.assertEqual(results[('192.0.2.1', 80)], 'HTTP/1.1 400 Bad Request')
+        self.assertIsNone(results[('192.0.2.2', 22)])
+        # Not present in the output at all
+        self.assertIsNone(results[('192.0.2.2', 80)])
+
+
+class RunNmapBannerBatchCommandTestCase(TestCase):
+    """Test case for claiming banner grab jobs for batched nmap"""
+
+    def test_claim_jobs_skips_udp_ports(self):
+        """UDP banner jobs are left for the UDP prober"""
+        from internet.management.commands.run_nmap_banner_batch import Command
+
+        tcp = AncillaryJob.objects.create(job_type='banner_grab', host_ip='192.0.2.1', port_number=53)
+        udp = AncillaryJob.objects.create(job_type='banner_grab', host_ip='192.0.2.1', port_number=53,
+                                          protocol='udp')
+
+        self.assertEqual([job.id for job in Command().claim_jobs(10, None)], [tcp.id])
+        udp.refresh_from_db()
+        self.assertEqual(udp.status, 'pending')
+
+
+SERVICE_PROBES = r"""
+# Excerpt in nmap-service-probes format
+Probe TCP NULL q||
+match ftp m|^220 \(vsFTPd ([-.\w]+)\)\r\n| p/vsftpd/ v/$1/ o/Unix/ cpe:/a:beasts:vsftpd:$1/
+match ssh m|^SSH-([\d.]+)-OpenSSH_([\w._-]+) Ubuntu-([^\r\n]+)\r?\n| p/OpenSSH/ v/$2 Ubuntu $3/ i/protocol $1/ cpe:/a:openbsd:openssh:$2/a
+softmatch ftp m|^220[- ].*ftp|i
+Probe TCP GetRequest q|GET / HTTP/1.0\r\n\r\n|
+ports 80,8000-8010
+match http m|^HTTP/1\.[01] \d\d\d .*\r\nServer: nginx/([\d.]+)\r\n|s p/nginx/ v/$1/
+softmatch http m|^HTTP/1\.[01] \d\d\d|
+"""
+
+
+class ServiceProbeDBTestCase(SimpleTestCase):
+    """Test case for the in-process nmap-service-probes matcher"""
+
+    def setUp(self):
+        """Parse the probe excerpt"""
+        self.db = ServiceProbeDB(path='/nonexistent')
+        self.db.parse(SERVICE_PROBES)
+        self.db.loaded = True
+
+    def test_parses_probes_and_port_hints(self):
+        """Probe payloads are unescaped and port ranges expanded"""
+        probe = self.db.probes[('TCP', 'GetRequest')]
+        self.assertEqual(probe.payload, b'GET / HTTP/1.0\r\n\r\n')
+        self.assertIn(8005, probe.ports)
+        self.assertEqual(len(self.db.probes[('TCP', 'NULL')].matches), 3)
+
+    def test_hard_match_with_version_templates(self):
+        """Capture groups fill product, version, info and CPE"""
+        match = self.db.match(b'SSH-2.0-OpenSSH_8.9p1 Ubuntu-3ubuntu0.4\r\n', 'NULL', 22)
+
+        self.assertEqual(match.service, 'ssh')
+        self.assertFalse(match.soft)
+        self.assertEqual(match.product, 'OpenSSH')
+        self.assertEqual(match.version, '8.9p1 Ubuntu 3ubuntu0.4')
+        self.assertEqual(match.info, 'protocol 2.0')
+        self.assertEqual(match.cpe, ['cpe:/a:openbsd:openssh:8.9p1'])
+
+    def test_probe_rules_then_soft_match(self):
+        """Responses are matched against the sending probe's rules"""
+        nginx = self.db.match(b'HTTP/1.1 200 OK\r\nDate: x\r\nServer: nginx/1.18.0\r\n\r\n', 'GetRequest')
+        self.assertEqual((nginx.product, nginx.version), ('nginx', '1.18.0'))
+
+        # Unknown probe: port hints select GetRequest
+        generic = self.db.match(b'HTTP/1.1 404 Not Found\r\n\r\n', port=8005)
+        self.assertEqual(generic.service, 'http')
+        self.assertTrue(generic.soft)
+
+        self.assertIsNone(self.db.match(b'\x00\x01garbage', 'NULL', 9999))
+
+
+class BannerAnalyzerTestCase(SimpleTestCase):
+    """Test case for the precompiled banner signature engine"""
+
+    BANNERS = [
+        'SSH-2.0-OpenSSH_8.9p1 Ubuntu-3ubuntu0.1',
+        'HTTP/1.1 200 OK Server: nginx/1.18.0 Content-Type: text/html',
+        'HTTP/1.0 407 Proxy Authentication Required Proxy-Authenticate: Basic realm="squid"',
+        '220 mail.example.test ESMTP Postfix',
+        '220 (vsFTPd 3.0.3) FTP server ready',
+        '5.7.33-log mysql native password',
+        'secure tls endpoint',
+        'nothing recognisable',
+    ]
+
+    def test_prefilter_keeps_every_matching_signature(self):
+        """Literal prefiltering never drops a signature whose regex matches"""
+        from internet.lib.banner_analyzer import AHOCORASICK_AVAILABLE
+
+        for use_ahocorasick in {False, AHOCORASICK_AVAILABLE}:
+            analyzer = BannerAnalyzer(use_ahocorasick=use_ahocorasick)
+            for banner in self.BANNERS:
+                banner_lower = banner.lower()
+                matching = [sig for sig in analyzer._signatures if sig.regex.search(banner_lower)]
+                candidates = analyzer._candidates(analyzer._literal_hits(banner_lower))
+                self.assertTrue(set(matching) <= set(candidates), banner)
+
+    def test_detections(self):
+        """Service type, version and extra info come from the compiled signatures"""
+        analyzer = BannerAnalyzer()
+
+        ssh = analyzer.analyze_banner(self.BANNERS[0], 22)
+        self.assertEqual(ssh[0].service_type, ServiceType.SSH)
+        self.assertEqual(ssh[0].confidence, 1.0)
+        self.assertEqual(ssh[0].version, '8.9')
+        self.assertEqual(ssh[0].additional_info['software'], 'openssh_8.9p1')
+
+        proxy = analyzer.analyze_banner(self.BANNERS[2], 3128)
+        self.assertEqual(proxy[0].service_type, ServiceType.PROXY)
+
+        web = analyzer.analyze_banner(self.BANNERS[1], 443)
+        self.assertTrue(analyzer.should_queue_ssl_cert(web))
+        self.assertEqual(analyzer.analyze_banner('nothing recognisable', 1234)[0].service_type, ServiceType.UNKNOWN)
+
+    def test_hot_reload_on_version_change(self):
+        """Workers pick up a new signature version without restarting and keep it if the file breaks"""
+        from internet.lib import banner_analyzer
+
+        signatures = banner_analyzer.load_signatures(banner_analyzer.DEFAULT_SIGNATURES_PATH)
+        saved = (banner_analyzer._banner_analyzer, banner_analyzer._signatures_mtime)
+
+        def write(path, data, mtime):
+            with open(path, 'w') as f:
+                f.write(data if isinstance(data, str) else json.dumps(data))
+            os.utime(path, (mtime, mtime))
+
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, 'signatures.json')
+                with self.settings(SERVICE_SIGNATURES_PATH=path, SERVICE_SIGNATURES_RELOAD_INTERVAL=0):
+                    write(path, dict(signatures, version=5), 1000)
+                    banner_analyzer.reload_banner_analyzer(force=True)
+                    self.assertEqual(banner_analyzer.get_banner_analyzer().signature_version, 5)
+                    detections = banner_analyzer.get_banner_analyzer().analyze_banner('KeyDB ready', 6379)
+                    self.assertEqual(detections[0].service_type, ServiceType.UNKNOWN)
+
+                    services = dict(signatures['services'], redis=[{'pattern': '(?i)keydb', 'confidence': 0.9}])
+                    write(path, dict(signatures, version=6, services=services), 2000)
+                    analyzer = banner_analyzer.get_banner_analyzer()
+                    detections = analyzer.analyze_banner('KeyDB ready', 6379)
+                    self.assertEqual(analyzer.signature_version, 6)
+                    self.assertEqual(detections[0].service_type, ServiceType.REDIS)
+                    self.assertEqual(detections[0].signature_version, 6)
+
+                    write(path, '{"version": 7, "services": {"redis": [{"pattern": "(unclosed"}]}}', 3000)
+                    with self.assertLogs('internet.lib.banner_analyzer', level='ERROR'):
+                        self.assertIs(banner_analyzer.get_banner_analyzer(), analyzer)
+        finally:
+            banner_analyzer._banner_analyzer, banner_analyzer._signatures_mtime = saved
+
+    def test_bad_version_pattern_keeps_current_analyzer(self):
+        """Every section is validated; a rejected file is retried until it is fixed"""
+        from internet.lib import banner_analyzer
+
+        signatures = banner_analyzer.load_signatures(banner_analyzer.DEFAULT_SIGNATURES_PATH)
+        saved = (banner_analyzer._banner_analyzer, banner_analyzer._signatures_mtime)
+
+        def write(data, mtime):
+            with open(path, 'w') as f:
+                json.dump(data, f)
+            os.utime(path, (mtime, mtime))
+
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, 'signatures.json')
+                with self.settings(SERVICE_SIGNATURES_PATH=path, SERVICE_SIGNATURES_RELOAD_INTERVAL=0):
+                    write(dict(signatures, version=5), 1000)
+                    banner_analyzer.reload_banner_analyzer(force=True)
+                    analyzer = banner_analyzer.get_banner_analyzer()
+
+                    version_patterns = dict(signatures.get('version_patterns', {}), http=['(?i)bad('])
+                    write(dict(signatures, version=6, version_patterns=version_patterns), 2000)
+                    with self.assertRaises(ValueError):
+                        banner_analyzer.load_signatures(path)
+                    for _ in range(2):
+                        with self.assertLogs('internet.lib.banner_analyzer', level='ERROR'):
+                            self.assertIs(banner_analyzer.get_banner_analyzer(), analyzer)
+
+                    write(dict(signatures, version=6, port_adjustments={'http': {'eighty': 0.1}}), 3000)
+                    with self.assertLogs('internet.lib.banner_analyzer', level='ERROR'):
+                        self.assertIs(banner_analyzer.get_banner_analyzer(), analyzer)
+
+                    write(dict(signatures, version=6, services=['http']), 3500)
+                    with self.assertLogs('internet.lib.banner_analyzer', level='ERROR'):
+                        self.assertIs(banner_analyzer.get_banner_analyzer(), analyzer)
+
+                    write(dict(signatures, version=6), 4000)
+                    self.assertEqual(banner_analyzer.get_banner_analyzer().signature_version, 6)
+        finally:
+            banner_analyzer._banner_analyzer, banner_analyzer._signatures_mtime = saved
+
+    def test_analyze_banners_matches_single_calls(self):
+        """The batch API returns per-item results in input order"""
+        analyzer = BannerAnalyzer()
+        items = [(banner, 80) for banner in self.BANNERS] * 3
+
+        batch = analyzer.analyze_banners(items)
+
+        self.assertEqual(len(batch), len(items))
+        for (banner, port), detections in zip(items, batch):
+            single = analyzer.analyze_banner(banner, port)
+            self.assertEqual(
+                [(d.service_type, d.confidence, d.version) for d in detections],
+                [(d.service_type, d.confidence, d.version) for d in single],
+            )
+
+
+def _write_self_signed_cert(directory, common_name, san):
+    """Create a throwaway certificate/key pair and return their paths"""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName(d) for d in san]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+
+    cert_path = os.path.join(directory, 'cert.pem')
+    key_path = os.path.join(directory, 'key.pem')
+    with open(cert_path, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, 'wb') as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        ))
+    return cert_path, key_path
+
+
+class SSLCertGrabberTestCase(SimpleTestCase):
+    """Test case for the asyncio TLS certificate grabber"""
+
+    def test_grab_certificates_concurrently(self):
+        """Concurrent handshakes all return the expected certificate data"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cert_path, key_path = _write_self_signed_cert(tmpdir, 'example.test', ['www.example.test'])
+            server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            server_context.load_cert_chain(cert_path, key_path)
+
+            async def handler(reader, writer):
+                await reader.read(100)
+                writer.close()
+
+            async def run():
+                server = await asyncio.start_server(handler, '127.0.0.1', 0, ssl=server_context)
+                port = server.sockets[0].getsockname()[1]
+                async with server:
+                    grabber = SSLCertGrabber(connect_timeout=1, handshake_timeout=2, max_concurrency=5,
+                                             cert_cache=cache)
+                    return await grabber.grab_certificates_batch([('127.0.0.1', port)] * 20), port
+
+            cache = CertificateCache(max_entries=10, use_redis=False)
+            results, port = asyncio.run(run())
+
+        # Only the first handshakes to finish parse the certificate
+        self.assertEqual(len(cache), 1)
+        self.assertGreater(cache.hits, 0)
+        self.assertEqual(cache.hits + cache.misses, 20)
+
+        cert_data = results[('127.0.0.1', port)]
+        self.assertEqual(cert_data['subject']['commonName'], 'example.test')
+        self.assertEqual(sorted(cert_data['domains']), ['example.test', 'www.example.test'])
+        self.assertEqual(len(cert_data['fingerprint_sha256']), 64)
+        self.assertEqual(cert_data['port'], port)
+
+    def test_plaintext_and_closed_ports(self):
+        """Non-TLS services and closed ports return None"""
+        async def handler(reader, writer):
+            writer.write(b'220 not tls\r\n')
+            await writer.drain()
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handler, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            grabber = SSLCertGrabber(connect_timeout=1, handshake_timeout=1,
+                                     cert_cache=CertificateCache(use_redis=False))
+            async with server:
+                plaintext = await grabber.grab_certificate('127.0.0.1', port)
+            await server.wait_closed()
+            return plaintext, await grabber.grab_certificate('127.0.0.1', port)
+
+        self.assertEqual(asyncio.run(run()), (None, None))
+
+
+class CertificateCacheTestCase(SimpleTestCase):
+    """Test case for the fingerprint-keyed certificate cache"""
+
+    def test_lru_eviction_and_observation_fields(self):
+        """Least recently used entries are evicted and observation fields are not cached"""
+        cache = CertificateCache(max_entries=2, use_redis=False)
+
+        async def run():
+            await cache.put('A', {'host_ip': '192.0.2.1', 'port': 443, 'domains': ['a.test']})
+            await cache.put('B', {'domains': ['b.test']})
+            await cache.get('A')
+            await cache.put('C', {'domains': ['c.test']})
+            return await cache.get('A'), await cache.get('B')
+
+        entry_a, entry_b = asyncio.run(run())
+
+        self.assertEqual(entry_a, {'domains': ['a.test']})
+        self.assertIsNone(entry_b)
+        self.assertEqual(len(cache), 2)
+
+
+class _StubDNSServer(asyncio.DatagramProtocol):
+    """Answers PTR queries from a fixed table and NXDOMAIN otherwise"""
+
+    def __init__(self, records):
+        self.records = records
+        self.queries = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        import dns.message
+        import dns.rcode
+        import dns.rrset
+
+        request = dns.message.from_wire(data)
+        question = request.question[0]
+        self.queries.append(question.name.to_text())
+        response = dns.message.make_response(request)
+        target = self.records.get(question.name.to_text())
+        if target:
+            response.answer.append(dns.rrset.from_text(question.name, 60, 'IN', 'PTR', target))
+        else:
+            response.set_rcode(dns.rcode.NXDOMAIN)
+            response.authority.append(dns.rrset.from_text(
+                'in-addr.arpa.', 3600, 'IN', 'SOA', 'ns. hostmaster. 1 3600 600 86400 120'
+            ))
+        self.transport.sendto(response.to_wire(), addr)
+
+
+class AsyncDNSResolverTestCase(SimpleTestCase):
+    """Test case for the asyncio DNS client against a local stub server"""
+
+    def test_ptr_batch_with_positive_and_negative_cache(self):
+        """One query per IP; repeated lookups are answered from cache"""
+        stub = _StubDNSServer({'1.2.0.192.in-addr.arpa.': 'host.example.test.'})
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            transport, _ = await loop.create_datagram_endpoint(lambda: stub, local_addr=('127.0.0.1', 0))
+            port = transport.get_extra_info('sockname')[1]
+            resolver = AsyncDNSResolver(resolvers=[f'127.0.0.1:{port}'], timeout=1, retries=0, sockets=2)
+            try:
+                first = await resolver.resolve_ptr_batch(['192.0.2.1', '192.0.2.2', '192.0.2.1'])
+                second = await resolver.resolve_ptr_batch(['192.0.2.1', '192.0.2.2'])
+                negative_ttl = resolver.cache._entries[('2.2.0.192.in-addr.arpa', 'PTR')][0] - time.monotonic()
+                return first, second, negative_ttl
+            finally:
+                resolver.close()
+                transport.close()
+
+        first, second, negative_ttl = asyncio.run(run())
+
+        self.assertEqual(first, {'192.0.2.1': ['host.example.test']})
+        self.assertEqual(second, first)
+        self.assertEqual(sorted(stub.queries), ['1.2.0.192.in-addr.arpa.', '2.2.0.192.in-addr.arpa.'])
+        # NXDOMAIN is cached for the SOA minimum, not the SOA record TTL
+        self.assertLessEqual(negative_ttl, 120)
+
+    def test_unreachable_resolver_returns_empty(self):
+        """Timeouts yield no answers and are not cached"""
+        async def run():
+            resolver = AsyncDNSResolver(resolvers=['127.0.0.1:9'], timeout=0.2, retries=1)
+            try:
+                return await resolver.resolve_ptr('192.0.2.1'), len(resolver.cache)
+            finally:
+                resolver.close()
+
+        self.assertEqual(asyncio.run(run()), ([], 0))
+
+
+class PortAwareDomainEnumerationTestCase(TestCase):
+    """Test case for domain enumeration driven by stored scan data"""
+
+    def test_select_ports_uses_open_ports_only(self):
+        """Only open web ports are probed and stored certificates skip the handshake"""
+        https_ports, http_ports = DomainEnumerator._select_ports([22, 80, 443, 8443], cert_ports=[443])
+
+        self.assertEqual(https_ports, [8443])
+        self.assertEqual(http_ports, [80])
+        self.assertEqual(DomainEnumerator._select_ports([22, 3306], None), ([], []))
+
+    def test_ssl_domains_use_certificate_grabber(self):
+        """Certificate names come from the shared async grabber and land in its cache"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cert_path, key_path = _write_self_signed_cert(tmpdir, 'example.test', ['www.example.test'])
+            server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            server_context.load_cert_chain(cert_path, key_path)
+
+            async def handler(reader, writer):
+                await reader.read(100)
+                writer.close()
+
+            async def run():
+                server = await asyncio.start_server(handler, '127.0.0.1', 0, ssl=server_context)
+                port = server.sockets[0].getsockname()[1]
+                async with server:
+                    return await enumerator._get_ssl_domains('127.0.0.1', [port])
+
+            cache = CertificateCache(max_entries=10, use_redis=False)
+            enumerator = DomainEnumerator()
+            enumerator.ssl_cert_grabber = SSLCertGrabber(connect_timeout=1, handshake_timeout=2,
+                                                         cert_cache=cache)
+            domains = asyncio.run(run())
+
+        self.assertEqual(sorted(domains), ['example.test', 'www.example.test'])
+        self.assertEqual(len(cache), 1)
+
+    def test_load_host_scan_data_reads_stored_certificates(self):
+        """CN/SAN entries come from stored PEM data without a new handshake"""
+        scan = Scan.objects.create(scan_command='test', scan_type='masscan')
+        host = Host.objects.create(ip='192.0.2.10')
+        https = Port.objects.create(host=host, scan=scan, port_number=443, proto='tcp', status='open')
+        Port.objects.create(host=host, scan=scan, port_number=22, proto='tcp', status='open')
+        Port.objects.create(host=host, scan=scan, port_number=53, proto='udp', status='open')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cert_path, _ = _write_self_signed_cert(tmpdir, 'example.test', ['api.example.test'])
+            with open(cert_path) as f:
+                pem = f.read()
+        SSLCertificate.objects.create(
+            fingerprint='AB', pem_data=pem, subject_cn='example.test',
+            valid_from='', valid_until='', host=host, port=https,
+        )
+
+        AncillaryJob.objects.create(
+            job_type='banner_grab', host_ip=host.ip, host=host, port_number=80,
+            status='completed', result_data={'http': {'domains': ['www.example.test']}},
+        )
+
+        scan_data = QueueService()._load_host_scan_data(host.id)
+
+        self.assertEqual(sorted(scan_data['open_ports']), [22, 443])
+        self.assertEqual(scan_data['cert_ports'], [443])
+        self.assertEqual(scan_data['fingerprinted_ports'], [80])
+        self.assertEqual(
+            sorted(scan_data['known_domains']),
+            ['api.example.test', 'example.test', 'www.example.test'],
+        )
+
+
+class HTTPFingerprinterTestCase(SimpleTestCase):
+    """Test case for the asyncio HTTP fingerprinting engine"""
+
+    def test_fingerprint_reuses_connection_for_favicon(self):
+        """Page and favicon are fetched over one keep-alive connection"""
+        favicon = b'\x00\x00\x01\x00' * 64
+        connections = []
+
+        async def handler(reader, writer):
+            connections.append(1)
+            while True:
+                try:
+                    request = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    break
+                if request.startswith(b'GET /favicon.ico '):
+                    writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n' % len(favicon) + favicon)
+                else:
+                    body = b'<html><head><title> Example &amp; Co </title></head></html>'
+                    writer.write(
+                        b'HTTP/1.1 301 Moved Permanently\r\n'
+                        b'Server: nginx/1.18.0\r\n'
+                        b'Location: https://www.example.test/\r\n'
+                        b'Set-Cookie: sid=1; Domain=.example.test; Path=/\r\n'
+                        b'Transfer-Encoding: chunked\r\n\r\n'
+                        b'%x\r\n%s\r\n0\r\n\r\n' % (len(body), body)
+                    )
+                await writer.drain()
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handler, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                return await HTTPFingerprinter(timeout=1).fingerprint('127.0.0.1', port, tls=False)
+
+        fingerprint = asyncio.run(run())
+
+        self.assertEqual(len(connections), 1)
+        self.assertEqual(fingerprint.status_code, 301)
+        self.assertEqual(fingerprint.server, 'nginx/1.18.0')
+        self.assertEqual(fingerprint.title, 'Example & Co')
+        self.assertEqual(fingerprint.domains, ['example.test', 'www.example.test'])
+        self.assertEqual(fingerprint.favicon_hash, favicon_hash(favicon))
+        self.assertTrue(fingerprint.banner.startswith('HTTP/1.1 301 Moved Permanently Server: nginx/1.18.0'))
+
+    def test_murmur3_matches_reference_values(self):
+        """The pure-Python fallback matches mmh3.hash()"""
+        from internet.lib import http_fingerprint
+
+        available = http_fingerprint.MMH3_AVAILABLE
+        http_fingerprint.MMH3_AVAILABLE = False
+        try:
+            self.assertEqual(murmur3_32(b''), 0)
+            self.assertEqual(murmur3_32(b'hello'), 613153351)
+            self.assertEqual(murmur3_32(b'abcdefghijk'), 1597711839)
+        finally:
+            http_fingerprint.MMH3_AVAILABLE = available
+
+
+class TLSEndpointProberTestCase(SimpleTestCase):
+    """Test case for the single-handshake TLS endpoint probe"""
+
+    def test_certificate_session_and_http_from_one_connection(self):
+        """Certificate, TLS parameters and HTTP fingerprint all come from one handshake"""
+        connections = []
+
+        async def handler(reader, writer):
+            connections.append(1)
+            while True:
+                try:
+                    request = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request.startswith(b'GET /favicon.ico '):
+                    writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n')
+                else:
+                    body = b'<title>Portal</title>'
+                    writer.write(
+                        b'HTTP/1.1 200 OK\r\nServer: test-httpd\r\n'
+                        b'Content-Length: %d\r\n\r\n%s' % (len(body), body)
+                    )
+                await writer.drain()
+            writer.close()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cert_path, key_path = _write_self_signed_cert(tmpdir, 'portal.test', ['www.portal.test'])
+            server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            server_context.load_cert_chain(cert_path, key_path)
+            server_context.set_alpn_protocols(['http/1.1'])
+
+            async def run():
+                server = await asyncio.start_server(handler, '127.0.0.1', 0, ssl=server_context)
+                port = server.sockets[0].getsockname()[1]
+                prober = TLSEndpointProber(
+                    connect_timeout=1, handshake_timeout=2,
+                    cert_grabber=SSLCertGrabber(cert_cache=CertificateCache(use_redis=False)),
+                    http_fingerprinter=HTTPFingerprinter(timeout=1),
+                )
+                async with server:
+                    return await prober.probe('127.0.0.1', port)
+
+            result = asyncio.run(run())
+
+        self.assertEqual(len(connections), 1)
+        self.assertIn(result.tls_version, ('TLSv1.2', 'TLSv1.3'))
+        self.assertTrue(result.cipher)
+        self.assertEqual(result.alpn, 'http/1.1')
+        self.assertEqual(result.certificate['subject']['commonName'], 'portal.test')
+        self.assertEqual(result.chain[0]['fingerprint_sha256'], result.certificate['fingerprint_sha256'])
+        self.assertEqual(result.http.server, 'test-httpd')
+        self.assertEqual(result.http.title, 'Portal')
+        self.assertEqual(result.domains, ['portal.test', 'www.portal.test'])
+        self.assertTrue(result.banner.startswith('HTTP/1.1 200 OK'))
+
+    def test_non_http_tls_service_keeps_certificate(self):
+        """A TLS service that never answers HTTP still yields its certificate"""
+        async def handler(reader, writer):
+            await reader.read(100)
+            writer.close()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cert_path, key_path = _write_self_signed_cert(tmpdir, 'mail.test', [])
+            server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            server_context.load_cert_chain(cert_path, key_path)
+
+            async def run():
+                server = await asyncio.start_server(handler, '127.0.0.1', 0, ssl=server_context)
+                port = server.sockets[0].getsockname()[1]
+                prober = TLSEndpointProber(
+                    connect_timeout=1, handshake_timeout=2,
+                    cert_grabber=SSLCertGrabber(cert_cache=CertificateCache(use_redis=False)),
+                    http_fingerprinter=HTTPFingerprinter(timeout=1),
+                )
+                async with server:
+                    return await prober.probe('127.0.0.1', port)
+
+            result = asyncio.run(run())
+
+        self.assertIsNone(result.http)
+        self.assertEqual(result.certificate['subject']['commonName'], 'mail.test')
+        self.assertIn('CN=mail.test', result.banner)
+
+
+class _StubUDPService(asyncio.DatagramProtocol):
+    """Datagram server that answers each request through a callback"""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.received = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.received.append(data)
+        for reply in self.respond(data, len(self.received)):
+            self.transport.sendto(reply, addr)
+
+
+class UDPProberTestCase(SimpleTestCase):
+    """Test case for the asyncio UDP probe engine"""
+
+    def _probe(self, respond, probe, timeout=0.2, retries=2):
+        async def run():
+            loop = asyncio.get_running_loop()
+            transport, stub = await loop.create_datagram_endpoint(
+                lambda: _StubUDPService(respond), local_addr=('127.0.0.1', 0),
+            )
+            port = transport.get_extra_info('sockname')[1]
+            prober = UDPProber(timeout=timeout, retries=retries, sockets=2)
+            try:
+                return await prober.probe('127.0.0.1', port, probe), stub
+            finally:
+                prober.close()
+                transport.close()
+
+        return asyncio.run(run())
+
+    def test_retransmits_until_reply(self):
+        """A dropped first datagram is recovered by retransmission"""
+        reply = bytearray(48)
+        reply[0] = 0x24  # v4, server mode
+        reply[1] = 1
+        reply[12:16] = b'GPS\x00'
+
+        result, stub = self._probe(lambda data, n: [bytes(reply)] if n > 1 else [], NTP_REQUEST)
+
+        self.assertEqual(len(stub.received), 2)
+        self.assertEqual(result.protocol, 'udp')
+        self.assertEqual(result.probe, 'NTPRequest')
+        self.assertEqual(result.banner, 'NTP v4 mode 4 stratum 1 refid GPS')
+
+    def test_ignores_reply_with_wrong_transaction_id(self):
+        """Stray datagrams that do not echo the query ID are discarded"""
+        answer = (
+            b'\x00\x06\x84\x00\x00\x01\x00\x01\x00\x00\x00\x00'
+            b'\x07version\x04bind\x00\x00\x10\x00\x03'
+            b'\xc0\x0c\x00\x10\x00\x03\x00\x00\x00\x00\x00\x07\x069.18.1'
+        )
+        stray = b'\xff\xff' + answer[2:]
+
+        result, _ = self._probe(lambda data, n: [stray, answer], DNS_VERSION_BIND_UDP)
+
+        self.assertEqual(result.raw, answer)
+        self.assertEqual(result.banner, 'DNS version.bind: 9.18.1')
+
+    def test_silent_port_returns_none(self):
+        """No reply within the retries yields no banner"""
+        result, stub = self._probe(lambda data, n: [], NTP_REQUEST, timeout=0.05, retries=1)
+
+        self.assertIsNone(result)
+        self.assertEqual(len(stub.received), 2)
+
+
+class DNSRelayCheckerTestCase(SimpleTestCase):
+    """Test case for concurrent open DNS relay detection"""
+
+    @staticmethod
+    def _dns_responder(recursive):
+        import dns.flags
+        import dns.message
+        import dns.rcode
+        import dns.rrset
+
+        def respond(data, count):
+            request = dns.message.from_wire(data)
+            response = dns.message.make_response(request)
+            if recursive:
+                response.flags |= dns.flags.RA
+                response.answer.append(dns.rrset.from_text(request.question[0].name, 60, 'IN', 'A', '192.0.2.10'))
+            else:
+                response.set_rcode(dns.rcode.REFUSED)
+            return [response.to_wire()]
+
+        return respond
+
+    def test_check_batch_classifies_servers(self):
+        """Only servers that recurse and answer are open relays; silent ones are omitted"""
+        async def run():
+            loop = asyncio.get_running_loop()
+            targets = []
+            transports = []
+            for respond in (self._dns_responder(True), self._dns_responder(False), lambda data, n: []):
+                transport, _ = await loop.create_datagram_endpoint(
+                    lambda: _StubUDPService(respond), local_addr=('127.0.0.1', 0),
+                )
+                transports.append(transport)
+                targets.append(('127.0.0.1', transport.get_extra_info('sockname')[1]))
+            checker = DNSRelayChecker(test_domain='example.test', timeout=0.2, retries=0)
+            try:
+                return targets, await checker.check_batch(targets)
+            finally:
+                checker.close()
+                for transport in transports:
+                    transport.close()
+
+        (relay, refusing, silent), results = asyncio.run(run())
+
+        self.assertTrue(results[relay]['open_relay'])
+        self.assertEqual(results[relay]['answers'], ['192.0.2.10'])
+        self.assertFalse(results[refusing]['open_relay'])
+        self.assertEqual(results[refusing]['rcode'], 'REFUSED')
+        self.assertNotIn(silent, results)
+
+
+_STUB_TARGET_REPLY = b'HTTP/1.0 200 OK\r\n\r\n'
+
+
+async def _stub_socks5_proxy(reader, writer):
+    """SOCKS5 without auth that answers for the target itself once tunnelled"""
+    version, count = await reader.readexactly(2)
+    if version != 5:
+        writer.close()
+        return
+    await reader.readexactly(count)
+    writer.write(b'\x05\x00')
+    _, _, _, address_type = await reader.readexactly(4)
+    if address_type == 3:
+        length = (await reader.readexactly(1))[0]
+        await reader.readexactly(length + 2)
+    else:
+        await reader.readexactly(6)
+    writer.write(b'\x05\x00\x00\x01\x7f\x00\x00\x01\x00\x50')
+    try:
+        await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        # Client hung up without using the tunnel
+        writer.close()
+        return
+    writer.write(_STUB_TARGET_REPLY)
+    await writer.drain()
+    writer.close()
+
+
+class ProxyCheckerTestCase(SimpleTestCase):
+    """Test case for asyncio proxy tunnel checks against local stub proxies"""
+
+    async def _http_proxy(self, reader, writer):
+        """HTTP proxy that only accepts CONNECT to the expected authority"""
+        request = await reader.readuntil(b'\r\n\r\n')
+        if request.startswith(b'CONNECT example.test:80 '):
+            writer.write(b'HTTP/1.1 200 Connection established\r\n\r\n')
+            await reader.readuntil(b'\r\n\r\n')
+            writer.write(_STUB_TARGET_REPLY)
+        else:
+            writer.write(b'HTTP/1.1 405 Method Not Allowed\r\n\r\n')
+        await writer.drain()
+        writer.close()
+
+    def test_tunnels_and_detection(self):
+        """Each protocol tunnels through its own proxy; detection finds the right one"""
+        async def run():
+            socks = await asyncio.start_server(_stub_socks5_proxy, '127.0.0.1', 0)
+            http = await asyncio.start_server(self._http_proxy, '127.0.0.1', 0)
+            socks_port = socks.sockets[0].getsockname()[1]
+            http_port = http.sockets[0].getsockname()[1]
+            checker = ProxyChecker(target='example.test:80', timeout=1)
+            async with socks, http:
+                checks = await checker.check_batch([
+                    ('127.0.0.1', socks_port, 'S5', None, None),
+                    ('127.0.0.1', http_port, 'HP', None, None),
+                    ('127.0.0.1', socks_port, 'HP', None, None),
+                ])
+                detected = await checker.detect_batch([('127.0.0.1', http_port), ('127.0.0.1', socks_port)])
+            return checks, detected[('127.0.0.1', http_port)], detected[('127.0.0.1', socks_port)]
+
+        (socks5, http_connect, wrong_type), detected_http, detected_socks = asyncio.run(run())
+
+        self.assertTrue(socks5.alive)
+        self.assertIsNotNone(socks5.latency_ms)
+        self.assertTrue(http_connect.alive)
+        self.assertFalse(wrong_type.alive)
+        self.assertEqual(detected_http.proxy_type, 'HP')
+        self.assertEqual(detected_socks.proxy_type, 'S5')
+
+    def test_apply_check_result_marks_dead_then_revives(self):
+        """Consecutive failures mark a proxy dead; one success clears it"""
+        proxy = Proxy(host_name='192.0.2.1', port_number=1080, proxy_type='S5')
+        now = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        failure = ProxyCheckResult('192.0.2.1', 1080, 'S5', False, error='timeout')
+
+        for _ in range(2):
+            apply_check_result(proxy, failure, now, dead_after=2, disable_after=3)
+        self.assertTrue(proxy.dead)
+        self.assertTrue(proxy.enabled)
+
+        apply_check_result(proxy, ProxyCheckResult('192.0.2.1', 1080, 'S5', True, latency_ms=42.0), now)
+        self.assertFalse(proxy.dead)
+        self.assertEqual(proxy.fail_count, 0)
+        self.assertEqual(proxy.latency_ms, 42.0)
+        self.assertEqual(proxy.last_checked, now)
+
+
+class ProxyPoolTestCase(SimpleTestCase):
+    """Test case for the circuit breaker and latency-scored proxy pool"""
+
+    def test_circuit_breaker_transitions(self):
+        """Open after the threshold, one trial call after the cool-down, close on success"""
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=10, clock=lambda: now[0])
+
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        now[0] = 10.0
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def _pool(self, *proxies, **kwargs):
+        pool = ProxyPool(**kwargs)
+        pool.set_proxies(list(proxies))
+        return pool
+
+    @staticmethod
+    async def _fetch(pool):
+        async with pool.connect('192.0.2.1', 80, timeout=1) as sock:
+            reader, writer = await asyncio.open_connection(sock=sock)
+            writer.write(b'HEAD / HTTP/1.0\r\n\r\n')
+            reply = await reader.read(64)
+            writer.close()
+            return reply
+
+    def test_failing_proxy_is_ejected(self):
+        """The fastest proxy is tried first; once its circuit opens traffic moves on"""
+        async def run():
+            socks = await asyncio.start_server(_stub_socks5_proxy, '127.0.0.1', 0)
+            closed = await asyncio.start_server(lambda r, w: w.close(), '127.0.0.1', 0)
+            closed_port = closed.sockets[0].getsockname()[1]
+            closed.close()
+            await closed.wait_closed()
+            pool = self._pool(
+                PooledProxy(1, '127.0.0.1', closed_port, 'S5', latency_ms=1),
+                PooledProxy(2, '127.0.0.1', socks.sockets[0].getsockname()[1], 'S5', latency_ms=100),
+                failure_threshold=1,
+            )
+            async with socks:
+                with self.assertRaises(OSError):
+                    await self._fetch(pool)
+                reply = await self._fetch(pool)
+            return pool, reply
+
+        pool, reply = asyncio.run(run())
+
+        self.assertEqual(reply, _STUB_TARGET_REPLY)
+        self.assertEqual(pool._proxies[1].breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(pool._proxies[2].inflight, 0)
+
+    def test_per_proxy_cap(self):
+        """A proxy at its concurrency cap is not handed out again"""
+        async def run():
+            socks = await asyncio.start_server(_stub_socks5_proxy, '127.0.0.1', 0)
+            pool = self._pool(
+                PooledProxy(1, '127.0.0.1', socks.sockets[0].getsockname()[1], 'S5'),
+                max_per_proxy=1, acquire_timeout=0.2,
+            )
+            async with socks:
+                async with pool.connect('192.0.2.1', 80, timeout=1) as sock:
+                    with self.assertRaises(ProxyPoolExhausted):
+                        async with pool.connect('192.0.2.1', 80, timeout=1):
+                            pass
+                    sock.close()
+
+        asyncio.run(run())
+
+
+def _mmdb_field(value):
+    """Encode a value in the MaxMind DB data section format; ('uint16', n) style tuples pick an integer type"""
+    def control(type_number, size):
+        # Sizes from 29 take one extra byte (enough for the short values used here)
+        size_bits, size_bytes = (size, b'') if size < 29 else (29, bytes([size - 29]))
+        if type_number <= 7:
+            return bytes([(type_number << 5) | size_bits]) + size_bytes
+        return bytes([size_bits, type_number - 7]) + size_bytes
+
+    if isinstance(value, tuple):
+        type_name, number = value
+        type_number, width = {'uint16': (5, 2), 'uint32': (6, 4), 'uint64': (9, 8)}[type_name]
+        payload = number.to_bytes(width, 'big').lstrip(b'\0')
+        return control(type_number, len(payload)) + payload
+    if isinstance(value, int):
+        return _mmdb_field(('uint32', value))
+    if isinstance(value, float):
+        return control(3, 8) + struct.pack('>d', value)
+    if isinstance(value, str):
+        payload = value.encode()
+        return control(2, len(payload)) + payload
+    if isinstance(value, list):
+        return control(11, len(value)) + b''.join(_mmdb_field(item) for item in value)
+    return control(7, len(value)) + b''.join(_mmdb_field(k) + _mmdb_field(v) for k, v in value.items())
+
+
+def _write_mmdb(path, records, database_type='GeoLite2-City'):
+    """Write a minimal IPv4 .mmdb file mapping networks to records"""
+    nodes = [[None, None]]
+    data = b''
+    for network, record in records.items():
+        network = ipaddress.ip_network(network)
+        address = int(network.network_address)
+        node = 0
+        for depth in range(network.prefixlen):
+            bit = (address >> (31 - depth)) & 1
+            if depth == network.prefixlen - 1:
+                nodes[node][bit] = ('data', len(data))
+            else:
+                if nodes[node][bit] is None:
+                    nodes.append([None, None])
+                    nodes[node][bit] = len(nodes) - 1
+                node = nodes[node][bit]
+        data += _mmdb_field(record)
+
+    node_count = len(nodes)
+
+    def record_value(entry):
+        if entry is None:
+            return node_count
+        if isinstance(entry, tuple):
+            return node_count + 16 + entry[1]
+        return entry
+
+    tree = b''.join(record_value(left).to_bytes(3, 'big') + record_value(right).to_bytes(3, 'big')
+                    for left, right in nodes)
+    metadata = {
+        'node_count': ('uint32', node_count),
+        'record_size': ('uint16', 24),
+        'ip_version': ('uint16', 4),
+        'database_type': database_type,
+        'languages': ['en'],
+        'binary_format_major_version': ('uint16', 2),
+        'binary_format_minor_version': ('uint16', 0),
+        'build_epoch': ('uint64', int(time.time())),
+        'description': {'en': 'test database'},
+    }
+    with open(path, 'wb') as f:
+        f.write(tree + b'\0' * 16 + data + b'\xab\xcd\xefMaxMind.com' + _mmdb_field(metadata))
+
+
+class MMDBGeolocationProviderTestCase(SimpleTestCase):
+    """Test case for offline geolocation from memory-mapped MMDB files"""
+
+    CITY = {
+        'country': {'iso_code': 'NL', 'names': {'en': 'Netherlands'}},
+        'subdivisions': [{'names': {'en': 'North Holland'}}],
+        'city': {'names': {'en': 'Amsterdam'}},
+        'location': {'latitude': 52.37, 'longitude': 4.89, 'time_zone': 'Europe/Amsterdam'},
+    }
+
+    def test_lookup_and_atomic_swap(self):
+        """Hits map to the provider format with their network; a renamed-in file replaces the data"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            city_path = os.path.join(tmpdir, 'city.mmdb')
+            asn_path = os.path.join(tmpdir, 'asn.mmdb')
+            _write_mmdb(city_path, {'203.0.113.0/24': self.CITY})
+            _write_mmdb(asn_path, {'203.0.112.0/23': {
+                'autonomous_system_number': 64500, 'autonomous_system_organization': 'Example Net',
+            }}, database_type='GeoLite2-ASN')
+            provider = MMDBGeolocationProvider(city_path, asn_path, check_interval=0)
+
+            data = provider.lookup('203.0.113.9')
+            self.assertEqual(data['city'], 'Amsterdam')
+            self.assertEqual(data['country_code'], 'NL')
+            self.assertEqual(data['region'], 'North Holland')
+            self.assertEqual(data['network'], '203.0.113.0/24')
+            self.assertEqual(data['asn'], 'AS64500 Example Net')
+            self.assertIsNone(provider.lookup('198.51.100.1'))
+
+            # Updates are written aside and renamed over the live file
+            staged = os.path.join(tmpdir, 'city.mmdb.new')
+            _write_mmdb(staged, {'198.51.100.0/22': dict(self.CITY, city={'names': {'en': 'Haarlem'}})})
+            os.replace(staged, city_path)
+            self.assertEqual(provider.lookup('198.51.100.1')['network'], '198.51.100.0/22')
+            self.assertIsNone(provider.lookup('203.0.113.9'))
+
+            # Local hits never reach the remote providers
+            service = GeolocationService(max_workers=1, mmdb_provider=provider)
+            service.providers = []
+            try:
+                self.assertEqual(service.get_location('198.51.100.1')['city'], 'Haarlem')
+                self.assertEqual(asyncio.run(service.get_location_async('198.51.100.1'))['provider'], 'mmdb')
+            finally:
+                service.executor.shutdown()
+
+
+class PrefixRangeCacheTestCase(SimpleTestCase):
+    """Test case for the network-range geolocation cache"""
+
+    def test_ranges_overlap_and_eviction(self):
+        """Lookups hit anywhere in a cached range; newer ranges replace the ones they overlap"""
+        cache = PrefixRangeCache(ttl=60, max_entries=3)
+
+        self.assertEqual(cache.add('203.0.113.5', {'city': 'A'}), '203.0.113.0/24')
+        hit = cache.get('203.0.113.200')
+        self.assertEqual((hit['city'], hit['ip'], hit['network']), ('A', '203.0.113.200', '203.0.113.0/24'))
+        self.assertIsNone(cache.get('203.0.114.1'))
+
+        # A provider-reported network is used when it contains the address
+        self.assertEqual(cache.add('198.51.100.7', {'city': 'B', 'network': '198.51.96.0/20'}), '198.51.96.0/20')
+        self.assertEqual(cache.get('198.51.111.1')['city'], 'B')
+        cache.add('198.51.100.9', {'city': 'C'})
+        self.assertEqual(cache.get('198.51.100.1')['city'], 'C')
+        self.assertIsNone(cache.get('198.51.97.1'))
+
+        cache.add('2001:db8::1', {'city': 'D'})
+        self.assertEqual(cache.get('2001:db8:0:ffff::1')['network'], '2001:db8::/48')
+        cache.add('192.0.2.1', {'city': 'E'})
+        self.assertLessEqual(len(cache), 3)
+        self.assertEqual(cache.get('192.0.2.99')['city'], 'E')
+
+    def test_batch_resolves_one_address_per_network(self):
+        """Addresses sharing a /24 cost a single provider call"""
+        service = _StubGeolocationService(
+            max_workers=2,
+            mmdb_provider=MMDBGeolocationProvider(city_path='', asn_path=''),
+            range_cache=PrefixRangeCache(ttl=60),
+            providers=[_StubGeoProvider('stub')],
+        )
+        ips = ['100.64.7.1', '100.64.7.2', '100.64.7.3', '100.64.8.1']
+        try:
+            results = asyncio.run(service.get_locations_batch_async(ips, batch_size=4))
+        finally:
+            service.executor.shutdown()
+
+        self.assertEqual(sorted(ip for _, batch in service.calls for ip in batch), ['100.64.7.1', '100.64.8.1'])
+        self.assertEqual({ip: data['city'] for ip, data in results.items()}, dict.fromkeys(ips, 'Springfield'))
+        self.assertEqual(results['100.64.7.3']['ip'], '100.64.7.3')
+
+
+class _StubGeoProvider(GeoProvider):
+    """Provider answering from memory, optionally batch-capable and with known misses"""
+
+    def __init__(self, name, batch_size=1, misses=()):
+        self.name = name
+        self.batch_size = batch_size
+        self.misses = set(misses)
+        super().__init__(requests_per_minute=6000)
+
+    def build_request(self, ips):
+        return ProviderRequest('GET', f'http://{self.name}.invalid/', self.limiter)
+
+    def parse(self, ips, payload):
+        return {ip: None if ip in self.misses else {'ip': ip, 'city': 'Springfield', 'provider': self.name}
+                for ip in ips}
+
+
+class _StubGeolocationService(GeolocationService):
+    """Geolocation service that records provider calls instead of making HTTP requests"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = []
+        self.failing = set()
+        self.delays = {}
+
+    async def _fetch(self, provider, request, ip_addresses):
+        self.calls.append((provider.name, list(ip_addresses)))
+        await asyncio.sleep(self.delays.get(provider.name, 0))
+        if provider.name in self.failing:
+            raise ProviderHTTPError(f'{provider.name} returned HTTP 503')
+        return provider.parse(ip_addresses, None)
+
+
+class GeolocationRateLimitTestCase(SimpleTestCase):
+    """Test case for provider token buckets and batch request coalescing"""
+
+    def test_token_bucket_follows_reported_window(self):
+        """Reservations queue behind each other and re-sync to the upstream's window"""
+        now = [0.0]
+        bucket = TokenBucket(rate=1, capacity=2, clock=lambda: now[0])
+
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 1.0)
+
+        # Upstream says the window is spent for another 30 seconds
+        bucket.update(remaining=0, reset_after=30)
+        self.assertEqual(bucket.reserve(), 30.0)
+        self.assertIsNone(bucket.reserve(max_wait=10))
+        self.assertEqual(bucket.tokens, -2)
+
+        # The new window's quota pays for the reservations already waiting on it
+        now[0] = 30.0
+        self.assertEqual(bucket.tokens, 0)
+        bucket.penalize(5)
+        now[0] = 35.0
+        self.assertEqual(bucket.tokens, 2)
+
+    def test_ipapi_batch_requests_and_headers(self):
+        """ip-api.com batches use their own quota, synced from X-Rl/X-Ttl"""
+        provider = IPAPIProvider()
+
+        single = provider.build_request(['192.0.2.1'])
+        self.assertEqual((single.method, single.url), ('GET', 'http://ip-api.com/json/192.0.2.1'))
+        self.assertIs(single.limiter, provider.limiter)
+        batch = provider.build_request(['192.0.2.1', '198.51.100.1'])
+        self.assertEqual((batch.method, batch.url), ('POST', 'http://ip-api.com/batch'))
+        self.assertEqual(batch.json, ['192.0.2.1', '198.51.100.1'])
+        self.assertIs(batch.limiter, provider.batch_limiter)
+
+        results = provider.parse(['192.0.2.1', '198.51.100.1'], [
+            {'status': 'success', 'query': '192.0.2.1', 'city': 'Amsterdam', 'as': 'AS64500 Example'},
+            {'status': 'fail', 'message': 'reserved range', 'query': '198.51.100.1'},
+        ])
+        self.assertEqual((results['192.0.2.1']['city'], results['192.0.2.1']['asn']), ('Amsterdam', 'AS64500 Example'))
+        self.assertIsNone(results['198.51.100.1'])
+
+        provider.update_limits(batch, 200, {'X-Rl': '0', 'X-Ttl': '20'})
+        self.assertIsNone(provider.batch_limiter.reserve(max_wait=5))
+        self.assertEqual(provider.limiter.reserve(max_wait=5), 0.0)
+        provider.update_limits(single, 429, {'X-Ttl': '40'})
+        self.assertIsNone(provider.limiter.reserve(max_wait=30))
+
+    def test_incomplete_provider_rejected(self):
+        """Adapters must implement both build_request and parse"""
+        class RequestOnlyProvider(GeoProvider):
+            name = 'request-only'
+
+            def build_request(self, ips):
+                return ProviderRequest('GET', f'{self.base_url}/{ips[0]}', self.limiter)
+
+        with self.assertRaises(TypeError):
+            RequestOnlyProvider()
+
+    def test_concurrent_lookups_share_batch_requests(self):
+        """Lookups are coalesced into batches; batch misses fall through to the next provider"""
+        service = _StubGeolocationService(
+            max_workers=2,
+            mmdb_provider=MMDBGeolocationProvider(city_path='', asn_path=''),
+            range_cache=PrefixRangeCache(ttl=60),
+            providers=[_StubGeoProvider('batched', batch_size=3, misses={'100.65.4.1'}),
+                       _StubGeoProvider('single')],
+        )
+        ips = [f'100.65.{i}.1' for i in range(5)]
+        try:
+            results = asyncio.run(service.get_locations_batch_async(ips, batch_size=5))
+        finally:
+            service.executor.shutdown()
+
+        batched = [batch for name, batch in service.calls if name == 'batched']
+        self.assertEqual(sorted(len(batch) for batch in batched), [2, 3])
+        self.assertEqual(sorted(ip for batch in batched for ip in batch), ips)
+        self.assertEqual([call for call in service.calls if call[0] == 'single'], [('single', ['100.65.4.1'])])
+        self.assertEqual(results['100.65.4.1']['provider'], 'single')
+        self.assertEqual(results['100.65.0.1']['provider'], 'batched')
+
+
+class GeoHTTPClientTestCase(SimpleTestCase):
+    """Test case for the pooled async HTTP client used by the geolocation providers"""
+
+    def test_provider_calls_reuse_pooled_connection(self):
+        """Single and batch ip-api.com calls share one keep-alive connection and sync quotas from headers"""
+        if not AIOHTTP_AVAILABLE:
+            self.skipTest('aiohttp is not installed')
+        connections, calls = [], []
+
+        async def handler(reader, writer):
+            connections.append(1)
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    break
+                request_line, *header_lines = head.decode().split('\r\n')
+                headers = {k.lower(): v for k, v in (line.split(': ', 1) for line in header_lines if line)}
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                method, path = request_line.split(' ')[0], request_line.split(' ')[1].split('?')[0]
+                calls.append((method, path))
+                if path == '/batch':
+                    records = [{'status': 'success', 'query': ip, 'city': 'Batchville'} for ip in json.loads(body)]
+                    limits = b'X-Rl: 0\r\nX-Ttl: 60\r\n'
+                else:
+                    records = {'status': 'success', 'query': path.rsplit('/', 1)[1], 'city': 'Singleton'}
+                    limits = b'X-Rl: 44\r\nX-Ttl: 60\r\n'
+                payload = json.dumps(records).encode()
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n' + limits +
+                    b'Content-Length: %d\r\n\r\n' % len(payload) + payload
+                )
+                await writer.drain()
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handler, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            provider = IPAPIProvider(base_url=f'http://127.0.0.1:{port}')
+            service = GeolocationService(
+                max_workers=1,
+                mmdb_provider=MMDBGeolocationProvider(city_path='', asn_path=''),
+                range_cache=PrefixRangeCache(ttl=60),
+                providers=[provider],
+                http_client=GeoHTTPClient(timeout=5),
+            )
+            async with server:
+                try:
+                    singles = [await service.get_location_async(ip) for ip in ('100.66.1.1', '100.66.2.1')]
+                    batch = await service.get_locations_batch_async([f'100.67.{i}.1' for i in range(5)])
+                finally:
+                    await service.close()
+                    service.executor.shutdown()
+            return provider, singles, batch
+
+        provider, singles, batch = asyncio.run(run())
+
+        self.assertEqual(len(connections), 1)
+        self.assertEqual(calls, [('GET', '/json/100.66.1.1'), ('GET', '/json/100.66.2.1'), ('POST', '/batch')])
+        self.assertEqual([data['city'] for data in singles], ['Singleton', 'Singleton'])
+        self.assertEqual({data['city'] for data in batch.values()}, {'Batchville'})
+        self.assertEqual(len(batch), 5)
+        self.assertEqual(provider.limiter.tokens, 44)
+        self.assertIsNone(provider.batch_limiter.reserve(max_wait=1))
+
+
+class ProviderHealthTestCase(SimpleTestCase):
+    """Test case for geolocation provider circuit breakers and ordering"""
+
+    def test_breaker_opens_and_probes(self):
+        """Failures open the circuit; one half-open probe is allowed after the cool-down"""
+        now = [0.0]
+        health = ProviderHealth('stub', failure_threshold=2, recovery_timeout=30, clock=lambda: now[0])
+        health.record(True, 0.2)
+        health.record(False, 10.0)
+        health.record(False, 10.0)
+
+        self.assertEqual(health.state, CircuitBreaker.OPEN)
+        self.assertFalse(health.allow())
+        self.assertAlmostEqual(health.success_rate, 1 / 3)
+        self.assertEqual(health.p50_latency, 0.2)
+
+        now[0] = 30.0
+        self.assertTrue(health.allow())
+        self.assertFalse(health.allow())
+        # A probe that was never sent frees the slot again
+        health.release()
+        self.assertTrue(health.allow())
+        health.record(True, 0.1)
+        self.assertEqual(health.state, CircuitBreaker.CLOSED)
+
+    def test_lookups_skip_open_circuits_and_prefer_fast_providers(self):
+        """A fast provider that starts failing is tried until its circuit opens, then skipped"""
+        service = _StubGeolocationService(
+            max_workers=2,
+            mmdb_provider=MMDBGeolocationProvider(city_path='', asn_path=''),
+            range_cache=PrefixRangeCache(ttl=60),
+            providers=[_StubGeoProvider('flaky'), _StubGeoProvider('steady')],
+        )
+        service.health['flaky'] = ProviderHealth('flaky', failure_threshold=2, recovery_timeout=60)
+        for _ in range(10):
+            service.health['flaky'].record(True, 0.001)
+        service.failing.add('flaky')
+        service.delays['steady'] = 0.05
+
+        async def run():
+            return [await service.get_location_async(f'100.68.{i}.1') for i in range(4)]
+
+        try:
+            results = asyncio.run(run())
+        finally:
+            service.executor.shutdown()
+
+        self.assertEqual([data['provider'] for data in results], ['steady'] * 4)
+        self.assertEqual([name for name, _ in service.calls].count('flaky'), 2)
+        self.assertEqual([h['provider'] for h in service.provider_health()], ['steady', 'flaky'])
+        self.assertEqual(service.provider_health()[1]['state'], CircuitBreaker.OPEN)
+
+        # A batch endpoint's per-address cost can beat a faster single-address provider
+        ordered = GeolocationService(providers=[_StubGeoProvider('slow'), _StubGeoProvider('fast'),
+                                                _StubGeoProvider('batched', batch_size=100)], max_workers=1)
+        ordered.executor.shutdown()
+        ordered._get_health(ordered.providers[0]).record(True, 0.5)
+        ordered._get_health(ordered.providers[1]).record(True, 0.05)
+        ordered._get_health(ordered.providers[2]).record(True, 1.0, addresses=100)
+        self.assertEqual([p.name for p in ordered.ordered_providers()], ['batched', 'fast', 'slow'])
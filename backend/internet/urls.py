@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     ScanViewSet, HostViewSet, DomainViewSet, PortViewSet, ProxyViewSet, 
-    DNSRelayViewSet, UniversalSearchView, CreateScanView, HealthCheckView, scanner_metrics
+    DNSRelayViewSet, ServiceDetectionViewSet, UniversalSearchView, CreateScanView, HealthCheckView, scanner_metrics
 )
 
 router = DefaultRouter()
@@ -12,6 +12,7 @@ router.register(r'domains', DomainViewSet, basename='domains')
 router.register(r'ports', PortViewSet, basename='ports')
 router.register(r'proxies', ProxyViewSet, basename='proxies')
 router.register(r'dnsrelays', DNSRelayViewSet, basename='dnsrelays')
+router.register(r'service-detections', ServiceDetectionViewSet, basename='service-detections')
 
 urlpatterns = [
     path('health/', HealthCheckView.as_view(), name='health'),
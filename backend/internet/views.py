@@ -10,10 +10,10 @@ from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
-from .models import Scan, Host, Domain, Port, Proxy, DNSRelay
+from .models import Scan, Host, Domain, Port, Proxy, DNSRelay, ServiceDetection
 from .serializers import (
     ScanSerializer, HostSerializer, DomainSerializer, PortSerializer, 
-    ProxySerializer, DNSRelaySerializer
+    ProxySerializer, DNSRelaySerializer, ServiceDetectionSerializer
 )
 # from .lib.search import UniversalSearch
 import logging
@@ -39,7 +39,7 @@ class ScanViewSet(viewsets.ModelViewSet):
 
 
 class HostViewSet(viewsets.ModelViewSet):
-    queryset = Host.objects.all()
+    queryset = Host.objects.prefetch_related('ports__banner_ref')
     serializer_class = HostSerializer
 
 
@@ -49,7 +49,7 @@ class DomainViewSet(viewsets.ModelViewSet):
 
 
 class PortViewSet(viewsets.ModelViewSet):
-    queryset = Port.objects.all()
+    queryset = Port.objects.select_related('banner_ref')
     serializer_class = PortSerializer
 
 
@@ -63,6 +63,21 @@ class DNSRelayViewSet(viewsets.ModelViewSet):
     serializer_class = DNSRelaySerializer
 
 
+class ServiceDetectionViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = ServiceDetection.objects.select_related('port__host').order_by('id')
+    serializer_class = ServiceDetectionSerializer
+    # Product and version are stored lowercased, so exact lookups stay on the index
+    filterset_fields = {
+        'service_type': ['exact', 'in'],
+        'product': ['exact', 'in'],
+        'version': ['exact', 'startswith'],
+        'confidence': ['gte'],
+        'signature_version': ['exact', 'lt'],
+        'port__port_number': ['exact'],
+        'port__host__country_code': ['exact'],
+    }
+
+
 class UniversalSearchView(APIView):
     def get(self, request):
         from django.core.paginator import Paginator
@@ -75,13 +90,16 @@ class UniversalSearchView(APIView):
         if not query:
             return Response({'error': 'Query parameter "q" is required'}, status=400)
         
-        # Search hosts by IP address, domain names, port numbers, or banners
+        # Search hosts by IP address, domain names, port numbers, banners, or detected service/product
         hosts = Host.objects.filter(
             Q(ip__icontains=query) | 
             Q(domains__name__icontains=query) |
             Q(ports__port_number__icontains=query) |
-            Q(ports__banner__icontains=query)
-        ).distinct().prefetch_related('ports', 'domains', 'ssl_certificates')
+            Q(ports__banner_ref__text__icontains=query) |
+            Q(ports__banner__icontains=query) |
+            Q(ports__service_detections__service_type=query.lower()) |
+            Q(ports__service_detections__product=query.lower())
+        ).distinct().prefetch_related('ports__banner_ref', 'domains', 'ssl_certificates')
         
         # Paginate results
         paginator = Paginator(hosts, page_size)
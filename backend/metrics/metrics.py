@@ -174,6 +174,43 @@ redis_operations_total = Counter(
     registry=django_registry
 )
 
+# Geolocation Provider Metrics
+geolocation_provider_requests_total = Counter(
+    'django_geolocation_provider_requests_total',
+    'Total number of geolocation provider calls',
+    ['provider', 'outcome'],
+    registry=django_registry
+)
+
+geolocation_provider_latency_seconds = Histogram(
+    'django_geolocation_provider_latency_seconds',
+    'Geolocation provider call duration in seconds',
+    ['provider'],
+    buckets=[0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0],
+    registry=django_registry
+)
+
+geolocation_provider_circuit_state = Gauge(
+    'django_geolocation_provider_circuit_state',
+    'Geolocation provider circuit breaker state (0 closed, 1 half-open, 2 open)',
+    ['provider'],
+    registry=django_registry
+)
+
+geolocation_provider_success_rate = Gauge(
+    'django_geolocation_provider_success_rate',
+    'Share of recent geolocation provider calls that succeeded',
+    ['provider'],
+    registry=django_registry
+)
+
+geolocation_provider_p50_latency_seconds = Gauge(
+    'django_geolocation_provider_p50_latency_seconds',
+    'Median latency of recent successful geolocation provider calls',
+    ['provider'],
+    registry=django_registry
+)
+
 # Initialize app info metric
 def init_app_info():
     """Initialize application information metrics"""
@@ -401,6 +438,11 @@ __all__ = [
     'celery_task_duration_seconds',
     'redis_connections_active',
     'redis_operations_total',
+    'geolocation_provider_requests_total',
+    'geolocation_provider_latency_seconds',
+    'geolocation_provider_circuit_state',
+    'geolocation_provider_success_rate',
+    'geolocation_provider_p50_latency_seconds',
     'MetricsMiddleware',
     'DatabaseMetricsMiddleware',
     'get_metrics',